@@ -0,0 +1,544 @@
+""" Local stand-in for a FireMon server implementing the endpoints of application.properties """
+import argparse
+import json
+import os
+import random
+import re
+import string
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from security_manager_apis.endpoints import EndpointRegistry  # noqa: E402
+
+# HTTP method of every endpoint that is not a GET
+METHODS = {
+    'rulerec_api_url': 'POST', 'pca_api_url': 'POST', 'create_pp_tkt_api_url': 'POST', 'authentication_api_url': 'POST',
+    'logout_api_url': 'POST', 'assign_pp_tkt_api_url': 'PUT', 'unassign_pp_tkt_api_url': 'PUT', 'update_pp_tkt_api_url': 'PUT',
+    'add_req_pp_tkt_api_url': 'POST', 'replace_req_pp_tkt_api_url': 'POST', 'stage_att_pp_tkt_api': 'POST',
+    'post_att_pp_tkt_api': 'PUT', 'update_att_pp_tkt_api': 'PUT', 'comp_task_pp_tkt_api': 'PUT', 'run_pca_pp_tkt_api': 'POST',
+    'del_recs_pp_tkt_api': 'DELETE', 'add_comment_pp_tkt_api': 'POST', 'del_comment_pp_tkt_api': 'DELETE',
+    'app_req_pp_tkt_api': 'PUT', 'parse_csv_pp_tkt_api': 'POST', 'add_change_pp_tkt_api': 'POST', 'update_pp_tkt_change': 'PUT',
+    'man_ret_dev_sm_api': 'POST', 'supp_route_sm_api': 'POST', 'update_rule_doc': 'PUT', 'create_device_group': 'POST',
+    'add_device_to_group': 'POST', 'assign_to_user_group': 'POST', 'create_po_ticket': 'POST', 'assign_po_ticket': 'PUT',
+    'complete_po_ticket': 'PUT',
+}
+
+# Stages every mock ticket moves through, completing the last one closes the ticket
+STAGES = ('Requirements', 'Design', 'Review', 'Implementation', 'Verification')
+
+
+class MockConfig:
+
+    def __init__(self, latency=0.0, jitter=0.0, payload_size=64, total_records=1000, devices=50, error_rate=0.0, error_status=503,
+                 retry_after=None, token_ttl=None, workflows=('Access Request', 'Rule Review'), pca_polls=0):
+        """
+        :param latency: Seconds added to every response, defaulted to 0
+        :param jitter: Up to this many seconds are added at random on top of latency, defaulted to 0
+        :param payload_size: Bytes of padding in every SIQL record, defaulted to 64
+        :param total_records: Number of records every SIQL search matches, defaulted to 1000
+        :param devices: Number of devices, defaulted to 50
+        :param error_rate: Share of requests, other than login, answered with error_status, defaulted to 0
+        :param error_status: Status code of injected errors, defaulted to 503
+        :param retry_after: Retry-After seconds sent with injected errors, defaulted to None
+        :param token_ttl: Seconds a token is accepted, defaulted to None which never expires tokens
+        :param workflows: Names of the workflows of Policy Planner and Policy Optimizer
+        :param pca_polls: Number of PCA result polls answered as still running, defaulted to 0
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.payload_size = payload_size
+        self.total_records = total_records
+        self.devices = devices
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.token_ttl = token_ttl
+        self.workflows = tuple(workflows)
+        self.pca_polls = pca_polls
+
+
+def _compile_routes(registry: EndpointRegistry) -> list:
+    """
+    Turning every endpoint template into a regular expression over the URL path
+    :return: List of method, compiled pattern and properties key
+    """
+    routes = []
+    for key in registry:
+        endpoint = registry[key]
+        names = iter(endpoint.params)
+        pattern = ''
+        for literal, field, _, _ in string.Formatter().parse(endpoint.template):
+            if '?' in literal:
+                pattern += re.escape(literal.split('?', 1)[0])
+                break
+            pattern += re.escape(literal)
+            if field is None:
+                continue
+            name = next(names)
+            if name != 'host':
+                pattern += f'(?P<{name}>[^/]+)'
+        routes.append((METHODS.get(key, 'GET'), re.compile(pattern + '$'), key))
+    # Longer templates first so literal segments win over fields
+    routes.sort(key=lambda r: -len(r[1].pattern))
+    return routes
+
+
+def _multipart_file(body: bytes) -> tuple:
+    """
+    File name and content of the first part of a multipart/form-data body, the boundary is read from the body
+    since clients may send the content type without it
+    """
+    if not body.startswith(b'--'):
+        return None, body
+    boundary = body.split(b'\r\n', 1)[0]
+    part = body[len(boundary) + 2:].split(b'\r\n' + boundary, 1)[0]
+    head, _, content = part.partition(b'\r\n\r\n')
+    match = re.search(rb'filename="([^"]*)"', head)
+    return (match.group(1).decode() if match else None), content
+
+
+class MockFireMonServer(ThreadingHTTPServer):
+    """ Threaded HTTP server keeping tickets, requirements and tokens in memory """
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, config=None, registry=None):
+        super().__init__((host, port), _Handler)
+        self.config = config or MockConfig()
+        self.routes = _compile_routes(registry or EndpointRegistry())
+        self.lock = threading.Lock()
+        self.tokens = {}
+        self.tickets = {}
+        self.files = {}
+        self.next_id = 1
+        self.request_counts = {}
+        self.logins = 0
+        self.connections = 0
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def start(self) -> str:
+        """
+        Method to serve from a background thread
+        :return: Base URL of the server
+        """
+        self._thread = threading.Thread(target=self.serve_forever, name='mock-firemon', daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def new_id(self) -> int:
+        with self.lock:
+            self.next_id += 1
+            return self.next_id
+
+    def count(self, key: str):
+        with self.lock:
+            self.request_counts[key] = self.request_counts.get(key, 0) + 1
+
+
+def _ticket_json(ticket: dict) -> dict:
+    tasks = []
+    for i, name in enumerate(STAGES[:ticket['stage'] + 1]):
+        task = {'id': ticket['id'] * 100 + i, 'workflowTask': {'id': 1000 + i, 'name': name}}
+        if i < ticket['stage'] or ticket['closed']:
+            task['completed'] = True
+        tasks.append(task)
+    status = 'Closed' if ticket['closed'] else STAGES[ticket['stage']]
+    result = dict(ticket['body'])
+    result.update({'id': ticket['id'], 'status': status, 'workflowPacketTasks': tasks})
+    if ticket.get('assignee'):
+        result['assignee'] = ticket['assignee']
+    return result
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: MockFireMonServer
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def _reply(self, status: int, body=None, headers=None):
+        raw = isinstance(body, bytes)
+        data = body if raw else b'' if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream' if raw else 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if self.close_connection:
+            # Without it the client pools the connection and its next request finds the socket closed
+            self.send_header('Connection', 'close')
+        # One write for headers and body, a separate small body write stalls on Nagle and delayed ACKs
+        self._headers_buffer.append(b'\r\n')
+        self.wfile.write(b''.join(self._headers_buffer) + data)
+        self._headers_buffer = []
+
+    def _body(self):
+        if 'chunked' in (self.headers.get('Transfer-Encoding') or '').lower():
+            parts = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                parts.append(self.rfile.read(size))
+                self.rfile.readline()
+            raw = b''.join(parts)
+        else:
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length) if length else b''
+        if raw and 'json' in (self.headers.get('Content-Type') or '').lower():
+            try:
+                return json.loads(raw)
+            except ValueError:
+                return raw
+        return raw
+
+    def _route(self, path: str):
+        for method, pattern, key in self.server.routes:
+            if method != self.command:
+                continue
+            match = pattern.match(path)
+            if match:
+                return key, match.groupdict()
+        return None, None
+
+    def _handle(self):
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        body = self._body()
+        key, fields = self._route(url.path)
+        config = self.server.config
+        delay = config.latency + (random.uniform(0, config.jitter) if config.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        if key is None:
+            return self._reply(404, {'message': f'No mock endpoint for {self.command} {url.path}'})
+        self.server.count(key)
+        if key == 'authentication_api_url':
+            token = uuid.uuid4().hex
+            with self.server.lock:
+                self.server.tokens[token] = time.monotonic()
+                self.server.logins += 1
+            return self._reply(200, {'token': token})
+        issued = self.server.tokens.get(self.headers.get('X-FM-Auth-Token'))
+        if issued is None or (config.token_ttl is not None and time.monotonic() - issued > config.token_ttl):
+            return self._reply(401, {'message': 'Authentication required'})
+        if config.error_rate and random.random() < config.error_rate:
+            headers = {'Retry-After': str(config.retry_after)} if config.retry_after is not None else None
+            return self._reply(config.error_status, {'message': 'Injected error'}, headers)
+        handler = getattr(self, 'do_' + key, None)
+        if handler is None:
+            return self._reply(200, {})
+        status, result, *headers = handler(fields, query, body)
+        return self._reply(status, result, *headers)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+    def _ticket(self, fields):
+        return self.server.tickets.get(int(fields['packet_id']))
+
+    def _staged_ticket(self, fields):
+        """
+        Ticket of the request, or None when the workflow task in the URL is not the current stage
+        """
+        ticket = self._ticket(fields)
+        if ticket is None or ticket['closed'] or int(fields['task_id']) != 1000 + ticket['stage']:
+            return None
+        return ticket
+
+    def _paged(self, query, make_record):
+        config = self.server.config
+        page_size = int(query.get('pageSize', 20))
+        page = int(query.get('page', 0))
+        start = page * page_size
+        results = [make_record(i) for i in range(start, min(config.total_records, start + page_size))]
+        return 200, {'total': config.total_records, 'page': page, 'pageSize': page_size, 'count': len(results), 'results': results}
+
+    def _siql(self, fields, query, body):
+        pad = 'x' * self.server.config.payload_size
+        return self._paged(query, lambda i: {'id': i, 'name': f'record-{i}', 'description': pad})
+
+    do_siql_query_sm_api = do_siql_query_pp_tkt_api = do_siql_query_po = _siql
+
+    def do_logout_api_url(self, fields, query, body):
+        with self.server.lock:
+            self.server.tokens.pop(self.headers.get('X-FM-Auth-Token'), None)
+        return 200, None
+
+    # Security Manager
+
+    def do_get_dev_sm_api(self, fields, query, body):
+        devices = [self._device(i) for i in range(1, self.server.config.devices + 1)]
+        page_size = int(query.get('pageSize', len(devices)))
+        return 200, {'total': len(devices), 'count': min(page_size, len(devices)), 'results': devices[:page_size]}
+
+    @staticmethod
+    def _device(device_id: int) -> dict:
+        return {'id': device_id, 'name': f'FW-{device_id:04d}', 'managementIp': f'10.{device_id // 250}.{device_id % 250}.1',
+                'devicePack': {'vendor': 'Palo Alto Networks' if device_id % 2 else 'Cisco', 'deviceName': 'Firewall'},
+                'deviceGroups': [{'id': 1 + device_id % 3, 'name': f'group-{1 + device_id % 3}'}]}
+
+    def do_dev_obj_sm_api(self, fields, query, body):
+        return 200, self._device(int(fields['device_id']))
+
+    def do_fw_obj_sm_api(self, fields, query, body):
+        return 200, {'id': fields['id'], 'type': fields['object_type'], 'deviceId': int(fields['device_id']),
+                     'name': f"{fields['object_type'].lower()}-{fields['id']}", 'addresses': [{'address': '10.0.0.0/24'}]}
+
+    def do_zone_search_sm_api(self, fields, query, body):
+        return 200, {'total': 2, 'results': [{'id': 1, 'name': 'inside'}, {'id': 2, 'name': 'outside'}]}
+
+    def do_get_device_group_name(self, fields, query, body):
+        return 200, {'id': 1, 'name': fields['name']}
+
+    def do_create_device_group(self, fields, query, body):
+        return 200, {'id': self.server.new_id(), 'name': body.get('name') if isinstance(body, dict) else None}
+
+    def do_user_by_username(self, fields, query, body):
+        return 200, {'total': 1, 'results': [{'id': 1, 'username': query.get('search', 'user')}]}
+
+    do_get_all_users = do_user_by_username
+
+    def do_supp_route_sm_api(self, fields, query, body):
+        return 200, body if isinstance(body, dict) else {}
+
+    # Policy Planner
+
+    def do_find_all_workflows_url(self, fields, query, body):
+        workflows = [{'workflow': {'id': i, 'name': name}} for i, name in enumerate(self.server.config.workflows, start=1)]
+        return 200, {'total': len(workflows), 'results': workflows}
+
+    do_find_all_po_workflows_url = do_find_all_workflows_url
+
+    def _create_ticket(self, body):
+        ticket = {'id': self.server.new_id(), 'stage': 0, 'closed': False, 'body': body if isinstance(body, dict) else {},
+                  'requirements': {}, 'changes': {}, 'attachments': {}, 'comments': {}, 'pca_polls': 0}
+        with self.server.lock:
+            self.server.tickets[ticket['id']] = ticket
+        return ticket
+
+    def do_create_pp_tkt_api_url(self, fields, query, body):
+        return 200, _ticket_json(self._create_ticket(body))
+
+    def do_pull_pp_tkt_api_url(self, fields, query, body):
+        ticket = self._ticket(fields)
+        return (200, _ticket_json(ticket)) if ticket else (404, {'message': 'Ticket not found'})
+
+    def do_update_pp_tkt_api_url(self, fields, query, body):
+        ticket = self._ticket(fields)
+        if ticket is None:
+            return 404, {'message': 'Ticket not found'}
+        if isinstance(body, dict):
+            ticket['body'].update(body)
+        return 200, _ticket_json(ticket)
+
+    def do_assign_pp_tkt_api_url(self, fields, query, body):
+        ticket = self._staged_ticket(fields)
+        if ticket is None:
+            return 404, {'message': 'Task is not the current stage'}
+        ticket['assignee'] = {'id': body.decode() if isinstance(body, bytes) else body}
+        return 200, {}
+
+    def do_unassign_pp_tkt_api_url(self, fields, query, body):
+        ticket = self._staged_ticket(fields)
+        if ticket is None:
+            return 404, {'message': 'Task is not the current stage'}
+        ticket.pop('assignee', None)
+        return 200, {}
+
+    do_assign_po_ticket = do_assign_pp_tkt_api_url
+
+    def do_comp_task_pp_tkt_api(self, fields, query, body):
+        ticket = self._staged_ticket(fields)
+        if ticket is None:
+            return 404, {'message': 'Task is not the current stage'}
+        if ticket['stage'] + 1 < len(STAGES):
+            ticket['stage'] += 1
+        else:
+            ticket['closed'] = True
+        return 200, _ticket_json(ticket)
+
+    do_complete_po_ticket = do_comp_task_pp_tkt_api
+
+    def do_add_req_pp_tkt_api_url(self, fields, query, body):
+        ticket = self._staged_ticket(fields)
+        if ticket is None:
+            return 404, {'message': 'Task is not the current stage'}
+        for req in (body or {}).get('requirements', []):
+            req_id = self.server.new_id()
+            ticket['requirements'][req_id] = dict(req, id=req_id)
+        return 200, {'results': list(ticket['requirements'].values())}
+
+    def do_replace_req_pp_tkt_api_url(self, fields, query, body):
+        ticket = self._staged_ticket(fields)
+        if ticket is not None:
+            ticket['requirements'].clear()
+        return self.do_add_req_pp_tkt_api_url(fields, query, body)
+
+    def do_get_recs_pp_tkt_api(self, fields, query, body):
+        ticket = self._staged_ticket(fields)
+        if ticket is None:
+            return 404, {'message': 'Task is not the current stage'}
+        return 200, {'total': len(ticket['requirements']), 'results': list(ticket['requirements'].values())}
+
+    def do_del_recs_pp_tkt_api(self, fields, query, body):
+        ticket = self._staged_ticket(fields)
+        if ticket is None or ticket['requirements'].pop(int(fields['requirement_id']), None) is None:
+            return 404, {'message': 'Requirement not found'}
+        return 200, None
+
+    def do_add_change_pp_tkt_api(self, fields, query, body):
+        ticket = self._staged_ticket(fields)
+        if ticket is None:
+            return 404, {'message': 'Task is not the current stage'}
+        change_id = self.server.new_id()
+        ticket['changes'][change_id] = dict(body if isinstance(body, dict) else {}, id=change_id, requirementId=int(fields['requirement_id']))
+        return 200, [ticket['changes'][change_id]]
+
+    def do_get_pp_tkt_changes(self, fields, query, body):
+        ticket = self._staged_ticket(fields)
+        if ticket is None:
+            return 404, {'message': 'Task is not the current stage'}
+        return 200, {'total': len(ticket['changes']), 'results': list(ticket['changes'].values())}
+
+    def do_stage_att_pp_tkt_api(self, fields, query, body):
+        file_name, content = _multipart_file(body if isinstance(body, bytes) else b'')
+        file_id = uuid.uuid4().hex
+        with self.server.lock:
+            self.server.files[file_id] = content
+        return 200, {'attachments': [{'fileId': file_id, 'fileName': file_name, 'size': len(content)}]}
+
+    def do_post_att_pp_tkt_api(self, fields, query, body):
+        ticket = self._ticket(fields)
+        if ticket is None:
+            return 404, {'message': 'Ticket not found'}
+        posted = []
+        for staged in (body.get('attachments') if isinstance(body, dict) else None) or [{}]:
+            attachment_id = self.server.new_id()
+            ticket['attachments'][attachment_id] = dict(staged, id=attachment_id, name=staged.get('fileName'))
+            posted.append(ticket['attachments'][attachment_id])
+        return 200, posted[0]
+
+    def do_download_attachment_pp_tkt_api(self, fields, query, body):
+        ticket = self._ticket(fields)
+        attachment = ticket['attachments'].get(int(fields['attachment_id'])) if ticket else None
+        if attachment is None:
+            return 404, {'message': 'Attachment not found'}
+        content = self.server.files.get(attachment.get('fileId'), b'')
+        match = re.match(r'bytes=(\d+)-$', self.headers.get('Range') or '')
+        if match is None:
+            return 200, content
+        start = int(match.group(1))
+        if start >= len(content):
+            return 416, None, {'Content-Range': f'bytes */{len(content)}'}
+        return 206, content[start:], {'Content-Range': f'bytes {start}-{len(content) - 1}/{len(content)}'}
+
+    def do_get_attachments_pp_tkt_api(self, fields, query, body):
+        ticket = self._ticket(fields)
+        if ticket is None:
+            return 404, {'message': 'Ticket not found'}
+        return 200, {'total': len(ticket['attachments']), 'results': list(ticket['attachments'].values())}
+
+    def do_parse_csv_pp_tkt_api(self, fields, query, body):
+        # One requirement per row after the header
+        _, content = _multipart_file(body if isinstance(body, bytes) else b'')
+        rows = [row for row in content.splitlines()[1:] if row.strip()] or [b'']
+        return 200, {'policyPlanRequirementErrorDTOs': [{'policyPlanRequirementDTO': {'requirementType': 'RULE', 'action': 'ACCEPT', 'row': i}}
+                                                        for i, _ in enumerate(rows)]}
+
+    def do_run_pca_pp_tkt_api(self, fields, query, body):
+        ticket = self._ticket(fields)
+        if ticket is not None:
+            ticket['pca_polls'] = 0
+        return 200, {}
+
+    def do_get_pca_pp_tkt_api(self, fields, query, body):
+        ticket = self._ticket(fields)
+        if ticket is None:
+            return 404, {'message': 'Ticket not found'}
+        ticket['pca_polls'] += 1
+        done = ticket['pca_polls'] > self.server.config.pca_polls
+        return 200, {'status': 'COMPLETED' if done else 'IN_PROGRESS', 'results': [] if done else None}
+
+    def do_add_comment_pp_tkt_api(self, fields, query, body):
+        ticket = self._ticket(fields)
+        if ticket is None:
+            return 404, {'message': 'Ticket not found'}
+        comment_id = self.server.new_id()
+        ticket['comments'][comment_id] = dict(body if isinstance(body, dict) else {}, id=comment_id)
+        return 200, ticket['comments'][comment_id]
+
+    def do_get_comments_pp_tkt_api(self, fields, query, body):
+        ticket = self._ticket(fields)
+        if ticket is None:
+            return 404, {'message': 'Ticket not found'}
+        return 200, {'total': len(ticket['comments']), 'results': list(ticket['comments'].values())}
+
+    # Policy Optimizer
+
+    def do_create_po_ticket(self, fields, query, body):
+        return 200, _ticket_json(self._create_ticket(body))
+
+    do_get_po_ticket = do_pull_pp_tkt_api_url
+
+    # Orchestration
+
+    def do_rulerec_api_url(self, fields, query, body):
+        return 200, {'requirement': body, 'changes': [{'deviceId': 1, 'action': 'ADD_RULE'}]}
+
+    def do_pca_api_url(self, fields, query, body):
+        return 200, {'deviceId': int(fields['device_id']), 'controlResults': []}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a local stand-in for a FireMon server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random seconds added on top of latency')
+    parser.add_argument('--payload-size', type=int, default=64, help='Bytes of padding in every SIQL record')
+    parser.add_argument('--total-records', type=int, default=1000, help='Records matched by every SIQL search')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with --error-status')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--retry-after', type=float, default=None)
+    parser.add_argument('--token-ttl', type=float, default=None, help='Seconds a token is accepted')
+    args = parser.parse_args()
+    config = MockConfig(args.latency, args.jitter, args.payload_size, args.total_records, error_rate=args.error_rate,
+                        error_status=args.error_status, retry_after=args.retry_after, token_ttl=args.token_ttl)
+    server = MockFireMonServer(args.host, args.port, config)
+    print(f'Mock FireMon server listening on {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+""" Replays a capture written by TrafficRecorder against a FireMon host, or the local mock server, and prints latency percentiles as JSON """
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import authenticate_user  # noqa: E402
+from mock_firemon import MockConfig, MockFireMonServer  # noqa: E402
+
+
+def replay(host: str, args) -> dict:
+    scheduler = authenticate_user.AdaptiveScheduler(max_limit=args.concurrency) if args.scheduler else None
+    session = authenticate_user.Authentication(host, args.username, args.password, not args.insecure, pool_maxsize=args.concurrency,
+                                               scheduler=scheduler).get_auth_token()
+    try:
+        report = authenticate_user.TrafficReplayer(session, speed=args.speed, concurrency=args.concurrency, timeout=args.timeout).run(args.capture)
+    finally:
+        session.close()
+    return report.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a captured request sequence at a multiple of its recorded speed')
+    parser.add_argument('capture', help='Capture file written by TrafficRecorder.save, .ndjson or .ndjson.gz')
+    parser.add_argument('--host', help='Base URL of the target, defaulted to a local mock server')
+    parser.add_argument('--username', default='firemon')
+    parser.add_argument('--password', default=os.environ.get('FIREMON_PASSWORD', 'firemon'), help='Defaulted to $FIREMON_PASSWORD')
+    parser.add_argument('--insecure', action='store_true', help='Do not verify SSL certificates')
+    parser.add_argument('--speed', type=float, default=1.0, help='Multiple of the recorded rate, 0 replays as fast as concurrency allows')
+    parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at most')
+    parser.add_argument('--timeout', type=float, default=60, help='Seconds to wait for each response')
+    parser.add_argument('--scheduler', action='store_true', help='Send requests through an AdaptiveScheduler')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds the local mock server adds to every response')
+    parser.add_argument('--output', help='File the JSON summary is written to, defaulted to stdout')
+    args = parser.parse_args()
+    if args.host:
+        summary = replay(args.host, args)
+    else:
+        with MockFireMonServer(config=MockConfig(latency=args.latency)) as server:
+            summary = replay(server.url, args)
+    text = json.dumps(summary, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+""" Benchmarks of the client paths against a local mock FireMon server, results are written as JSON """
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import requests  # noqa: E402
+import authenticate_user  # noqa: E402
+from mock_firemon import MockConfig, MockFireMonServer  # noqa: E402
+from security_manager_apis.firemon_client import FireMonClient  # noqa: E402
+
+USERNAME = 'firemon'
+PASSWORD = 'firemon'
+DOMAIN_ID = '1'
+WORKFLOW = 'Access Request'
+
+
+def summarize(samples: list) -> dict:
+    """
+    Method to summarize latency samples
+    :param samples: Seconds per operation
+    :return: Dictionary of count, mean, min, p50, p90, p99 and max in milliseconds
+    """
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {'count': len(samples), 'mean_ms': statistics.fmean(samples) * 1000, 'min_ms': ordered[0] * 1000, 'p50_ms': percentile(50),
+            'p90_ms': percentile(90), 'p99_ms': percentile(99), 'max_ms': ordered[-1] * 1000}
+
+
+def client(url: str, scheduler=False, **kwargs) -> FireMonClient:
+    return FireMonClient(url, USERNAME, PASSWORD, False, DOMAIN_ID, scheduler=authenticate_user.AdaptiveScheduler() if scheduler else None, **kwargs)
+
+
+def bench_login(url: str, iterations: int) -> dict:
+    """ Time of a full login, from building the session to holding a token """
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        session = authenticate_user.Authentication(url, USERNAME, PASSWORD, False, lazy_login=False).get_auth_token()
+        samples.append(time.perf_counter() - started)
+        session.close()
+    return {'latency': summarize(samples), 'logins_per_sec': len(samples) / sum(samples)}
+
+
+def bench_single_call(url: str, iterations: int, scheduler=False) -> dict:
+    """ Latency of get_device_obj compared with the same GET sent on a bare requests.Session """
+    errors = 0
+    with client(url, scheduler) as fm:
+        sm = fm.security_manager()
+        samples = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            try:
+                sm.get_device_obj('1')
+            except requests.exceptions.RequestException:
+                errors += 1
+                continue
+            samples.append(time.perf_counter() - started)
+        token = fm.authentication.token
+    endpoint = f'{url}/securitymanager/api/domain/{DOMAIN_ID}/device/1'
+    raw = []
+    with requests.Session() as session:
+        session.headers.update({'X-FM-Auth-Token': token, 'Accept': 'application/json'})
+        for _ in range(iterations):
+            started = time.perf_counter()
+            resp = session.get(endpoint)
+            if resp.ok:
+                resp.json()
+                raw.append(time.perf_counter() - started)
+    client_latency, raw_latency = summarize(samples), summarize(raw)
+    result = {'client': client_latency, 'raw_requests': raw_latency, 'errors': errors}
+    if samples and raw:
+        result['overhead_us'] = (client_latency['mean_ms'] - raw_latency['mean_ms']) * 1000
+        result['calls_per_sec'] = len(samples) / sum(samples)
+    return result
+
+
+def bench_siql_paging(url: str, page_size: int, scheduler=False) -> dict:
+    """ Records per second of a full SIQL scan, page by page and with background prefetch """
+    results = {}
+    with client(url, scheduler) as fm:
+        sm = fm.security_manager()
+        started = time.perf_counter()
+        records, page = 0, 0
+        while True:
+            batch = sm.siql_query('secrule', 'domain{id=1}', page_size, page)['results']
+            records += len(batch)
+            if len(batch) < page_size:
+                break
+            page += 1
+        elapsed = time.perf_counter() - started
+        results['sequential'] = {'records': records, 'seconds': elapsed, 'records_per_sec': records / elapsed}
+        for prefetch in (1, 4):
+            started = time.perf_counter()
+            records = sum(1 for _ in sm.iter_siql('secrule', 'domain{id=1}', page_size, prefetch=prefetch))
+            elapsed = time.perf_counter() - started
+            results[f'prefetch_{prefetch}'] = {'records': records, 'seconds': elapsed, 'records_per_sec': records / elapsed}
+    return results
+
+
+def route_file(rows: int) -> io.StringIO:
+    lines = ['deviceId,interfaceName,destination,gateway,virtualRouter,nextVirtualRouter,metric,drop']
+    for i in range(rows):
+        lines.append(f'{1 + i % 10},port1,10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256},10.0.0.1,,,1,false')
+    return io.StringIO('\n'.join(lines) + '\n')
+
+
+def bench_bulk_supp_route(url: str, rows: int, workers: int, scheduler=False) -> dict:
+    """ Rows per second of bulk_add_supp_route """
+    with client(url, scheduler, pool_maxsize=workers) as fm:
+        report = fm.security_manager().bulk_add_supp_route(route_file(rows), workers=workers)
+    return {'rows': len(report.results), 'succeeded': report.succeeded, 'failed': len(report.failed), 'seconds': report.elapsed,
+            'rows_per_sec': report.rows_per_sec, 'workers': workers}
+
+
+def bench_ticket_workflow(url: str, tickets: int, scheduler=False) -> dict:
+    """ Latency of a Policy Planner ticket going through create, add requirement, submit and pull """
+    samples = []
+    errors = 0
+    requirement = {'requirements': [{'requirementType': 'RULE', 'action': 'ACCEPT', 'destinations': ['10.0.0.1'],
+                                     'services': ['tcp/443'], 'sources': ['10.1.0.0/24']}]}
+    with client(url, scheduler) as fm:
+        pp = fm.policy_planner(WORKFLOW)
+        for i in range(tickets):
+            started = time.perf_counter()
+            try:
+                ticket = pp.create_pp_ticket({'variables': {'summary': f'Benchmark ticket {i}'}})
+                ticket_id = str(ticket['id'])
+                pp.add_req_pp_ticket(ticket_id, requirement, ticket=ticket)
+                pp.complete_task_pp_ticket(ticket_id, 'submit')
+                pp.pull_pp_ticket(ticket_id)
+            except requests.exceptions.RequestException:
+                errors += 1
+                continue
+            samples.append(time.perf_counter() - started)
+    return {'latency': summarize(samples), 'errors': errors}
+
+
+BENCHMARKS = ('login', 'single_call', 'siql_paging', 'bulk_supp_route', 'ticket_workflow')
+
+
+def run(args) -> dict:
+    config = MockConfig(latency=args.latency, jitter=args.jitter, payload_size=args.payload_size, total_records=args.total_records,
+                        error_rate=args.error_rate, retry_after=args.retry_after)
+    results = {}
+    with MockFireMonServer(config=config) as server:
+        url = server.url
+        benchmarks = {
+            'login': lambda: bench_login(url, args.iterations),
+            'single_call': lambda: bench_single_call(url, args.iterations, args.scheduler),
+            'siql_paging': lambda: bench_siql_paging(url, args.page_size, args.scheduler),
+            'bulk_supp_route': lambda: bench_bulk_supp_route(url, args.rows, args.workers, args.scheduler),
+            'ticket_workflow': lambda: bench_ticket_workflow(url, args.tickets, args.scheduler),
+        }
+        for name in BENCHMARKS:
+            if args.only and name not in args.only:
+                continue
+            try:
+                results[name] = benchmarks[name]()
+            except requests.exceptions.RequestException as e:
+                # An injected error the benchmark could not absorb ends that benchmark only
+                results[name] = {'error': str(e)}
+        requests_served = dict(server.request_counts)
+    return {
+        'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'python': platform.python_version(),
+                 'platform': platform.platform(), 'requests': requests.__version__},
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results,
+        'requests_served': requests_served,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the FireMon API clients against a local mock server')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds the mock server adds to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random seconds added on top of latency')
+    parser.add_argument('--payload-size', type=int, default=256, help='Bytes of padding in every SIQL record')
+    parser.add_argument('--total-records', type=int, default=5000, help='Records matched by the SIQL scan')
+    parser.add_argument('--page-size', type=int, default=500, help='Page size of the SIQL scan')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 503')
+    parser.add_argument('--retry-after', type=float, default=None, help='Retry-After seconds sent with injected errors')
+    parser.add_argument('--iterations', type=int, default=200, help='Iterations of the login and single call benchmarks')
+    parser.add_argument('--rows', type=int, default=2000, help='Rows of the supplemental route file')
+    parser.add_argument('--workers', type=int, default=8, help='Workers of bulk_add_supp_route')
+    parser.add_argument('--tickets', type=int, default=50, help='Tickets taken through the Policy Planner workflow')
+    parser.add_argument('--scheduler', action='store_true', help='Send requests through an AdaptiveScheduler, retrying injected errors')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, help='Run only these benchmarks')
+    parser.add_argument('--output', help='File the JSON results are written to, defaulted to stdout')
+    args = parser.parse_args()
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+""" Concurrent stress test of one client shared by a pool of worker threads, against the local mock FireMon server.
+Every ticket is checked for requirements, stage IDs and attachments that belong to another thread's ticket """
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import requests  # noqa: E402
+from mock_firemon import MockConfig, MockFireMonServer  # noqa: E402
+from security_manager_apis.firemon_client import FireMonClient  # noqa: E402
+from security_manager_apis.policy_optimizer import PolicyOptimizerApis  # noqa: E402
+from security_manager_apis.policy_planner import PolicyPlannerApis  # noqa: E402
+from run_benchmarks import DOMAIN_ID, PASSWORD, USERNAME, WORKFLOW, summarize  # noqa: E402
+
+PO_WORKFLOW = 'Rule Review'
+
+
+class StressState:
+    """ Counters shared by the worker threads """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = []
+        self.failures = 0
+        self.mismatches = 0
+        self.errors = []
+        self.logouts = 0
+
+    def fail(self, message: str, mismatch=False):
+        with self.lock:
+            if mismatch:
+                self.mismatches += 1
+            else:
+                self.failures += 1
+            if len(self.errors) < 20:
+                self.errors.append(message)
+
+
+def ticket_flow(pp, po, index: int, state: StressState, rng: random.Random):
+    """
+    Taking one ticket through create, submit, requirement, assign, attachment and read back, checking that
+    everything read back belongs to this ticket
+    """
+    marker = f'{threading.current_thread().name}:{index}'
+    ticket = pp.create_pp_ticket({'variables': {'summary': marker}})
+    ticket_id = str(ticket['id'])
+    # Tickets of different threads sit at different stages, so stage IDs leaking between threads are rejected
+    submits = rng.randint(0, 2)
+    for _ in range(submits):
+        pp.complete_task_pp_ticket(ticket_id, 'submit')
+    expected_task_id = str(1000 + submits)
+    pp.add_req_pp_ticket(ticket_id, {'requirements': [{'requirementType': 'RULE', 'action': 'ACCEPT', 'marker': marker}]})
+    if pp.workflow_task_id != expected_task_id:
+        state.fail(f'{marker}: workflow_task_id {pp.workflow_task_id} after add_req, expected {expected_task_id}', True)
+    pp.assign_pp_ticket(ticket_id, '1')
+    pp.add_attachment(ticket_id, f'{index}.txt', io.BytesIO(marker.encode()), 'stress', stream=index % 2 == 0)
+    markers = [r.get('marker') for r in pp.get_reqs(ticket_id)['results']]
+    if markers != [marker]:
+        state.fail(f'{marker}: requirements {markers}', True)
+    if pp.workflow_task_id != expected_task_id:
+        state.fail(f'{marker}: workflow_task_id {pp.workflow_task_id} after get_reqs, expected {expected_task_id}', True)
+    sizes = [a.get('size') for a in pp.pull_pp_ticket_attachments(ticket_id)['results']]
+    if sizes != [len(marker.encode())]:
+        state.fail(f'{marker}: attachment sizes {sizes}', True)
+    if po is not None:
+        po_ticket_id = str(po.create_po_ticket({'variables': {'summary': marker}}).json()['id'])
+        po.assign_po_ticket(po_ticket_id, '1')
+        po.get_po_ticket(po_ticket_id)
+        if po.workflow_task_id != '1000':
+            state.fail(f'{marker}: Policy Optimizer workflow_task_id {po.workflow_task_id}', True)
+
+
+def run_worker(make_clients, iterations, state: StressState, logout_every: int, seed: int):
+    rng = random.Random(seed)
+    pp, po = make_clients()
+    for index in range(iterations):
+        started = time.perf_counter()
+        try:
+            ticket_flow(pp, po, index, state, rng)
+            if logout_every and rng.random() < 1 / logout_every:
+                # Logging out drops the shared token mid-run, every thread has to carry on with a new one
+                pp.logout()
+                with state.lock:
+                    state.logouts += 1
+        except requests.exceptions.RequestException as e:
+            state.fail(f'{type(e).__name__}: {e}')
+            continue
+        with state.lock:
+            state.samples.append(time.perf_counter() - started)
+
+
+def stress(url: str, server: MockFireMonServer, mode: str, workers: int, iterations: int, logout_every: int, with_po: bool, seed=0) -> dict:
+    """
+    Running the ticket flow from many threads
+    :param mode: shared for one client used by every thread, per_thread for a client, login and pool per thread
+    :param seed: Seed of the first worker, the others use the following seeds
+    :return: Dictionary of the outcome
+    """
+    state = StressState()
+    fm = None
+    if mode == 'shared':
+        fm = FireMonClient(url, USERNAME, PASSWORD, False, DOMAIN_ID, pool_maxsize=workers)
+        pp_shared = fm.policy_planner(WORKFLOW)
+        po_shared = fm.policy_optimizer(PO_WORKFLOW) if with_po else None
+        fm.authentication.ensure_token()
+        session_headers = dict(fm.fm_api_session.headers)
+
+        def make_clients():
+            return pp_shared, po_shared
+    else:
+        def make_clients():
+            pp = PolicyPlannerApis(url, USERNAME, PASSWORD, False, DOMAIN_ID, WORKFLOW)
+            po = PolicyOptimizerApis(url, USERNAME, PASSWORD, False, DOMAIN_ID, PO_WORKFLOW) if with_po else None
+            return pp, po
+
+    logins, connections = server.logins, server.connections
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stress') as executor:
+        for future in [executor.submit(run_worker, make_clients, iterations, state, logout_every, seed + i) for i in range(workers)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+    result = {'workers': workers, 'flows': len(state.samples), 'failures': state.failures, 'mismatches': state.mismatches,
+              'logouts': state.logouts, 'logins': server.logins - logins, 'connections_opened': server.connections - connections,
+              'elapsed_s': elapsed, 'flows_per_sec': len(state.samples) / elapsed if elapsed else 0.0, 'latency': summarize(state.samples),
+              'errors': state.errors}
+    if fm is not None:
+        # Only the token may change on the shared session while it is in use
+        changed = {k for k in set(session_headers) | set(fm.fm_api_session.headers)
+                   if k != 'X-FM-Auth-Token' and session_headers.get(k) != fm.fm_api_session.headers.get(k)}
+        result['session_headers_changed'] = sorted(changed)
+        fm.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stress one API client shared by many threads against a local mock server')
+    parser.add_argument('--workers', type=int, default=16, help='Threads sharing the client')
+    parser.add_argument('--iterations', type=int, default=25, help='Ticket flows per thread')
+    parser.add_argument('--latency', type=float, default=0.005, help='Seconds the mock server adds to every response')
+    parser.add_argument('--jitter', type=float, default=0.005, help='Random seconds added on top of latency')
+    parser.add_argument('--token-ttl', type=float, default=1.0, help='Seconds a token is accepted, forcing refreshes under load')
+    parser.add_argument('--logout-every', type=int, default=50, help='On average one flow in this many logs out afterwards, 0 never does')
+    parser.add_argument('--no-po', action='store_true', help='Leave Policy Optimizer out of the flow')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the stages, logouts and mock latency, so a failing run can be repeated')
+    parser.add_argument('--compare', action='store_true', help='Also run with a client per thread, as before sharing was safe')
+    parser.add_argument('--output', help='File the JSON results are written to, defaulted to stdout')
+    args = parser.parse_args()
+    config = MockConfig(latency=args.latency, jitter=args.jitter, token_ttl=args.token_ttl, workflows=(WORKFLOW, PO_WORKFLOW))
+    # Latency and error injection of the mock server draw from the global generator
+    random.seed(args.seed)
+    results = {}
+    with MockFireMonServer(config=config) as server:
+        for mode in ('shared', 'per_thread') if args.compare else ('shared',):
+            results[mode] = stress(server.url, server, mode, args.workers, args.iterations, args.logout_every, not args.no_po, args.seed)
+    text = json.dumps({'config': {k: v for k, v in vars(args).items() if k != 'output'}, 'results': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    shared = results['shared']
+    if shared['failures'] or shared['mismatches'] or shared['session_headers_changed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
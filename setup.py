@@ -9,6 +9,10 @@ VERSION = "1.0.1"
 # prerequisite: setuptools
 # http://pypi.python.org/pypi/setuptools
 REQUIRES = ["requests>=2.20.1"]
+EXTRAS_REQUIRE = {
+    "async": ["httpx>=0.23.0"],
+    "parquet": ["pyarrow>=7.0.0"],
+}
 
 with open("README.md", "r") as fh:
     long_description = fh.read()
@@ -21,6 +25,7 @@ setup(
     url="",
     keywords=["Security Manager APIs"],
     install_requires=REQUIRES,
+    extras_require=EXTRAS_REQUIRE,
     python_requires='>=3.6',
     packages=find_packages(where="src"),
     package_dir={'': 'src'},
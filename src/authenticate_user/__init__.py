@@ -1 +1,6 @@
-from authenticate_user.authentication_api import *
\ No newline at end of file
+from authenticate_user.authentication_api import Authentication, logout_session
+from authenticate_user.async_authentication_api import AsyncAuthentication
+from authenticate_user.token_cache import MemoryTokenCache, FileTokenCache
+from authenticate_user.scheduler import AdaptiveScheduler
+from authenticate_user.metrics import RequestMetrics
+from authenticate_user.traffic_capture import TrafficRecorder, TrafficReplayer
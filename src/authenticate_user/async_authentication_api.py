@@ -0,0 +1,144 @@
+""" This module does asynchronous user authentication """
+import asyncio
+from authenticate_user.authentication_api import headers
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+if httpx is not None:
+    class FireMonAsyncClient(httpx.AsyncClient):
+        """ httpx.AsyncClient that logs in on its first request and replays a request once after refreshing an expired token """
+
+        def __init__(self, authentication, **kwargs):
+            super().__init__(**kwargs)
+            self.authentication = authentication
+
+        async def raw_request(self, method, url, **kwargs):
+            """
+            Method to send a request without logging in or refreshing the token
+            """
+            return await super().send(self.build_request(method, url, **kwargs))
+
+        async def send(self, request, **kwargs):
+            token = await self.authentication.ensure_token()
+            request.headers['X-FM-Auth-Token'] = token
+            resp = await super().send(request, **kwargs)
+            if resp.status_code == 401:
+                await resp.aread()
+                request.headers['X-FM-Auth-Token'] = await self.authentication.refresh_token(token)
+                try:
+                    resp = await super().send(request, **kwargs)
+                except httpx.StreamConsumed:
+                    pass
+            elif resp.is_success and str(request.url) == self.authentication.logout_url:
+                await self.authentication.forget_token()
+            return resp
+
+
+class AsyncAuthentication:
+
+    def __init__(self, host, username, password, verify_ssl, max_connections=10, token_cache=None, lazy_login=True):
+        """
+        Async counterpart of Authentication, backed by an httpx.AsyncClient
+        :param host: Base URL
+        :param username: Username
+        :param password: Password
+        :param verify_ssl: Verify SSL (True or False)
+        :param max_connections: Size of the connection pool, defaulted to 10
+        :param token_cache: MemoryTokenCache or FileTokenCache to reuse tokens across clients, defaulted to None
+        :param lazy_login: Defer logging in until the first API call, defaulted to True
+        """
+        if httpx is None:
+            raise ImportError("Async clients require httpx. Install with: pip install security-manager-apis[async]")
+        self.host = host
+        self.username = username
+        self.password = password
+        self.token_cache = token_cache
+        self.lazy_login = lazy_login
+        self.token = None
+        self._token_lock = None
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.fm_session = FireMonAsyncClient(self, verify=verify_ssl, limits=limits, timeout=None)
+        self.BASE_AUTH_URL = "{}/securitymanager/api/authentication/login"
+        self.logout_url = "{}/securitymanager/api/authentication/logout".format(self.host)
+
+    async def __api_request(self, method: str, endpoint: str, payload=None, parameters=None):
+        resp = await self.fm_session.raw_request(method, endpoint, json=payload, params=parameters, headers=headers)
+        resp.raise_for_status()
+        return resp
+
+    async def __login(self) -> str:
+        payload = {'username': self.username, 'password': self.password}
+        auth_url = self.BASE_AUTH_URL.format(self.host)
+        result = await self.__api_request('POST', auth_url, payload)
+        return result.json().get('token')
+
+    def __set_token(self, token: str):
+        self.token = token
+        self.fm_session.headers.update({
+            'Content-Type': 'applicationjson',
+            'Accept': 'applicationjson',
+            'X-FM-Auth-Token': token,
+        })
+
+    def __lock(self):
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        return self._token_lock
+
+    async def ensure_token(self) -> str:
+        """
+        Method to make sure the client carries a token, taken from the token cache when possible
+        :return: Current token
+        """
+        if self.token is None:
+            async with self.__lock():
+                if self.token is None:
+                    token = self.token_cache.get(self.host, self.username) if self.token_cache is not None else None
+                    if token is None:
+                        token = await self.__login()
+                        if self.token_cache is not None:
+                            self.token_cache.set(self.host, self.username, token)
+                    self.__set_token(token)
+        return self.token
+
+    async def refresh_token(self, stale_token: str) -> str:
+        """
+        Method to log in again after the server rejected a token. Concurrent callers holding the same
+        stale token trigger a single login.
+        :param stale_token: Token that was rejected
+        :return: Current token
+        """
+        async with self.__lock():
+            if self.token == stale_token:
+                token = None
+                if self.token_cache is not None:
+                    self.token_cache.delete(self.host, self.username, stale_token)
+                    token = self.token_cache.get(self.host, self.username)
+                if token is None or token == stale_token:
+                    token = await self.__login()
+                    if self.token_cache is not None:
+                        self.token_cache.set(self.host, self.username, token)
+                self.__set_token(token)
+        return self.token
+
+    async def forget_token(self):
+        """
+        Method to drop the current token after logging out, the next API call logs in again
+        """
+        async with self.__lock():
+            if self.token_cache is not None and self.token is not None:
+                self.token_cache.delete(self.host, self.username, self.token)
+            self.token = None
+
+    async def get_auth_token(self):
+        """
+        Returns the async session, which logs in on its first request, or right away when lazy_login is False
+        :return: httpx.AsyncClient carrying the authentication token
+        """
+        if not self.lazy_login:
+            await self.ensure_token()
+        return self.fm_session
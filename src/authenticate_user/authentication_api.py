@@ -1,5 +1,8 @@
 """ This module does user authentication """
+import functools
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 
 headers = {
     'Accept': 'applicationjson',
@@ -7,38 +10,223 @@ headers = {
 }
 
 
+# Number of times a request rejected with 401 is sent again with a new token
+TOKEN_REPLAYS = 3
+
+
+def _rewind(*bodies) -> bool:
+    """
+    Rewinding file-like request bodies so a request can be sent again
+    :param bodies: data and files arguments of the request
+    :return: True when every body can be replayed
+    """
+    for body in bodies:
+        streams = body.values() if isinstance(body, dict) else [body]
+        for stream in streams:
+            if isinstance(stream, tuple):
+                stream = stream[1]
+            if hasattr(stream, 'read'):
+                if not hasattr(stream, 'seek') or not getattr(stream, 'seekable', lambda: True)():
+                    return False
+                stream.seek(0)
+            elif stream is not None and not isinstance(stream, (str, bytes, int, float, list, tuple, dict)):
+                return False
+    return True
+
+
+def logout_session(session, url: str):
+    """
+    Method to logout of a session shared by API clients
+    :param session: FireMonSession, or a plain requests.Session carrying a token
+    :param url: Logout URL
+    :return: Response object
+    """
+    if isinstance(session, FireMonSession):
+        return session.logout(url)
+    resp = session.post(url, headers={'Connection': 'Close'})
+    resp.raise_for_status()
+    return resp
+
+
+class FireMonSession(requests.Session):
+    """ requests.Session that logs in on its first request and replays a request after refreshing an expired token """
+
+    def __init__(self, authentication, scheduler=None, metrics=None, recorder=None):
+        super().__init__()
+        self.authentication = authentication
+        self.scheduler = scheduler
+        self.metrics = metrics
+        self.recorder = recorder
+
+    def raw_request(self, method, url, **kwargs):
+        """
+        Method to send a request without logging in or refreshing the token
+        """
+        return super().request(method, url, **kwargs)
+
+    def logout(self, url=None):
+        """
+        Method to logout of the session, the next request logs in again
+        :param url: Logout URL, defaulted to the logout URL of the authentication
+        :return: Response object
+        """
+        # Only the logout request closes its connection, the pool stays usable for other threads
+        resp = self.request('POST', url or self.authentication.logout_url, headers={'Connection': 'Close'})
+        # A token the server no longer accepts is as good as logged out
+        if resp.status_code != 401:
+            resp.raise_for_status()
+        return resp
+
+    def __send(self, method, url, kwargs):
+        if self.scheduler is None:
+            return super().request(method, url, **kwargs)
+        return self.scheduler.send(method, lambda: super(FireMonSession, self).request(method, url, **kwargs),
+                                   lambda: _rewind(kwargs.get('data'), kwargs.get('files')))
+
+    def request(self, method, url, **kwargs):
+        if self.metrics is None and self.recorder is None:
+            return self.__authenticated_request(method, url, kwargs)
+        # URLs built from the endpoint registry carry their properties key
+        endpoint = getattr(url, 'key', None) or 'other'
+        method = method.upper()
+        send_request = lambda: self.__authenticated_request(method, url, kwargs)  # noqa: E731
+        if self.recorder is not None:
+            send_request = functools.partial(self.recorder.timed, endpoint, method, url, kwargs, send_request)
+        if self.metrics is not None:
+            return self.metrics.timed(endpoint, method, url, send_request, kwargs.get('stream', False))
+        return send_request()
+
+    def __authenticated_request(self, method, url, kwargs):
+        token = self.authentication.ensure_token()
+        resp = self.__send(method, url, kwargs)
+        if url == self.authentication.logout_url:
+            # A rejected token is already logged out, logging in again only to log out would be wasted
+            if resp.ok or resp.status_code == 401:
+                self.authentication.forget_token(token)
+            return resp
+        # Another thread logging out can revoke the new token before the replay arrives, so more than one replay is allowed
+        for _ in range(TOKEN_REPLAYS):
+            if resp.status_code != 401 or not _rewind(kwargs.get('data'), kwargs.get('files')):
+                break
+            resp.close()
+            token = self.authentication.refresh_token(token)
+            resp = self.__send(method, url, kwargs)
+        return resp
+
+
 class Authentication:
 
-    def __init__(self, host, username, password, verify_ssl):
+    def __init__(self, host, username, password, verify_ssl, pool_connections=10, pool_maxsize=10, token_cache=None, lazy_login=True,
+                 scheduler=None, metrics=None, recorder=None):
+        """
+        :param host: Base URL
+        :param username: Username
+        :param password: Password
+        :param verify_ssl: Verify SSL (True or False)
+        :param pool_connections: Number of connection pools to cache, defaulted to 10
+        :param pool_maxsize: Maximum number of keep-alive connections per pool, defaulted to 10
+        :param token_cache: MemoryTokenCache or FileTokenCache to reuse tokens across clients, defaulted to None
+        :param lazy_login: Defer logging in until the first API call, defaulted to True
+        :param scheduler: AdaptiveScheduler pacing every request of the session, defaulted to None
+        :param metrics: RequestMetrics recording every request of the session, defaulted to None
+        :param recorder: TrafficRecorder capturing every request of the session for replay, defaulted to None
+        """
         self.host = host
         self.username = username
         self.password = password
-        self.fm_session = requests.session()
+        self.token_cache = token_cache
+        self.lazy_login = lazy_login
+        self.token = None
+        self._token_lock = threading.Lock()
+        self.fm_session = FireMonSession(self, scheduler, metrics, recorder)
         self.fm_session.verify = verify_ssl
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.fm_session.mount('https://', adapter)
+        self.fm_session.mount('http://', adapter)
         self.BASE_AUTH_URL = "{}/securitymanager/api/authentication/login"
+        self.logout_url = "{}/securitymanager/api/authentication/logout".format(self.host)
 
     def __api_request(self, method: str, endpoint: str, payload=None, parameters=None, data=None):
         try:
-            resp = self.fm_session.request(method, endpoint, json=payload, params=parameters, data=data, )
+            resp = self.fm_session.raw_request(method, endpoint, json=payload, params=parameters, data=data,
+                                               headers=dict(headers, **{'X-FM-Auth-Token': None}))
             resp.raise_for_status()
             return resp
         except requests.exceptions.HTTPError:
             raise
 
-    def get_auth_token(self):
-        """ 
-            User need to pass host, username, password, and verify_ssl as parameters while creating 
-            an instance of this class and this function will be called only once due to run_once
-            annotation and sets authentication token in the headers and returns the headers whenever called 
-        """
+    def __login(self) -> str:
         payload = {'username': self.username, 'password': self.password}
         # Security manager url
         auth_url = self.BASE_AUTH_URL.format(self.host)
         result = self.__api_request('POST', auth_url, payload)
-        auth_token = result.json()
+        return result.json().get('token')
+
+    def __set_token(self, token: str):
+        self.token = token
         self.fm_session.headers.update({
             'Content-Type': 'applicationjson',
             'Accept': 'applicationjson',
-            'X-FM-Auth-Token': auth_token.get('token'),
+            'X-FM-Auth-Token': token,
         })
+
+    def ensure_token(self) -> str:
+        """
+        Method to make sure the session carries a token, taken from the token cache when possible
+        :return: Current token
+        """
+        if self.token is None:
+            with self._token_lock:
+                if self.token is None:
+                    token = self.token_cache.get(self.host, self.username) if self.token_cache is not None else None
+                    if token is None:
+                        token = self.__login()
+                        if self.token_cache is not None:
+                            self.token_cache.set(self.host, self.username, token)
+                    self.__set_token(token)
+        return self.token
+
+    def refresh_token(self, stale_token: str) -> str:
+        """
+        Method to log in again after the server rejected a token. Concurrent callers holding the same
+        stale token trigger a single login.
+        :param stale_token: Token that was rejected
+        :return: Current token
+        """
+        with self._token_lock:
+            # None means another thread logged out since the request was sent
+            if self.token is None or self.token == stale_token:
+                if self.token_cache is not None:
+                    self.token_cache.delete(self.host, self.username, stale_token)
+                    token = self.token_cache.get(self.host, self.username)
+                else:
+                    token = None
+                if token is None or token == stale_token:
+                    token = self.__login()
+                    if self.token_cache is not None:
+                        self.token_cache.set(self.host, self.username, token)
+                self.__set_token(token)
+        return self.token
+
+    def forget_token(self, token=None):
+        """
+        Method to drop the current token after logging out, the next API call logs in again
+        :param token: Token that was logged out, defaulted to None which drops whatever token is current. A token
+                      another thread has logged in with since is kept
+        """
+        with self._token_lock:
+            if token is not None and self.token != token:
+                return
+            if self.token_cache is not None and self.token is not None:
+                self.token_cache.delete(self.host, self.username, self.token)
+            self.token = None
+
+    def get_auth_token(self):
+        """
+            User need to pass host, username, password, and verify_ssl as parameters while creating
+            an instance of this class. The returned session logs in on its first request, or right away
+            when lazy_login is False, and sets the authentication token in its headers.
+        """
+        if not self.lazy_login:
+            self.ensure_token()
         return self.fm_session
@@ -0,0 +1,207 @@
+""" Per-endpoint request metrics recorded on a FireMon session """
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class RequestEvent:
+    """ One completed request, passed to hook callbacks """
+
+    __slots__ = ('endpoint', 'method', 'url', 'status_code', 'latency', 'bytes_in', 'bytes_out', 'error')
+
+    def __init__(self, endpoint, method, url, status_code, latency, bytes_in, bytes_out, error=None):
+        self.endpoint = endpoint
+        self.method = method
+        self.url = url
+        self.status_code = status_code
+        self.latency = latency
+        self.bytes_in = bytes_in
+        self.bytes_out = bytes_out
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.status_code is not None and self.status_code < 400
+
+    def __repr__(self):
+        return f'RequestEvent(endpoint={self.endpoint!r}, method={self.method!r}, status_code={self.status_code}, latency={self.latency:.4f})'
+
+
+class _Series:
+    __slots__ = ('count', 'errors', 'bytes_in', 'bytes_out', 'latency_sum', 'buckets', 'statuses')
+
+    def __init__(self, bucket_count: int):
+        self.count = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.latency_sum = 0.0
+        self.buckets = [0] * (bucket_count + 1)
+        self.statuses = {}
+
+
+def _body_size(body) -> int:
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    # Streamed bodies are not measured
+    return 0
+
+
+def _label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RequestMetrics:
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, prefix='firemon'):
+        """
+        Counts, errors, bytes and latency histograms per endpoint key and method
+        :param buckets: Upper bounds in seconds of the latency histogram buckets
+        :param prefix: Prefix of exported metric names, defaulted to firemon
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.prefix = prefix
+        self._series = {}
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, callback):
+        """
+        Method to register a callable receiving a RequestEvent after every request
+        :param callback: Callable taking a RequestEvent, exceptions it raises are ignored
+        :return: callback, so it can be used as a decorator
+        """
+        with self._lock:
+            self._hooks = self._hooks + [callback]
+        return callback
+
+    def remove_hook(self, callback):
+        with self._lock:
+            self._hooks = [h for h in self._hooks if h is not callback]
+
+    def record(self, endpoint: str, method: str, url, resp, latency: float, error=None, stream=False):
+        """
+        Method to record a completed request
+        :param endpoint: Properties key of the endpoint, e.g. siql_query_sm_api
+        :param method: HTTP method
+        :param url: Requested URL
+        :param resp: Response object, None when the request failed without one
+        :param latency: Seconds the request took
+        :param error: Exception raised by the request, defaulted to None
+        :param stream: The body is left for the caller to stream, so only its Content-Length is counted, defaulted to False
+        """
+        status_code = resp.status_code if resp is not None else None
+        bytes_in = 0
+        bytes_out = 0
+        if resp is not None:
+            length = resp.headers.get('Content-Length')
+            bytes_in = int(length) if length and length.isdigit() else (0 if stream else len(resp.content or b''))
+            bytes_out = _body_size(resp.request.body) if resp.request is not None else 0
+        failed = error is not None or status_code is None or status_code >= 400
+        key = (endpoint, method)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(len(self.buckets))
+            series.count += 1
+            series.errors += failed
+            series.bytes_in += bytes_in
+            series.bytes_out += bytes_out
+            series.latency_sum += latency
+            series.buckets[bisect_left(self.buckets, latency)] += 1
+            series.statuses[status_code] = series.statuses.get(status_code, 0) + 1
+            hooks = self._hooks
+        if hooks:
+            event = RequestEvent(endpoint, method, str(url), status_code, latency, bytes_in, bytes_out, error)
+            for hook in hooks:
+                try:
+                    hook(event)
+                except Exception:
+                    pass
+
+    def timed(self, endpoint: str, method: str, url, send_request, stream=False):
+        """
+        Method to send a request and record it
+        :param send_request: Callable sending the request and returning the Response object
+        :param stream: The request was sent with stream=True, defaulted to False
+        :return: Response object
+        """
+        started = time.perf_counter()
+        try:
+            resp = send_request()
+        except Exception as e:
+            self.record(endpoint, method, url, None, time.perf_counter() - started, e, stream)
+            raise
+        self.record(endpoint, method, url, resp, time.perf_counter() - started, stream=stream)
+        return resp
+
+    def snapshot(self) -> dict:
+        """
+        Method to retrieve every series as plain data
+        :return: Dictionary of endpoint to method to count, errors, error_rate, bytes_in, bytes_out, latency_sum,
+                 latency_avg, statuses and buckets (cumulative, by upper bound)
+        """
+        with self._lock:
+            items = [(key, series.count, series.errors, series.bytes_in, series.bytes_out, series.latency_sum,
+                      list(series.buckets), dict(series.statuses)) for key, series in self._series.items()]
+        result = {}
+        for (endpoint, method), count, errors, bytes_in, bytes_out, latency_sum, buckets, statuses in items:
+            cumulative = []
+            total = 0
+            for bound, n in zip(self.buckets + (float('inf'),), buckets):
+                total += n
+                cumulative.append((bound, total))
+            result.setdefault(endpoint, {})[method] = {
+                'count': count, 'errors': errors, 'error_rate': errors / count if count else 0.0, 'bytes_in': bytes_in,
+                'bytes_out': bytes_out, 'latency_sum': latency_sum, 'latency_avg': latency_sum / count if count else 0.0,
+                'statuses': statuses, 'buckets': cumulative,
+            }
+        return result
+
+    def to_prometheus(self, openmetrics=False) -> str:
+        """
+        Method to export every series in the Prometheus text format
+        :param openmetrics: Emit the OpenMetrics variant, terminated by # EOF, defaulted to False
+        :return: Text exposition
+        """
+        p = self.prefix
+        suffix = '' if openmetrics else '_total'
+        lines = [f'# TYPE {p}_requests{suffix} counter', f'# HELP {p}_requests{suffix} Requests sent, by endpoint, method and status.']
+        snapshot = self.snapshot()
+        for endpoint, methods in sorted(snapshot.items(), key=lambda kv: str(kv[0])):
+            for method, s in sorted(methods.items()):
+                for status, n in sorted(s['statuses'].items(), key=lambda kv: str(kv[0])):
+                    lines.append(f'{p}_requests_total{{endpoint="{_label(str(endpoint))}",method="{method}",status="{status or "error"}"}} {n}')
+        for name, field, help_text in (('request_errors', 'errors', 'Requests that failed or returned 4xx/5xx.'),
+                                       ('request_bytes_received', 'bytes_in', 'Response body bytes.'),
+                                       ('request_bytes_sent', 'bytes_out', 'Request body bytes.')):
+            lines.append(f'# TYPE {p}_{name}{suffix} counter')
+            lines.append(f'# HELP {p}_{name}{suffix} {help_text}')
+            for endpoint, methods in sorted(snapshot.items(), key=lambda kv: str(kv[0])):
+                for method, s in sorted(methods.items()):
+                    lines.append(f'{p}_{name}_total{{endpoint="{_label(str(endpoint))}",method="{method}"}} {s[field]}')
+        lines.append(f'# TYPE {p}_request_duration_seconds histogram')
+        lines.append(f'# HELP {p}_request_duration_seconds Request latency.')
+        for endpoint, methods in sorted(snapshot.items(), key=lambda kv: str(kv[0])):
+            for method, s in sorted(methods.items()):
+                labels = f'endpoint="{_label(str(endpoint))}",method="{method}"'
+                for bound, n in s['buckets']:
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{p}_request_duration_seconds_bucket{{{labels},le="{le}"}} {n}')
+                lines.append(f'{p}_request_duration_seconds_sum{{{labels}}} {s["latency_sum"]}')
+                lines.append(f'{p}_request_duration_seconds_count{{{labels}}} {s["count"]}')
+        if openmetrics:
+            lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """
+        Method to drop every recorded series, hooks are kept
+        """
+        with self._lock:
+            self._series = {}
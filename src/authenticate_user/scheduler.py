@@ -0,0 +1,167 @@
+""" Adaptive concurrency limit shared by every request sent through a FireMon session """
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import requests
+
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+def retry_after_seconds(resp):
+    """
+    Method to read the Retry-After header of a response
+    :param resp: Response object
+    :return: Seconds to wait, or None when the header is missing or invalid
+    """
+    value = resp.headers.get('Retry-After') if resp is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveScheduler:
+
+    def __init__(self, initial_limit=8, min_limit=1, max_limit=64, latency_target=None, tolerance=2.0, backoff_factor=0.5,
+                 max_backoff=30.0, max_retries=4):
+        """
+        AIMD limit on in-flight requests. The limit grows by one per window of successful requests and is halved when
+        the server throttles (429/503), fails to answer, or slows down past the latency target. Idempotent requests
+        are retried with jittered exponential backoff, and Retry-After pauses every new request.
+        :param initial_limit: Requests in flight at start, defaulted to 8
+        :param min_limit: Lowest limit, defaulted to 1
+        :param max_limit: Highest limit, defaulted to 64
+        :param latency_target: Seconds above which a response counts as congestion, defaulted to None which uses
+                               tolerance times the lowest latency seen
+        :param tolerance: Multiple of the lowest latency seen that counts as congestion, defaulted to 2.0
+        :param backoff_factor: Seconds of the first retry delay, doubled for every further retry, defaulted to 0.5
+        :param max_backoff: Longest delay between retries in seconds, defaulted to 30
+        :param max_retries: Retries of an idempotent request, defaulted to 4
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.tolerance = tolerance
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.max_retries = max_retries
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._in_flight = 0
+        self._waiting = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._baseline = None
+        self.retries = 0
+        self.throttled = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return self._waiting
+
+    def stats(self) -> dict:
+        """
+        Method to retrieve the current state of the scheduler
+        :return: Dictionary of limit, in_flight, queue_depth, retries, throttled and baseline_latency
+        """
+        return {'limit': self.limit, 'in_flight': self._in_flight, 'queue_depth': self._waiting, 'retries': self.retries,
+                'throttled': self.throttled, 'baseline_latency': self._baseline}
+
+    def __acquire(self):
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    pause = self._paused_until - time.monotonic()
+                    if pause > 0:
+                        self._cond.wait(pause)
+                    elif self._in_flight >= int(self._limit):
+                        self._cond.wait()
+                    else:
+                        break
+            finally:
+                self._waiting -= 1
+            self._in_flight += 1
+
+    def __release(self, latency=None, congested=False, pause=None):
+        with self._cond:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if pause:
+                self._paused_until = max(self._paused_until, now + pause)
+            if latency is not None and not congested:
+                if self._baseline is None or latency < self._baseline:
+                    self._baseline = latency
+                else:
+                    # Let the baseline drift up slowly so one unusually fast response does not pin it
+                    self._baseline += (latency - self._baseline) * 0.01
+                target = self.latency_target if self.latency_target is not None else self._baseline * self.tolerance + 0.05
+                congested = latency > target
+            if congested:
+                # Decrease at most once per baseline latency, concurrent failures are one congestion signal
+                if now - self._last_decrease > (self._baseline or 0.1):
+                    self._limit = max(float(self.min_limit), self._limit / 2)
+                    self._last_decrease = now
+            elif latency is not None:
+                self._limit = min(float(self.max_limit), self._limit + 1 / self._limit)
+            self._cond.notify_all()
+
+    def __backoff(self, attempt: int, retry_after=None) -> float:
+        delay = min(self.max_backoff, self.backoff_factor * (2 ** attempt))
+        delay = random.uniform(delay / 2, delay)
+        return max(delay, retry_after or 0.0)
+
+    def send(self, method: str, send_request, can_retry=lambda: True):
+        """
+        Method to send a request within the concurrency limit
+        :param method: HTTP method, only idempotent methods are retried
+        :param send_request: Callable sending the request and returning the Response object
+        :param can_retry: Callable returning False when the request body cannot be sent again
+        :return: Response object, the last one when every retry was throttled
+        """
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            self.__acquire()
+            started = time.monotonic()
+            try:
+                resp = send_request()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.__release(congested=True)
+                if not idempotent or attempt >= self.max_retries or not can_retry():
+                    raise
+                time.sleep(self.__backoff(attempt))
+                attempt += 1
+                self.retries += 1
+                continue
+            except BaseException:
+                self.__release()
+                raise
+            if resp.status_code not in THROTTLE_STATUS_CODES:
+                self.__release(time.monotonic() - started)
+                return resp
+            self.throttled += 1
+            retry_after = retry_after_seconds(resp)
+            self.__release(congested=True, pause=retry_after)
+            if not idempotent or attempt >= self.max_retries or not can_retry():
+                return resp
+            resp.close()
+            time.sleep(self.__backoff(attempt, retry_after))
+            attempt += 1
+            self.retries += 1
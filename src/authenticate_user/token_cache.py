@@ -0,0 +1,135 @@
+""" Caches of authentication tokens keyed by host and username """
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class _FileLock:
+    """ Exclusive OS level lock held on a side file for the duration of a with block """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fh = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.fh = open(self.path, 'a+')
+        if fcntl is not None:
+            fcntl.flock(self.fh.fileno(), fcntl.LOCK_EX)
+        else:
+            self.fh.seek(0)
+            msvcrt.locking(self.fh.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if fcntl is not None:
+            fcntl.flock(self.fh.fileno(), fcntl.LOCK_UN)
+        else:
+            self.fh.seek(0)
+            msvcrt.locking(self.fh.fileno(), msvcrt.LK_UNLCK, 1)
+        self.fh.close()
+
+
+class MemoryTokenCache:
+
+    def __init__(self, max_age=None):
+        """
+        In-process token cache, shared by every Authentication it is passed to
+        :param max_age: Seconds after which a cached token is no longer used, defaulted to None (no expiry)
+        """
+        self.max_age = max_age
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def _fresh(self, entry) -> bool:
+        return entry is not None and (self.max_age is None or time.time() - entry['created'] < self.max_age)
+
+    def get(self, host: str, username: str):
+        """
+        Method to retrieve a cached token
+        :param host: Base URL
+        :param username: Username
+        :return: Token or None
+        """
+        with self._lock:
+            entry = self._tokens.get((host, username))
+        return entry['token'] if self._fresh(entry) else None
+
+    def set(self, host: str, username: str, token: str):
+        """
+        Method to cache a token
+        :param host: Base URL
+        :param username: Username
+        :param token: Authentication token
+        """
+        with self._lock:
+            self._tokens[(host, username)] = {'token': token, 'created': time.time()}
+
+    def delete(self, host: str, username: str, token=None):
+        """
+        Method to drop a cached token
+        :param host: Base URL
+        :param username: Username
+        :param token: Only drop the entry if it still holds this token, defaulted to None (always drop)
+        """
+        with self._lock:
+            entry = self._tokens.get((host, username))
+            if entry is not None and (token is None or entry['token'] == token):
+                del self._tokens[(host, username)]
+
+
+class FileTokenCache(MemoryTokenCache):
+
+    def __init__(self, path=None, max_age=None):
+        """
+        Token cache persisted to a JSON file so separate processes can reuse a login. Access is serialized
+        with an OS file lock and the file is only readable by the current user.
+        :param path: Cache file, defaulted to ~/.firemon/token_cache.json
+        :param max_age: Seconds after which a cached token is no longer used, defaulted to None (no expiry)
+        """
+        super().__init__(max_age)
+        self.path = path or os.path.join(os.path.expanduser('~'), '.firemon', 'token_cache.json')
+
+    @staticmethod
+    def _key(host: str, username: str) -> str:
+        return f'{username}@{host}'
+
+    def __read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def __write(self, tokens: dict):
+        tmp_path = self.path + '.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(tokens, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, host: str, username: str):
+        with self._lock, _FileLock(self.path + '.lock'):
+            entry = self.__read().get(self._key(host, username))
+        return entry['token'] if self._fresh(entry) else None
+
+    def set(self, host: str, username: str, token: str):
+        with self._lock, _FileLock(self.path + '.lock'):
+            tokens = self.__read()
+            tokens[self._key(host, username)] = {'token': token, 'created': time.time()}
+            self.__write(tokens)
+
+    def delete(self, host: str, username: str, token=None):
+        with self._lock, _FileLock(self.path + '.lock'):
+            tokens = self.__read()
+            entry = tokens.get(self._key(host, username))
+            if entry is not None and (token is None or entry['token'] == token):
+                del tokens[self._key(host, username)]
+                self.__write(tokens)
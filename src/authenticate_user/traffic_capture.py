@@ -0,0 +1,332 @@
+""" Recording of the requests sent through a FireMon session, and time-scaled replay of a recording """
+import gzip
+import json
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import parse_qsl, urlencode, urlsplit
+import requests
+
+# Names of query parameters and JSON fields whose values are never written to a capture
+SECRET_FIELDS = re.compile(r'pass(word|wd)?|secret|token|credential|api[_-]?key|authorization|cookie', re.IGNORECASE)
+REDACTED = '***'
+
+
+def redact(value):
+    """
+    Method to replace the values of secret fields, at any depth, with ***
+    :param value: Decoded JSON value
+    :return: Copy of value with secrets replaced
+    """
+    if isinstance(value, dict):
+        return {k: REDACTED if isinstance(k, str) and SECRET_FIELDS.search(k) else redact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact(v) for v in value]
+    return value
+
+
+def _redact_query(query: str) -> str:
+    if not query:
+        return ''
+    pairs = parse_qsl(query, keep_blank_values=True)
+    return urlencode([(k, REDACTED if SECRET_FIELDS.search(k) else v) for k, v in pairs])
+
+
+def _payload_size(kwargs: dict) -> int:
+    if kwargs.get('json') is not None:
+        return len(json.dumps(kwargs['json']))
+    data = kwargs.get('data')
+    if isinstance(data, (bytes, str)):
+        return len(data)
+    if isinstance(data, dict):
+        return len(urlencode(data))
+    # Streamed and multipart bodies are not measured
+    return 0
+
+
+def _response_size(resp, stream: bool) -> int:
+    if resp is None:
+        return 0
+    length = resp.headers.get('Content-Length')
+    if length and length.isdigit():
+        return int(length)
+    # Streamed bodies are read by the caller after the request is captured
+    return 0 if stream else len(resp.content or b'')
+
+
+def _open(path: str, mode: str):
+    return gzip.open(path, mode + 't', encoding='utf-8') if str(path).endswith('.gz') else open(path, mode, encoding='utf-8')
+
+
+class TrafficRecorder:
+
+    def __init__(self, record_bodies=False, max_events=100000):
+        """
+        Captures the requests sent through a session: start offset, endpoint key, method, path, status, latency and
+        payload sizes. Authentication headers and the login request are never captured, and secret query parameters
+        and JSON fields are replaced with ***.
+        :param record_bodies: Keep redacted JSON request bodies so a replay sends the same payloads, defaulted to False
+        :param max_events: Events kept in memory, later requests are counted in dropped, defaulted to 100000
+        """
+        self.record_bodies = record_bodies
+        self.max_events = max_events
+        self.events = []
+        self.dropped = 0
+        self._started = None
+        self._cleared = None
+        self._lock = threading.Lock()
+
+    def timed(self, endpoint: str, method: str, url, kwargs: dict, send_request):
+        """
+        Method to send a request and capture it
+        :param endpoint: Properties key of the endpoint
+        :param method: HTTP method
+        :param url: Requested URL
+        :param kwargs: Keyword arguments of the request
+        :param send_request: Callable sending the request and returning the Response object
+        :return: Response object
+        """
+        started = time.monotonic()
+        with self._lock:
+            if self._started is None:
+                self._started = started
+        resp = None
+        error = None
+        try:
+            resp = send_request()
+            return resp
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.record(endpoint, method, url, kwargs, resp, started, time.monotonic() - started, error)
+
+    def record(self, endpoint: str, method: str, url, kwargs: dict, resp, started: float, latency: float, error=None):
+        """
+        Method to capture a completed request
+        :param started: time.monotonic() when the request was sent
+        :param latency: Seconds the request took
+        :param error: Exception raised by the request, defaulted to None
+        """
+        parts = urlsplit(str(url))
+        path = parts.path
+        query = _redact_query(parts.query)
+        params = kwargs.get('params')
+        if params:
+            extra = _redact_query(urlencode(params, doseq=True))
+            query = f'{query}&{extra}' if query else extra
+        if query:
+            path += '?' + query
+        event = {'t': 0.0, 'endpoint': endpoint, 'method': method, 'path': path, 'status': resp.status_code if resp is not None else None,
+                 'latency': latency, 'bytes_out': _payload_size(kwargs), 'bytes_in': _response_size(resp, kwargs.get('stream', False))}
+        if error is not None:
+            event['error'] = type(error).__name__
+        if self.record_bodies and kwargs.get('json') is not None:
+            event['json'] = redact(kwargs['json'])
+        with self._lock:
+            # A request still in flight when the capture was cleared belongs to the cleared capture
+            if self._cleared is not None and started < self._cleared:
+                return
+            if self._started is None:
+                self._started = started
+            event['t'] = started - self._started
+            if len(self.events) < self.max_events:
+                self.events.append(event)
+            else:
+                self.dropped += 1
+
+    def snapshot(self) -> list:
+        """
+        Method to retrieve the captured events ordered by start offset
+        :return: List of event dictionaries
+        """
+        with self._lock:
+            events = list(self.events)
+        return sorted(events, key=lambda e: e['t'])
+
+    def save(self, path: str) -> int:
+        """
+        Method to write the capture as newline delimited JSON, gzip compressed when path ends with .gz
+        :param path: File path
+        :return: Number of events written
+        """
+        events = self.snapshot()
+        with _open(path, 'w') as f:
+            for event in events:
+                f.write(json.dumps(event, separators=(',', ':')) + '\n')
+        return len(events)
+
+    def clear(self):
+        with self._lock:
+            self.events = []
+            self.dropped = 0
+            self._started = None
+            self._cleared = time.monotonic()
+
+    def __len__(self):
+        return len(self.events)
+
+
+def load_capture(path: str) -> list:
+    """
+    Method to read a capture written by TrafficRecorder.save
+    :param path: File path, gzip compressed when it ends with .gz
+    :return: List of event dictionaries ordered by start offset
+    """
+    with _open(path, 'r') as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    return sorted(events, key=lambda e: e['t'])
+
+
+def percentiles(samples: list, points=(50, 90, 95, 99)) -> dict:
+    """
+    Method to summarize latencies
+    :param samples: Seconds per request
+    :return: Dictionary of count, mean, max and the requested percentiles, e.g. p50, in seconds
+    """
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    result = {'count': len(ordered), 'mean': sum(ordered) / len(ordered), 'max': ordered[-1]}
+    for p in points:
+        result[f'p{p}'] = ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+    return result
+
+
+class ReplayResult:
+
+    __slots__ = ('endpoint', 'method', 'path', 'status_code', 'latency', 'lag', 'error')
+
+    def __init__(self, endpoint, method, path, status_code, latency, lag, error=None):
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.status_code = status_code
+        self.latency = latency
+        self.lag = lag
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.status_code is not None and self.status_code < 400
+
+    def __repr__(self):
+        return f'ReplayResult(endpoint={self.endpoint!r}, status_code={self.status_code}, latency={self.latency:.4f}, error={self.error!r})'
+
+
+class ReplayReport:
+
+    def __init__(self, speed, concurrency):
+        self.speed = speed
+        self.concurrency = concurrency
+        self.results = []
+        self.elapsed = 0.0
+
+    @property
+    def errors(self) -> list:
+        return [r for r in self.results if not r.ok]
+
+    @property
+    def requests_per_sec(self) -> float:
+        return len(self.results) / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> dict:
+        """
+        Method to summarize the replay
+        :return: Dictionary of count, errors, elapsed, requests_per_sec, latency and lag percentiles, and latency
+                 percentiles with error counts per endpoint
+        """
+        by_endpoint = {}
+        for r in self.results:
+            by_endpoint.setdefault(r.endpoint, []).append(r)
+        return {
+            'count': len(self.results), 'errors': len(self.errors), 'elapsed': self.elapsed, 'requests_per_sec': self.requests_per_sec,
+            'speed': self.speed, 'concurrency': self.concurrency,
+            'latency': percentiles([r.latency for r in self.results]),
+            'lag': percentiles([r.lag for r in self.results]),
+            'endpoints': {endpoint: dict(percentiles([r.latency for r in results]), errors=sum(1 for r in results if not r.ok))
+                          for endpoint, results in sorted(by_endpoint.items())},
+        }
+
+    def __repr__(self):
+        return (f'ReplayReport(count={len(self.results)}, errors={len(self.errors)}, elapsed={self.elapsed:.2f}s, '
+                f'requests_per_sec={self.requests_per_sec:.1f})')
+
+
+class TrafficReplayer:
+
+    def __init__(self, session, host=None, speed=1.0, concurrency=8, timeout=60):
+        """
+        Plays a capture against a host, keeping the recorded start offsets scaled by speed
+        :param session: Session requests are sent with, e.g. Authentication(...).get_auth_token() for the target host
+        :param host: Base URL of the target, defaulted to the host of the session's authentication
+        :param speed: Replay rate relative to the recording, 2.0 replays twice as fast, 0 sends as fast as concurrency allows
+        :param concurrency: Requests in flight at most, defaulted to 8
+        :param timeout: Seconds to wait for each response, defaulted to 60
+        """
+        self.session = session
+        self.host = (host or session.authentication.host).rstrip('/')
+        self.speed = speed
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+    def __send(self, event: dict, scheduled: float) -> ReplayResult:
+        lag = time.monotonic() - scheduled
+        kwargs = {'timeout': self.timeout}
+        if 'json' in event:
+            kwargs['json'] = event['json']
+        elif event.get('bytes_out'):
+            # Bodies that were not recorded are replaced with a JSON string of the recorded size
+            kwargs['data'] = b'"' + b'x' * max(0, event['bytes_out'] - 2) + b'"'
+            kwargs['headers'] = {'Content-Type': 'application/json'}
+        started = time.monotonic()
+        try:
+            resp = self.session.request(event['method'], self.host + event['path'], **kwargs)
+            resp.content
+            resp.close()
+        except requests.exceptions.RequestException as e:
+            return ReplayResult(event['endpoint'], event['method'], event['path'], None, time.monotonic() - started, lag, e)
+        return ReplayResult(event['endpoint'], event['method'], event['path'], resp.status_code, time.monotonic() - started, lag)
+
+    def run(self, events, on_result=None) -> ReplayReport:
+        """
+        Method to replay a capture
+        :param events: TrafficRecorder, list of events, or path of a saved capture
+        :param on_result: Callable receiving each ReplayResult as it completes, defaulted to None
+        :return: ReplayReport, results in completion order
+        """
+        if isinstance(events, TrafficRecorder):
+            events = events.snapshot()
+        elif isinstance(events, str):
+            events = load_capture(events)
+        report = ReplayReport(self.speed, self.concurrency)
+        start = time.monotonic()
+        pending = set()
+
+        def collect(done):
+            for future in done:
+                result = future.result()
+                report.results.append(result)
+                if on_result is not None:
+                    on_result(result)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for event in events:
+                scheduled = start + (event['t'] / self.speed if self.speed else 0.0)
+                while len(pending) >= self.concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                delay = scheduled - time.monotonic()
+                if delay > 0 and pending:
+                    done, pending = wait(pending, timeout=delay)
+                    collect(done)
+                    delay = scheduled - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                pending.add(executor.submit(self.__send, event, scheduled))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        report.elapsed = time.monotonic() - start
+        return report
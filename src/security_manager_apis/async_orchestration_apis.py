@@ -0,0 +1,97 @@
+import asyncio
+import authenticate_user
+from security_manager_apis.endpoints import get_endpoint_registry
+
+
+class AsyncOrchestrationApis:
+    """ Async counterpart of OrchestrationApis """
+
+    def __init__(self, host: str, username: str, password: str, verify_ssl: bool, domain_id: str, suppress_ssl_warning=False,
+                 max_concurrency=10, token_cache=None):
+        """
+        Authentication happens once, on first use or on entering the client as an async context manager.
+        :param host: Base URL
+        :param username: Username
+        :param password: Password
+        :param verify_ssl: Verify SSL (True or False)
+        :param domain_id: Domain ID, typically 1
+        :param suppress_ssl_warning: Kept for parity with OrchestrationApis, httpx does not emit SSL warnings
+        :param max_concurrency: Maximum number of requests in flight at once, defaulted to 10
+        :param token_cache: MemoryTokenCache or FileTokenCache used to reuse a login, defaulted to None
+        """
+        self.endpoints = get_endpoint_registry()
+        self.host = host
+        self.domain_id = domain_id
+        self.max_concurrency = max_concurrency
+        self.authentication = authenticate_user.AsyncAuthentication(self.host, username, password, verify_ssl, max_concurrency, token_cache)
+        self.fm_api_session = None
+        self._auth_lock = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        await self.authenticate()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def authenticate(self):
+        """
+        Method to log in, only the first call performs the login
+        :return: Authenticated httpx.AsyncClient
+        """
+        if self._auth_lock is None:
+            self._auth_lock = asyncio.Lock()
+        async with self._auth_lock:
+            if self.fm_api_session is None:
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                self.fm_api_session = await self.authentication.get_auth_token()
+        return self.fm_api_session
+
+    async def close(self):
+        """
+        Method to close the underlying connection pool
+        """
+        await self.authentication.fm_session.aclose()
+
+    async def __api_request(self, method: str, endpoint: str, payload=None, parameters=None, data=None, timeout=None, files=None,
+                            headers=None):
+        if self.fm_api_session is None:
+            await self.authenticate()
+        kwargs = {}
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        if isinstance(data, (str, bytes)):
+            kwargs['content'] = data
+        elif data is not None:
+            kwargs['data'] = data
+        if isinstance(parameters, dict):
+            parameters = {k: v for k, v in parameters.items() if v is not None}
+        async with self._semaphore:
+            resp = await self.fm_api_session.request(method, endpoint, json=payload, params=parameters, files=files, headers=headers,
+                                                     **kwargs)
+        resp.raise_for_status()
+        return resp
+
+    async def rulerec_api(self, params: dict, req_json: dict) -> dict:
+        """ Calling orchestration rulerec api by passing json data as request body, headers, params and domainId
+            which returns you list of rule recommendations for given input as response"""
+        rulerec_url = self.endpoints.url('rulerec_api_url', self.host, self.domain_id)
+        resp = await self.__api_request('POST', rulerec_url, req_json, params)
+        return resp.json()
+
+    async def pca_api(self, device_id: str, change_json: list) -> dict:
+        """ Calling orchestration pca api by passing json data as request body, headers, deviceId and domainId
+            which returns you pre-change assessments for the given device """
+        control_list = 'controlType=RULE_SEARCH&controlType=ALLOWED_SERVICES&controlType=SERVICE_RISK_ANALYSIS&controlType=DEVICE_ACCESS_ANALYSIS&controlType=NETWORK_ACCESS_ANALYSIS'
+        pca_url = self.endpoints.url('pca_api_url', self.host, self.domain_id, device_id, control_list)
+        resp = await self.__api_request('POST', pca_url, change_json)
+        return resp.json()
+
+    async def logout(self):
+        """
+        Method to logout of current session
+        """
+        endpoint = self.endpoints.url('logout_api_url', self.host)
+        resp = await self.__api_request('POST', endpoint, headers={'Connection': 'Close'})
+        return resp
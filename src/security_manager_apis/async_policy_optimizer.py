@@ -0,0 +1,216 @@
+import asyncio
+import authenticate_user
+from security_manager_apis.endpoints import get_endpoint_registry
+from security_manager_apis.siql_pager import aiter_siql_pages, aiter_siql_records
+from security_manager_apis.ticket_stage_cache import get_stage_ids
+from security_manager_apis.workflow_cache import WORKFLOW_ENDPOINTS, WorkflowNotFoundError, default_workflow_cache, load_workflows_async
+
+
+class AsyncPolicyOptimizerApis:
+
+    def __init__(self, host: str, username: str, password: str, verify_ssl: bool, domain_id: str, workflow_name: str,
+                 suppress_ssl_warning=False, max_concurrency=10, token_cache=None, workflow_cache=None):
+        """
+        Async counterpart of PolicyOptimizerApis. Authentication and workflow lookup happen once, on first use or on
+        entering the client as an async context manager.
+        :param host: Base URL
+        :param username: Username
+        :param password: Password
+        :param verify_ssl: Verify SSL (True or False)
+        :param domain_id: Domain ID, typically 1
+        :param workflow_name: Name of targeted workflow
+        :param suppress_ssl_warning: Kept for parity with PolicyOptimizerApis, httpx does not emit SSL warnings
+        :param max_concurrency: Maximum number of requests in flight at once, defaulted to 10
+        :param token_cache: MemoryTokenCache or FileTokenCache used to reuse a login, defaulted to None
+        :param workflow_cache: WorkflowCache used to resolve workflow_name, defaulted to a cache shared by all clients
+        """
+        self.endpoints = get_endpoint_registry()
+        self.host = host
+        self.domain_id = domain_id
+        self.workflow_name = workflow_name
+        self.workflow_cache = workflow_cache if workflow_cache is not None else default_workflow_cache
+        self.max_concurrency = max_concurrency
+        self.authentication = authenticate_user.AsyncAuthentication(self.host, username, password, verify_ssl, max_concurrency, token_cache)
+        self.fm_api_session = None
+        self.workflow_id = None
+        self.workflow_task_id = ""
+        self.workflow_packet_task_id = ""
+        self._auth_lock = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        await self.authenticate()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def authenticate(self):
+        """
+        Method to log in and resolve the workflow ID, only the first call performs the requests
+        :return: Authenticated httpx.AsyncClient
+        """
+        if self._auth_lock is None:
+            self._auth_lock = asyncio.Lock()
+        async with self._auth_lock:
+            if self.fm_api_session is None:
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                session = await self.authentication.get_auth_token()
+                # Both are published together, a failed workflow lookup leaves the client unauthenticated
+                workflow_id = await self.__find_workflow_id(self.domain_id, self.workflow_name, session)
+                if workflow_id is None:
+                    raise WorkflowNotFoundError(self.workflow_name, self.domain_id)
+                self.fm_api_session, self.workflow_id = session, workflow_id
+        return self.fm_api_session
+
+    async def close(self):
+        """
+        Method to close the underlying connection pool
+        """
+        await self.authentication.fm_session.aclose()
+
+    async def __api_request(self, method: str, endpoint: str, payload=None, parameters=None, data=None, timeout=None, files=None,
+                            headers=None):
+        if self.fm_api_session is None:
+            await self.authenticate()
+        return await self.__send(method, endpoint, payload, parameters, data, timeout, files, headers)
+
+    async def __send(self, method: str, endpoint: str, payload=None, parameters=None, data=None, timeout=None, files=None,
+                     headers=None, session=None):
+        kwargs = {}
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        if isinstance(data, (str, bytes)):
+            kwargs['content'] = data
+        elif data is not None:
+            kwargs['data'] = data
+        if isinstance(parameters, dict):
+            parameters = {k: v for k, v in parameters.items() if v is not None}
+        async with self._semaphore:
+            resp = await (session or self.fm_api_session).request(method, endpoint, json=payload, params=parameters, files=files,
+                                                                  headers=headers, **kwargs)
+        resp.raise_for_status()
+        return resp
+
+    async def __stage_ids(self, ticket_id: str) -> tuple:
+        ticket_json = await self.get_po_ticket(ticket_id)
+        return get_stage_ids(ticket_json)
+
+    async def create_po_ticket(self, request_body: dict):
+        """
+        Method to create Policy Optimizer ticket
+        :param request_body: JSON body for ticket.
+        :return: Response object
+        """
+        endpoint = self.endpoints.url('create_po_ticket', self.host, self.domain_id)
+        resp = await self.__api_request('POST', endpoint, request_body)
+        return resp
+
+    async def get_po_ticket(self, ticket_id: str) -> dict:
+        """
+        Method to retrieve Policy Optimizer ticket JSON
+        :param ticket_id: ID of ticket
+        :return: JSON of ticket
+        """
+        await self.authenticate()
+        endpoint = self.endpoints.url('get_po_ticket', self.host, self.domain_id, self.workflow_id, ticket_id)
+        ticket_json = (await self.__api_request('GET', endpoint)).json()
+        self.workflow_task_id, self.workflow_packet_task_id = get_stage_ids(ticket_json)
+        return ticket_json
+
+    async def assign_po_ticket(self, ticket_id: str, user_id: str):
+        """
+        Method to assign user to Policy Optimizer ticket
+        :param ticket_id: ID of ticket
+        :param user_id: ID of user
+        :return: Response object
+        """
+        workflow_task_id, workflow_packet_task_id = await self.__stage_ids(ticket_id)
+        endpoint = self.endpoints.url('assign_po_ticket', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id, workflow_packet_task_id)
+        resp = await self.__api_request('PUT', endpoint, None, None, user_id)
+        return resp
+
+    async def complete_po_ticket(self, ticket_id: str, decision: dict):
+        """
+        Method to complete a Policy Optimizer ticket
+        :param ticket_id: ID of ticket
+        :param decision: Decision JSON
+        :return: Response object
+        """
+        workflow_task_id, workflow_packet_task_id = await self.__stage_ids(ticket_id)
+        endpoint = self.endpoints.url('complete_po_ticket', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id, workflow_packet_task_id, 'complete')
+        resp = await self.__api_request('PUT', endpoint, decision)
+        return resp
+
+    async def cancel_po_ticket(self, ticket_id: str):
+        """
+        Method to cancel a Policy Optimizer ticket
+        :param ticket_id: ID of ticket
+        :return: Response object
+        """
+        workflow_task_id, workflow_packet_task_id = await self.__stage_ids(ticket_id)
+        endpoint = self.endpoints.url('complete_po_ticket', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id, workflow_packet_task_id, 'cancelled')
+        resp = await self.__api_request('PUT', endpoint, {})
+        return resp
+
+    async def siql_query_po_ticket(self, parameters: dict) -> dict:
+        """
+        Method to execute SIQL query for Policy Optimizer tickets
+        :param parameters: search parameters
+        :return: Response JSON
+        """
+        endpoint = self.endpoints.url('siql_query_po', self.host, self.domain_id)
+        resp = await self.__api_request('GET', endpoint, None, parameters)
+        return resp.json()
+
+    def iter_siql(self, parameters: dict, page_size=100, prefetch=2, pages=False):
+        """
+        Method to iterate over every Policy Optimizer ticket matching a SIQL query, the next page is
+        fetched in the background while the current one is consumed
+        :param parameters: search parameters, page and pageSize are set by the iterator
+        :param page_size: Number of results per page, defaulted to 100
+        :param prefetch: Number of pages fetched ahead of the caller, defaulted to 2
+        :param pages: Yield whole page JSON instead of individual tickets, defaulted to False
+        :return: Async generator of tickets, or of page JSON when pages is True
+        """
+        def fetch_page(page):
+            return self.siql_query_po_ticket(dict(parameters, pageSize=page_size, page=page))
+
+        page_iter = aiter_siql_pages(fetch_page, page_size, prefetch)
+        return page_iter if pages else aiter_siql_records(page_iter)
+
+    async def logout(self):
+        """
+        Method to logout of session
+        """
+        endpoint = self.endpoints.url('logout_api_url', self.host)
+        resp = await self.__api_request('POST', endpoint, headers={'Connection': 'Close'})
+        return resp
+
+    def get_workflow_packet_task_id(self, ticket_json: dict):
+        """
+        Retrieves workflowPacketTaskId value from current stage of provided ticket
+        :param ticket_json: JSON of ticket, retrieved using get_po_ticket function
+        """
+        self.workflow_packet_task_id = get_stage_ids(ticket_json)[1]
+
+    def get_workflow_task_id(self, ticket_json: dict):
+        """
+        Retrieves workflowTaskId value from current stage of provided ticket
+        :param ticket_json: JSON of ticket, retrieved using get_po_ticket function
+        """
+        self.workflow_task_id = get_stage_ids(ticket_json)[0]
+
+    async def get_workflow_id_by_workflow_name(self, domain_id: str, workflow_name: str) -> str:
+        """ Takes domainId and workflow name as input parameters and returns you
+            the workflowId for given workflow name, or None when there is no such workflow """
+        await self.authenticate()
+        return await self.__find_workflow_id(domain_id, workflow_name)
+
+    async def __find_workflow_id(self, domain_id: str, workflow_name: str, session=None) -> str:
+        async def fetch(endpoint, parameters):
+            return (await self.__send('GET', endpoint, None, parameters, session=session)).json()
+
+        endpoint = self.endpoints.url(WORKFLOW_ENDPOINTS['policyoptimizer'], self.host, domain_id)
+        return await self.workflow_cache.resolve_async(self.host, 'policyoptimizer', domain_id, workflow_name,
+                                                       lambda: load_workflows_async(fetch, endpoint))
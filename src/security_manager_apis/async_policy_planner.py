@@ -0,0 +1,497 @@
+import asyncio
+import authenticate_user
+from security_manager_apis.endpoints import get_endpoint_registry
+from security_manager_apis.siql_pager import aiter_siql_pages, aiter_siql_records
+from security_manager_apis.policy_planner import parse_controls
+from security_manager_apis.ticket_stage_cache import get_stage_ids
+from security_manager_apis.workflow_cache import WORKFLOW_ENDPOINTS, WorkflowNotFoundError, default_workflow_cache, load_workflows_async
+
+
+class AsyncPolicyPlannerApis:
+
+    def __init__(self, host: str, username: str, password: str, verify_ssl: bool, domain_id: str, workflow_name: str,
+                 suppress_ssl_warning=False, max_concurrency=10, token_cache=None, workflow_cache=None):
+        """
+        Async counterpart of PolicyPlannerApis. Authentication and workflow lookup happen once, on first use or on
+        entering the client as an async context manager.
+        :param host: Base URL
+        :param username: Username
+        :param password: Password
+        :param verify_ssl: Verify SSL (True or False)
+        :param domain_id: Domain ID, typically 1
+        :param workflow_name: Name of targeted workflow
+        :param suppress_ssl_warning: Kept for parity with PolicyPlannerApis, httpx does not emit SSL warnings
+        :param max_concurrency: Maximum number of requests in flight at once, defaulted to 10
+        :param token_cache: MemoryTokenCache or FileTokenCache used to reuse a login, defaulted to None
+        :param workflow_cache: WorkflowCache used to resolve workflow_name, defaulted to a cache shared by all clients
+        """
+        self.endpoints = get_endpoint_registry()
+        self.host = host
+        self.domain_id = domain_id
+        self.workflow_name = workflow_name
+        self.workflow_cache = workflow_cache if workflow_cache is not None else default_workflow_cache
+        self.max_concurrency = max_concurrency
+        self.authentication = authenticate_user.AsyncAuthentication(self.host, username, password, verify_ssl, max_concurrency, token_cache)
+        self.fm_api_session = None
+        self.workflow_id = None
+        self.workflow_task_id = ""
+        self.workflow_packet_task_id = ""
+        self._auth_lock = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        await self.authenticate()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def authenticate(self):
+        """
+        Method to log in and resolve the workflow ID, only the first call performs the requests
+        :return: Authenticated httpx.AsyncClient
+        """
+        if self._auth_lock is None:
+            self._auth_lock = asyncio.Lock()
+        async with self._auth_lock:
+            if self.fm_api_session is None:
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                session = await self.authentication.get_auth_token()
+                # Both are published together, a failed workflow lookup leaves the client unauthenticated
+                workflow_id = await self.__find_workflow_id(self.domain_id, self.workflow_name, session)
+                if workflow_id is None:
+                    raise WorkflowNotFoundError(self.workflow_name, self.domain_id)
+                self.fm_api_session, self.workflow_id = session, workflow_id
+        return self.fm_api_session
+
+    async def close(self):
+        """
+        Method to close the underlying connection pool
+        """
+        await self.authentication.fm_session.aclose()
+
+    async def __api_request(self, method: str, endpoint: str, payload=None, parameters=None, data=None, timeout=None, files=None,
+                            headers=None):
+        if self.fm_api_session is None:
+            await self.authenticate()
+        return await self.__send(method, endpoint, payload, parameters, data, timeout, files, headers)
+
+    async def __send(self, method: str, endpoint: str, payload=None, parameters=None, data=None, timeout=None, files=None,
+                     headers=None, session=None):
+        kwargs = {}
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        if isinstance(data, (str, bytes)):
+            kwargs['content'] = data
+        elif data is not None:
+            kwargs['data'] = data
+        if isinstance(parameters, dict):
+            parameters = {k: v for k, v in parameters.items() if v is not None}
+        async with self._semaphore:
+            resp = await (session or self.fm_api_session).request(method, endpoint, json=payload, params=parameters, files=files,
+                                                                  headers=headers, **kwargs)
+        resp.raise_for_status()
+        return resp
+
+    async def __stage_ids(self, ticket_id: str) -> tuple:
+        ticket_json = await self.pull_pp_ticket(ticket_id)
+        return get_stage_ids(ticket_json)
+
+    async def create_pp_ticket(self, request_body: dict) -> dict:
+        """
+        Method to create Policy Planner ticket
+        :param request_body: JSON body for ticket.
+        :return: JSON of ticket
+        """
+        await self.authenticate()
+        endpoint = self.endpoints.url('create_pp_tkt_api_url', self.host, self.domain_id, self.workflow_id)
+        resp = await self.__api_request('POST', endpoint, request_body)
+        return resp.json()
+
+    async def siql_query_pp_ticket(self, siql_query: str, page_size: int, page=0) -> dict:
+        """
+        Method to execute a SIQL Query to search for Policy Planner tickets
+        :param siql_query: SIQL query
+        :param page_size: Number of results to return
+        :param page: Page of results to return, starting at 0
+        :return: JSON of results
+        """
+        endpoint = self.endpoints.url('siql_query_pp_tkt_api', self.host, self.domain_id)
+        parameters = {'q': siql_query, 'pageSize': page_size, 'page': page, 'domainid': self.domain_id}
+        resp = await self.__api_request('GET', endpoint, None, parameters)
+        return resp.json()
+
+    def iter_siql(self, siql_query: str, page_size=100, prefetch=2, pages=False):
+        """
+        Method to iterate over every Policy Planner ticket matching a SIQL query, the next page is
+        fetched in the background while the current one is consumed
+        :param siql_query: SIQL query
+        :param page_size: Number of results per page, defaulted to 100
+        :param prefetch: Number of pages fetched ahead of the caller, defaulted to 2
+        :param pages: Yield whole page JSON instead of individual tickets, defaulted to False
+        :return: Async generator of tickets, or of page JSON when pages is True
+        """
+        page_iter = aiter_siql_pages(lambda page: self.siql_query_pp_ticket(siql_query, page_size, page), page_size, prefetch)
+        return page_iter if pages else aiter_siql_records(page_iter)
+
+    async def update_pp_ticket(self, ticket_id: str, request_body: dict):
+        """
+        Method to update Policy Planner ticket
+        :param ticket_id: Ticket ID
+        :param request_body: JSON body for ticket update
+        :return: Response object
+        """
+        await self.authenticate()
+        endpoint = self.endpoints.url('update_pp_tkt_api_url', self.host, self.domain_id, self.workflow_id, ticket_id)
+        resp = await self.__api_request('PUT', endpoint, request_body)
+        return resp
+
+    async def pull_pp_ticket(self, ticket_id: str) -> dict:
+        """
+        Method to retrieve Policy Planner ticket
+        :param ticket_id: ID of ticket
+        :return: JSON of ticket
+        """
+        await self.authenticate()
+        endpoint = self.endpoints.url('pull_pp_tkt_api_url', self.host, self.domain_id, self.workflow_id, ticket_id)
+        resp = (await self.__api_request('GET', endpoint)).json()
+        self.workflow_task_id, self.workflow_packet_task_id = get_stage_ids(resp)
+        return resp
+
+    async def pull_pp_ticket_attachments(self, ticket_id: str, page_size=100) -> dict:
+        """
+        Method to retrieve Policy Planner ticket attachments
+        :param ticket_id: ID of ticket
+        :param page_size: # of Results
+        :return: JSON of attachments
+        """
+        await self.authenticate()
+        endpoint = self.endpoints.url('get_attachments_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id, page_size)
+        resp = await self.__api_request('GET', endpoint)
+        return resp.json()
+
+    async def download_pp_ticket_attachment(self, ticket_id: str, attachment_id: str):
+        """
+        Method to download Policy Planner ticket attachments
+        :param ticket_id: ID of ticket
+        :param attachment_id: ID of attachment to download
+        :return: Response object
+        """
+        await self.authenticate()
+        endpoint = self.endpoints.url('download_attachment_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id, attachment_id)
+        resp = await self.__api_request('GET', endpoint)
+        return resp
+
+    async def pull_pp_ticket_events(self, ticket_id: str, page_size=100) -> dict:
+        """
+        Method to retrieve Policy Planner ticket history events
+        :param ticket_id: ID of ticket
+        :param page_size: Number of results to retrieve
+        :return: JSON of results
+        """
+        await self.authenticate()
+        endpoint = self.endpoints.url('get_events_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id, page_size)
+        resp = await self.__api_request('GET', endpoint)
+        return resp.json()
+
+    async def assign_pp_ticket(self, ticket_id: str, user_id: str):
+        """
+        Method to assign user to Policy Planner ticket
+        :param ticket_id: ID of ticket
+        :param user_id: ID of user
+        :return: Response object
+        """
+        workflow_task_id, workflow_packet_task_id = await self.__stage_ids(ticket_id)
+        endpoint = self.endpoints.url('assign_pp_tkt_api_url', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id, workflow_packet_task_id)
+        resp = await self.__api_request('PUT', endpoint, None, None, user_id, headers={'Content-Type': 'text/plain'})
+        return resp
+
+    async def unassign_pp_ticket(self, ticket_id: str):
+        """
+        Method to unassign user from Policy Planner ticket
+        :param ticket_id: ID of ticket
+        :return: Response object
+        """
+        workflow_task_id, workflow_packet_task_id = await self.__stage_ids(ticket_id)
+        endpoint = self.endpoints.url('unassign_pp_tkt_api_url', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id, workflow_packet_task_id)
+        resp = await self.__api_request('PUT', endpoint)
+        return resp
+
+    async def add_req_pp_ticket(self, ticket_id: str, req_json: dict):
+        """
+        Method to add requirement to Policy Planner ticket
+        :param ticket_id: ID of ticket
+        :param req_json: Requirement JSON
+        :return: Response object
+        """
+        workflow_task_id, _ = await self.__stage_ids(ticket_id)
+        endpoint = self.endpoints.url('add_req_pp_tkt_api_url', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id)
+        resp = await self.__api_request('POST', endpoint, req_json)
+        return resp
+
+    async def replace_req_pp_ticket(self, ticket_id: str, req_json: dict):
+        """
+        Method to replace all requirements on Policy Planner ticket
+        :param ticket_id: ID of ticket
+        :param req_json: Requirement JSON
+        :return: Response object
+        """
+        workflow_task_id, _ = await self.__stage_ids(ticket_id)
+        endpoint = self.endpoints.url('replace_req_pp_tkt_api_url', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id)
+        resp = await self.__api_request('POST', endpoint, req_json)
+        return resp
+
+    async def complete_task_pp_ticket(self, ticket_id: str, button_action: str, timeout=None):
+        """
+        Method to complete Policy Planner ticket task
+        :param ticket_id: Ticket ID
+        :param button_action: button value as string, options are: submit, complete, autoDesign, verify, approved
+        :param timeout: Timeout amount in seconds, default to None
+        :return: Response object
+        """
+        workflow_task_id, workflow_packet_task_id = await self.__stage_ids(ticket_id)
+        endpoint = self.endpoints.url('comp_task_pp_tkt_api', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id, workflow_packet_task_id, button_action)
+        resp = await self.__api_request('PUT', endpoint, {}, None, None, timeout)
+        return resp
+
+    async def do_pca(self, ticket_id: str, control_types: str, enable_risk_sa: str, timeout=None):
+        """
+        Method to run Pre-Change Assessment for Policy Planner ticket changes
+        :param ticket_id: Ticket ID
+        :param control_types: Control types as comma delimited string, see PolicyPlannerApis.do_pca for options
+        :param enable_risk_sa: true or false
+        :param timeout: Timeout amount in seconds, default to None
+        :return: Response object
+        """
+        await self.authenticate()
+        controls_formatted = parse_controls(control_types)
+        endpoint = self.endpoints.url('run_pca_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id, controls_formatted, enable_risk_sa)
+        resp = await self.__api_request('POST', endpoint, None, None, None, timeout)
+        return resp
+
+    async def retrieve_pca(self, ticket_id: str) -> dict:
+        """
+        Method to retrieve Pre-Change Assessment results for Policy Planner ticket
+        :param ticket_id: Ticket ID as string
+        :return: JSON response of PCA
+        """
+        await self.authenticate()
+        endpoint = self.endpoints.url('get_pca_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id)
+        resp = await self.__api_request('GET', endpoint)
+        return resp.json()
+
+    async def run_pca(self, ticket_id: str, control_types: str, enable_risk_sa: str) -> dict:
+        """
+        Method to run and retrieve Pre-Change Assessment results for Policy Planner ticket
+        :param ticket_id: Ticket ID
+        :param control_types: Control types as comma delimited string, see PolicyPlannerApis.do_pca for options
+        :param enable_risk_sa: true or false
+        :return: JSON response of PCA
+        """
+        await self.do_pca(ticket_id, control_types, enable_risk_sa)
+        return await self.retrieve_pca(ticket_id)
+
+    async def stage_attachment(self, file_name: str, f) -> dict:
+        """
+        Method to stage attachment to Policy Planner ticket
+        :param file_name: File Name
+        :param f: file stream
+        :return: JSON response
+        """
+        await self.authenticate()
+        endpoint = self.endpoints.url('stage_att_pp_tkt_api', self.host, self.domain_id, self.workflow_id)
+        resp = await self.__api_request('POST', endpoint, None, None, None, None, {file_name: f}, headers={'Content-Type': 'multipart/form-data'})
+        return resp.json()
+
+    async def post_attachment(self, ticket_id: str, attachment_json: dict) -> dict:
+        """
+        Method to post attachment to Policy Planner ticket
+        :param ticket_id: ID of ticket
+        :param attachment_json: staged file JSON
+        :return: JSON response
+        """
+        await self.authenticate()
+        endpoint = self.endpoints.url('post_att_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id)
+        resp = await self.__api_request('PUT', endpoint, attachment_json)
+        return resp.json()
+
+    async def add_attachment(self, ticket_id: str, file_name: str, f, description: str):
+        """
+        Method to add attachment to Policy Planner ticket
+        :param ticket_id: ID of ticket
+        :param file_name: File name
+        :param f: File stream
+        :param description: File description
+        """
+        attachment_staged = await self.stage_attachment(file_name, f)
+        attachment_staged['attachments'][0]['description'] = description
+        attachment_posted = await self.post_attachment(ticket_id, attachment_staged)
+        return attachment_posted
+
+    async def csv_req_upload(self, ticket_id: str, file_name: str, f, behavior="append"):
+        """
+        Method to bulk CSV upload Policy Planner requirements
+        :param ticket_id: ID of ticket
+        :param file_name: File name
+        :param f: File stream
+        :param behavior: Add requirement behavior, either append or replace
+        """
+        await self.authenticate()
+        endpoint = self.endpoints.url('parse_csv_pp_tkt_api', self.host, self.domain_id, self.workflow_id)
+        resp = await self.__api_request('POST', endpoint, None, None, None, None, {file_name: f}, headers={'Content-Type': 'multipart/form-data'})
+        requirements_parsed = resp.json()
+        requirements_formatted = {'requirements': []}
+        for r in requirements_parsed['policyPlanRequirementErrorDTOs']:
+            requirements_formatted['requirements'].append(r['policyPlanRequirementDTO'])
+        if behavior == "replace":
+            post_req = await self.replace_req_pp_ticket(ticket_id, requirements_formatted)
+        else:
+            post_req = await self.add_req_pp_ticket(ticket_id, requirements_formatted)
+        f.seek(0)
+        await self.add_attachment(ticket_id, file_name, f, 'Attached original CSV file')
+        return post_req
+
+    async def get_reqs(self, ticket_id: str) -> dict:
+        """
+        Method to retrieve JSON object of Policy Planner ticket requirements
+        :param ticket_id: Ticket ID
+        :return: JSON of requirements
+        """
+        workflow_task_id, _ = await self.__stage_ids(ticket_id)
+        endpoint = self.endpoints.url('get_recs_pp_tkt_api', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id)
+        resp = await self.__api_request('GET', endpoint)
+        return resp.json()
+
+    async def get_changes(self, ticket_id: str) -> dict:
+        """
+        Method to retrieve JSON of changes for a Policy Planner ticket
+        :param ticket_id: Ticket ID
+        :return: JSON of changes
+        """
+        workflow_task_id, _ = await self.__stage_ids(ticket_id)
+        endpoint = self.endpoints.url('get_pp_tkt_changes', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id)
+        resp = await self.__api_request('GET', endpoint)
+        return resp.json()
+
+    async def del_all_reqs(self, ticket_id: str) -> dict:
+        """
+        Method to delete all requirements for a Policy Planner ticket, deletes are sent concurrently
+        :param ticket_id: Ticket ID as string
+        :return: dictionary of response codes
+        """
+        workflow_task_id, _ = await self.__stage_ids(ticket_id)
+        endpoint = self.endpoints.url('get_recs_pp_tkt_api', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id)
+        req_json = (await self.__api_request('GET', endpoint)).json()
+        req_ids = [r['id'] for r in req_json['results']]
+        endpoints = [self.endpoints.url('del_recs_pp_tkt_api', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id, str(r))
+                     for r in req_ids]
+        responses = await asyncio.gather(*(self.__api_request('DELETE', e) for e in endpoints))
+        return {r: resp.status_code for r, resp in zip(req_ids, responses)}
+
+    async def approve_req(self, ticket_id: str, req_id: str):
+        """
+        Method to approve a Policy Planner requirement
+        :param ticket_id: ID of ticket
+        :param req_id: ID of requirement
+        :return: Response object
+        """
+        await self.authenticate()
+        endpoint = self.endpoints.url('app_req_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id, req_id)
+        resp = await self.__api_request('PUT', endpoint, {})
+        return resp
+
+    async def add_change(self, ticket_id: str, req_id: str, change: dict) -> tuple:
+        """
+        Method to add change to a Policy Planner requirement
+        :param ticket_id: ID of ticket
+        :param req_id: ID of requirement
+        :param change: JSON of change
+        :return: Response code, reason, JSON as tuple
+        """
+        workflow_task_id, _ = await self.__stage_ids(ticket_id)
+        endpoint = self.endpoints.url('add_change_pp_tkt_api', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id, req_id)
+        resp = await self.__api_request('POST', endpoint, change)
+        return resp.status_code, resp.reason_phrase, resp.json()
+
+    async def update_change(self, ticket_id: str, req_id: str, change_id: str, change_json: dict):
+        """
+        Method to update a change on a Policy Planner requirement
+        :param ticket_id: ID of ticket
+        :param req_id: ID of requirement
+        :param change_id: ID of change
+        :param change_json: JSON of change
+        :return: Response object
+        """
+        workflow_task_id, _ = await self.__stage_ids(ticket_id)
+        endpoint = self.endpoints.url('update_pp_tkt_change', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id, req_id, change_id)
+        resp = await self.__api_request('PUT', endpoint, change_json)
+        return resp
+
+    async def add_comment(self, ticket_id: str, comment: str):
+        """
+        Method to add comment to Policy Planner ticket
+        :param ticket_id: Ticket ID
+        :param comment: Comment string
+        """
+        await self.authenticate()
+        endpoint = self.endpoints.url('add_comment_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id)
+        resp = await self.__api_request('POST', endpoint, {'comment': comment})
+        return resp
+
+    async def get_comments(self, ticket_id: str) -> dict:
+        """
+        Method to retrieve comments from Policy Planner ticket
+        :param ticket_id: Ticket ID
+        :return: Comment JSON
+        """
+        await self.authenticate()
+        endpoint = self.endpoints.url('get_comments_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id)
+        resp = await self.__api_request('GET', endpoint)
+        return resp.json()
+
+    async def del_comment(self, ticket_id: str, comment_id: str):
+        """
+        Method to delete Policy Planner ticket comment
+        :param ticket_id: Ticket ID
+        :param comment_id: Comment ID
+        """
+        await self.authenticate()
+        endpoint = self.endpoints.url('del_comment_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id, comment_id)
+        resp = await self.__api_request('DELETE', endpoint)
+        return resp
+
+    async def logout(self):
+        """
+        Method to logout of session
+        """
+        endpoint = self.endpoints.url('logout_api_url', self.host)
+        resp = await self.__api_request('POST', endpoint, headers={'Connection': 'Close'})
+        return resp
+
+    def get_workflow_packet_task_id(self, ticket_json: dict):
+        """
+        Retrieves workflowPacketTaskId value from current stage of provided ticket
+        :param ticket_json: JSON of ticket, retrieved using pull_pp_ticket function
+        """
+        self.workflow_packet_task_id = get_stage_ids(ticket_json)[1]
+
+    def get_workflow_task_id(self, ticket_json: dict):
+        """
+        Retrieves workflowTaskId value from current stage of provided ticket
+        :param ticket_json: JSON of ticket, retrieved using pull_pp_ticket function
+        """
+        self.workflow_task_id = get_stage_ids(ticket_json)[0]
+
+    async def get_workflow_id_by_workflow_name(self, domain_id: str, workflow_name: str) -> str:
+        """ Takes domainId and workflow name as input parameters and returns you
+            the workflowId for given workflow name, or None when there is no such workflow """
+        await self.authenticate()
+        return await self.__find_workflow_id(domain_id, workflow_name)
+
+    async def __find_workflow_id(self, domain_id: str, workflow_name: str, session=None) -> str:
+        async def fetch(endpoint, parameters):
+            return (await self.__send('GET', endpoint, None, parameters, session=session)).json()
+
+        endpoint = self.endpoints.url(WORKFLOW_ENDPOINTS['policyplanner'], self.host, domain_id)
+        return await self.workflow_cache.resolve_async(self.host, 'policyplanner', domain_id, workflow_name,
+                                                       lambda: load_workflows_async(fetch, endpoint))
@@ -0,0 +1,321 @@
+import asyncio
+import time
+import authenticate_user
+from security_manager_apis.endpoints import get_endpoint_registry
+from security_manager_apis.siql_pager import aiter_siql_pages, aiter_siql_records
+from security_manager_apis.security_manager import verify_route_json, iter_route_rows, RouteResult, RouteImportReport
+
+
+class AsyncSecurityManagerApis:
+
+    def __init__(self, host: str, username: str, password: str, verify_ssl: bool, domain_id: str, suppress_ssl_warning=False,
+                 max_concurrency=10, token_cache=None):
+        """
+        Async counterpart of SecurityManagerApis. Authentication happens once, on first use or on entering
+        the client as an async context manager.
+        :param host: Base URL
+        :param username: Username
+        :param password: Password
+        :param verify_ssl: Verify SSL (True or False)
+        :param domain_id: Domain ID, typically 1
+        :param suppress_ssl_warning: Kept for parity with SecurityManagerApis, httpx does not emit SSL warnings
+        :param max_concurrency: Maximum number of requests in flight at once, defaulted to 10
+        :param token_cache: MemoryTokenCache or FileTokenCache used to reuse a login, defaulted to None
+        """
+        self.endpoints = get_endpoint_registry()
+        self.host = host
+        self.domain_id = domain_id
+        self.max_concurrency = max_concurrency
+        self.authentication = authenticate_user.AsyncAuthentication(self.host, username, password, verify_ssl, max_concurrency, token_cache)
+        self.fm_api_session = None
+        self._auth_lock = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        await self.authenticate()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def authenticate(self):
+        """
+        Method to log in, only the first call performs the login
+        :return: Authenticated httpx.AsyncClient
+        """
+        if self._auth_lock is None:
+            self._auth_lock = asyncio.Lock()
+        async with self._auth_lock:
+            if self.fm_api_session is None:
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                self.fm_api_session = await self.authentication.get_auth_token()
+        return self.fm_api_session
+
+    async def close(self):
+        """
+        Method to close the underlying connection pool
+        """
+        await self.authentication.fm_session.aclose()
+
+    async def __api_request(self, method: str, endpoint: str, payload=None, parameters=None, data=None, timeout=None, files=None,
+                            headers=None):
+        if self.fm_api_session is None:
+            await self.authenticate()
+        kwargs = {}
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        if isinstance(data, (str, bytes)):
+            kwargs['content'] = data
+        elif data is not None:
+            kwargs['data'] = data
+        if isinstance(parameters, dict):
+            parameters = {k: v for k, v in parameters.items() if v is not None}
+        async with self._semaphore:
+            resp = await self.fm_api_session.request(method, endpoint, json=payload, params=parameters, files=files, headers=headers,
+                                                     **kwargs)
+        resp.raise_for_status()
+        return resp
+
+    async def get_devices(self) -> dict:
+        """
+        Method to retrieve devices from Security Manager
+        """
+        endpoint = self.endpoints.url('get_dev_sm_api', self.host, self.domain_id)
+        resp = await self.__api_request('GET', endpoint)
+        return resp.json()
+
+    async def manual_device_retrieval(self, device_id: str):
+        """
+        Method to execute manual device retrieval
+        :device_id: Device ID
+        :return: Response object
+        """
+        endpoint = self.endpoints.url('man_ret_dev_sm_api', self.host, self.domain_id, device_id)
+        resp = await self.__api_request('POST', endpoint, {})
+        return resp
+
+    async def siql_query(self, query_type: str, query: str, page_size: int, page=0) -> dict:
+        """
+        Method to execute SIQL query of Security Manager objects
+        :param query_type: What type of object to query. Options are: secrule, policy, serviceobj, networkobj, device
+        :param query: SIQL query to run
+        :param page_size: Number of results to return
+        :param page: Page of results to return, starting at 0
+        :return: JSON of results
+        """
+        endpoint = self.endpoints.url('siql_query_sm_api', self.host, query_type)
+        parameters = {'q': query, 'pageSize': page_size, 'page': page}
+        resp = await self.__api_request('GET', endpoint, None, parameters)
+        return resp.json()
+
+    def iter_siql(self, query_type: str, query: str, page_size=100, prefetch=2, pages=False):
+        """
+        Method to iterate over every result of a SIQL query of Security Manager objects, the next page is
+        fetched in the background while the current one is consumed
+        :param query_type: What type of object to query. Options are: secrule, policy, serviceobj, networkobj, device
+        :param query: SIQL query to run
+        :param page_size: Number of results per page, defaulted to 100
+        :param prefetch: Number of pages fetched ahead of the caller, defaulted to 2
+        :param pages: Yield whole page JSON instead of individual records, defaulted to False
+        :return: Async generator of records, or of page JSON when pages is True
+        """
+        page_iter = aiter_siql_pages(lambda page: self.siql_query(query_type, query, page_size, page), page_size, prefetch)
+        return page_iter if pages else aiter_siql_records(page_iter)
+
+    async def create_device_group(self, device_group_name: str):
+        """
+        Method to create device group in Security Manager
+        :param device_group_name: name of device group
+        :return: Response object
+        """
+        endpoint = self.endpoints.url('create_device_group', self.host, self.domain_id)
+        payload = {'name': device_group_name, 'domainId': self.domain_id}
+        resp = await self.__api_request('POST', endpoint, payload)
+        return resp
+
+    async def add_to_device_group(self, device_group_id: str, device_id: str):
+        """
+        Method to add device to device group
+        :param device_group_id: ID of Device Group
+        :param device_id: Device ID
+        :return: Response object
+        """
+        endpoint = self.endpoints.url('add_device_to_group', self.host, self.domain_id, device_group_id, device_id)
+        resp = await self.__api_request('POST', endpoint)
+        return resp
+
+    async def get_device_group_by_name(self, device_group_name: str):
+        """
+        Method to retrieve device group by name
+        :param device_group_name: Name of Device Group
+        :return: Response object
+        """
+        endpoint = self.endpoints.url('get_device_group_name', self.host, self.domain_id, device_group_name)
+        resp = await self.__api_request('GET', endpoint)
+        return resp
+
+    async def zone_search(self, device_id: str, page_size: int) -> dict:
+        """
+        Method to retrieve zones for device
+        :param device_id: Device ID
+        :param page_size: Number of results to return
+        :return: JSON of results
+        """
+        endpoint = self.endpoints.url('zone_search_sm_api', self.host, self.domain_id, device_id)
+        parameters = {'pageSize': page_size}
+        resp = await self.__api_request('GET', endpoint, None, parameters)
+        return resp.json()
+
+    async def get_fw_obj(self, obj_type: str, device_id: str, match_id: str) -> dict:
+        """
+        Method to retrieve firewall object JSON
+        :param obj_type: Type of firewall object. Options: NETWORK, SERVICE, ZONE, APP, PROFILE, SCHEDULE, URL_MATCHER, USER
+        :param device_id: Device ID
+        :param match_id: Match ID of targeted object
+        :return: Firewall object JSON
+        """
+        endpoint = self.endpoints.url('fw_obj_sm_api', self.host, obj_type, device_id, match_id)
+        resp = await self.__api_request('GET', endpoint)
+        return resp.json()
+
+    async def get_device_obj(self, device_id: str) -> dict:
+        """
+        Method to retrieve device object JSON
+        :param device_id: Device ID
+        :return: Device object JSON
+        """
+        endpoint = self.endpoints.url('dev_obj_sm_api', self.host, self.domain_id, device_id)
+        resp = await self.__api_request('GET', endpoint)
+        return resp.json()
+
+    async def add_supp_route(self, device_id: str, supplemental_route: dict):
+        """
+        Method to add Supplemental Route to Device
+        :param device_id: ID of device
+        :param supplemental_route: JSON of Supplemental Route
+        :return: Response object
+        """
+        verify_route_json(supplemental_route)
+        endpoint = self.endpoints.url('supp_route_sm_api', self.host, device_id)
+        resp = await self.__api_request('POST', endpoint, supplemental_route)
+        return resp
+
+    async def get_rule_doc(self, device_id: str, rule_id: str) -> dict:
+        """
+        Method to retrieve rule documentation
+        :param device_id: ID of device
+        :param rule_id: ID of rule
+        :return: JSON response
+        """
+        endpoint = self.endpoints.url('get_rule_doc', self.host, self.domain_id, device_id, rule_id)
+        resp = await self.__api_request('GET', endpoint)
+        return resp.json()
+
+    async def update_rule_doc(self, device_id: str, rule_doc: dict):
+        """
+        Method to update rule documentation
+        :param device_id: ID of device
+        :param rule_doc: Rule Doc JSON
+        :return: Response object
+        """
+        endpoint = self.endpoints.url('update_rule_doc', self.host, self.domain_id, device_id)
+        resp = await self.__api_request('PUT', endpoint, rule_doc)
+        return resp
+
+    async def get_all_users(self, page_size=20) -> dict:
+        """
+        Method to retrieve all users
+        :param page_size: Number of results, defaulted to 20
+        :return: JSON response
+        """
+        endpoint = self.endpoints.url('get_all_users', self.host, self.domain_id, page_size)
+        resp = await self.__api_request('GET', endpoint)
+        return resp.json()
+
+    async def get_user_by_username(self, username: str, page_size=20) -> dict:
+        """
+        Method to retrieve user by username
+        :param username: Username to search for
+        :param page_size: Number of results, defaulted to 20
+        :return: JSON response
+        """
+        endpoint = self.endpoints.url('user_by_username', self.host, self.domain_id, page_size, username)
+        resp = await self.__api_request('GET', endpoint)
+        return resp.json()
+
+    async def get_user_groups(self, page_size=20) -> dict:
+        """
+        Method to retrieve all user groups
+        :param page_size: Number of results, defaulted to 20
+        :return: JSON response
+        """
+        endpoint = self.endpoints.url('get_user_groups', self.host, self.domain_id, page_size)
+        resp = await self.__api_request('GET', endpoint)
+        return resp.json()
+
+    async def get_users_in_user_group(self, user_group_id: str, page_size=20) -> dict:
+        """
+        Method to retrieve all users in a user group
+        :param user_group_id: ID of user group to query
+        :param page_size: Number of results, defaulted to 20
+        :return: JSON response
+        """
+        endpoint = self.endpoints.url('get_users_in_user_groups', self.host, self.domain_id, user_group_id, page_size)
+        resp = await self.__api_request('GET', endpoint)
+        return resp.json()
+
+    async def add_user_to_user_group(self, user_group_id: str, user_id: str):
+        """
+        Method to add user to user group
+        :param user_group_id: ID of user group to add user to
+        :param user_id: ID of user to add to user group
+        :return: Response object
+        """
+        endpoint = self.endpoints.url('assign_to_user_group', self.host, self.domain_id, user_group_id, user_id)
+        resp = await self.__api_request('POST', endpoint)
+        return resp
+
+    async def logout(self):
+        """
+        Method to logout of current session
+        """
+        endpoint = self.endpoints.url('logout_api_url', self.host)
+        resp = await self.__api_request('POST', endpoint, headers={'Connection': 'Close'})
+        return resp
+
+    async def bulk_add_supp_route(self, f, dry_run=False, on_result=None) -> RouteImportReport:
+        """
+        Bulk adding Supplemental Routes via formatted text file. The file is streamed, every line is validated
+        before it is queued and valid routes are posted concurrently up to max_concurrency.
+        :param f: file stream
+        :param dry_run: Only validate the file without posting any route, defaulted to False
+        :param on_result: Optional callable receiving each RouteResult as soon as it completes
+        :return: RouteImportReport with a RouteResult per line and throughput stats
+        """
+        report = RouteImportReport()
+        pending = set()
+        for result in iter_route_rows(f):
+            if result.error is not None or dry_run:
+                report.add(result, on_result)
+                continue
+            if len(pending) >= self.max_concurrency * 2:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    report.add(task.result(), on_result)
+            pending.add(asyncio.ensure_future(self.__post_route(result)))
+        for task in asyncio.as_completed(pending):
+            report.add(await task, on_result)
+        return report.finish()
+
+    async def __post_route(self, result: RouteResult) -> RouteResult:
+        start = time.perf_counter()
+        try:
+            resp = await self.add_supp_route(result.device_id, result.route)
+            result.status_code, result.reason = resp.status_code, resp.reason_phrase
+        except Exception as e:
+            response = getattr(e, 'response', None)
+            if response is not None:
+                result.status_code, result.reason = response.status_code, response.reason_phrase
+            result.error = f'{type(e).__name__}: {e}'
+        result.latency = time.perf_counter() - start
+        return result
@@ -0,0 +1,256 @@
+""" Streaming upload and resumable download of Policy Planner ticket attachments """
+import io
+import os
+import re
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+
+CHUNK_SIZE = 1024 * 1024
+# Bytes of a spooled upload kept in memory before it moves to a temporary file
+SPOOL_SIZE = 8 * 1024 * 1024
+
+
+def _file_size(f):
+    """
+    Bytes left in a file object from its current position, or None when it cannot be told, e.g. for pipes.
+    Text streams count characters rather than encoded bytes, so their size is never told either
+    """
+    if isinstance(f, io.TextIOBase):
+        return None
+    try:
+        if hasattr(f, 'seekable') and not f.seekable():
+            return None
+        position = f.tell()
+        end = f.seek(0, os.SEEK_END)
+        f.seek(position)
+        return end - position
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def spool(f, max_size=SPOOL_SIZE, chunk_size=CHUNK_SIZE):
+    """
+    Method to read a stream once into a buffer that can be read again, so it can be sent more than once
+    :param f: File stream, text or binary, may be a pipe or any object with a read method
+    :param max_size: Bytes kept in memory before the buffer moves to a temporary file, defaulted to 8 MiB
+    :param chunk_size: Bytes read per chunk, defaulted to 1 MiB
+    :return: SpooledTemporaryFile rewound to its start, the caller closes it
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=max_size)
+    try:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            buffer.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        buffer.seek(0)
+    except BaseException:
+        buffer.close()
+        raise
+    return buffer
+
+
+class MultipartStream:
+    """
+    multipart/form-data body with a single file part, read from the file in chunks as it is sent. When the file
+    size is known the body has a length and is sent with Content-Length, otherwise it is sent chunked.
+    """
+
+    def __init__(self, field_name: str, file_name: str, f, content_type='application/octet-stream', chunk_size=CHUNK_SIZE):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+        self.chunk_size = chunk_size
+        self._file = f
+        size = _file_size(f)
+        self._start = f.tell() if size is not None else None
+        head = (f'--{self.boundary}\r\nContent-Disposition: form-data; name="{field_name}"; filename="{file_name}"\r\n'
+                f'Content-Type: {content_type}\r\n\r\n')
+        self._head = head.encode('utf-8')
+        self._tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        self._length = None if size is None else len(self._head) + size + len(self._tail)
+        self.__reset()
+
+    def __reset(self):
+        self._stage = 0
+        self._pending = self._head
+
+    @property
+    def len(self):
+        # Read by requests to set Content-Length, None sends the body chunked
+        return self._length
+
+    def seekable(self) -> bool:
+        return self._start is not None
+
+    def seek(self, offset: int, whence=os.SEEK_SET):
+        """
+        Rewinding to the start so the body can be sent again, only offset 0 is supported
+        """
+        if offset != 0 or whence != os.SEEK_SET or self._start is None:
+            raise OSError('MultipartStream can only be rewound to its start')
+        self._file.seek(self._start)
+        self.__reset()
+        return 0
+
+    def read(self, size=-1) -> bytes:
+        if size is None or size < 0:
+            return b''.join(iter(lambda: self.read(self.chunk_size), b''))
+        out = []
+        wanted = size
+        while wanted > 0 and self._stage < 3:
+            if not self._pending:
+                if self._stage == 1:
+                    chunk = self._file.read(min(wanted, self.chunk_size))
+                    if chunk:
+                        if isinstance(chunk, str):
+                            chunk = chunk.encode('utf-8')
+                        self._pending = chunk
+                        continue
+                self._stage += 1
+                self._pending = self._tail if self._stage == 2 else b''
+                continue
+            piece, self._pending = self._pending[:wanted], self._pending[wanted:]
+            out.append(piece)
+            wanted -= len(piece)
+        return b''.join(out)
+
+    def __iter__(self):
+        return iter(lambda: self.read(self.chunk_size), b'')
+
+
+def write_response(resp, sink, chunk_size=CHUNK_SIZE, on_progress=None) -> int:
+    """
+    Method to copy a streamed response body to a writable sink chunk by chunk
+    :param resp: Response object requested with stream=True
+    :param sink: Object with a write method, e.g. a file opened in binary mode
+    :param chunk_size: Bytes read per chunk, defaulted to 1 MiB
+    :param on_progress: Callable receiving the number of bytes of each chunk, defaulted to None
+    :return: Number of bytes written
+    """
+    written = 0
+    for chunk in resp.iter_content(chunk_size):
+        if chunk:
+            sink.write(chunk)
+            written += len(chunk)
+            if on_progress is not None:
+                on_progress(len(chunk))
+    return written
+
+
+def download_to(open_stream, dest, resume=True, retries=3, chunk_size=CHUNK_SIZE, on_progress=None) -> int:
+    """
+    Method to download a body to a file path or sink, resuming with a Range request after an interrupted transfer
+    :param open_stream: Callable taking the headers of the request and returning a streamed Response object
+    :param dest: File path, or object with a write method
+    :param resume: Continue a partial file at dest instead of starting over, defaulted to True
+    :param retries: Number of times an interrupted transfer is resumed, defaulted to 3
+    :param chunk_size: Bytes read per chunk, defaulted to 1 MiB
+    :param on_progress: Callable receiving the number of bytes of each chunk, defaulted to None
+    :return: Size of the downloaded file in bytes
+    """
+    is_path = isinstance(dest, (str, os.PathLike))
+    if is_path:
+        offset = os.path.getsize(dest) if resume and os.path.exists(dest) else 0
+        sink = open(dest, 'ab' if offset else 'wb')
+        # Position the body starts at, a restart rewinds here
+        start = 0
+    else:
+        offset = 0
+        sink = dest
+        start = sink.tell() if hasattr(sink, 'seekable') and sink.seekable() else None
+    received = [offset]
+
+    def count(n):
+        received[0] += n
+        if on_progress is not None:
+            on_progress(n)
+
+    try:
+        attempt = 0
+        while True:
+            headers = {'Range': f'bytes={received[0]}-'} if received[0] else None
+            resp = None
+            try:
+                resp = open_stream(headers)
+                if resp.status_code == 416 and received[0]:
+                    # The partial file is already complete
+                    return received[0]
+                resp.raise_for_status()
+                if received[0] and resp.status_code != 206:
+                    # The server ignored the range, start over
+                    if start is None:
+                        raise Exception('Server does not support ranged downloads and the sink cannot be rewound')
+                    sink.seek(start)
+                    sink.truncate()
+                    received[0] = 0
+                write_response(resp, sink, chunk_size, count)
+                return received[0]
+            except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt >= retries:
+                    raise
+                attempt += 1
+            finally:
+                if resp is not None:
+                    resp.close()
+    finally:
+        if is_path:
+            sink.close()
+
+
+def attachment_file_names(attachments: list) -> dict:
+    """
+    Method to choose a local file name for every attachment of a ticket
+    :param attachments: Attachment JSON, from pull_pp_ticket_attachments
+    :return: Dictionary of attachment ID to file name, names used more than once are prefixed with the attachment ID
+    """
+    names = {}
+    for attachment in attachments:
+        name = attachment.get('name') or attachment.get('fileName') or str(attachment['id'])
+        # Only the last path component is kept so a name cannot point outside the target directory
+        names[str(attachment['id'])] = re.split(r'[\\/]', name)[-1] or str(attachment['id'])
+    counts = {}
+    for name in names.values():
+        counts[name] = counts.get(name, 0) + 1
+    return {attachment_id: f'{attachment_id}-{name}' if counts[name] > 1 else name for attachment_id, name in names.items()}
+
+
+class AttachmentDownload:
+    """ Outcome of the download of one attachment """
+
+    def __init__(self, attachment_id: str, path: str):
+        self.attachment_id = attachment_id
+        self.path = path
+        self.size = None
+        self.error = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        return f'AttachmentDownload(attachment_id={self.attachment_id!r}, path={self.path!r}, size={self.size}, error={self.error!r})'
+
+
+def download_all(download, targets: dict, workers=4) -> dict:
+    """
+    Method to download many attachments over a pool of worker threads
+    :param download: Callable taking an attachment ID and a path and returning the size written
+    :param targets: Dictionary of attachment ID to path
+    :param workers: Number of files downloaded in parallel
+    :return: Dictionary of attachment ID to AttachmentDownload, in the order of targets
+    """
+    results = {attachment_id: AttachmentDownload(attachment_id, path) for attachment_id, path in targets.items()}
+
+    def run(result):
+        try:
+            result.size = download(result.attachment_id, result.path)
+        except Exception as e:
+            result.error = f'{type(e).__name__}: {e}'
+
+    if results:
+        with ThreadPoolExecutor(max_workers=min(workers, len(results)), thread_name_prefix='pp-att') as executor:
+            for future in as_completed([executor.submit(run, r) for r in results.values()]):
+                future.result()
+    return results
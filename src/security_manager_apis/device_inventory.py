@@ -0,0 +1,203 @@
+""" Local index of Security Manager devices for lookups without a request per reference """
+import json
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _device_fields(device: dict) -> dict:
+    """
+    Method to extract the indexed fields of device JSON
+    :param device: Device JSON as returned by get_devices or get_device_obj
+    :return: Dictionary of id, name, management_ip, vendor, product and groups
+    """
+    device_pack = device.get('devicePack') or {}
+    groups = [g.get('name') for g in device.get('deviceGroups') or [] if g.get('name')]
+    return {
+        'id': str(device['id']),
+        'name': device.get('name'),
+        'management_ip': device.get('managementIp'),
+        'vendor': device_pack.get('vendor'),
+        'product': device_pack.get('deviceName'),
+        'groups': groups,
+    }
+
+
+class DeviceInventory:
+
+    def __init__(self, sm=None, include_zones=False, page_size=10000, workers=8):
+        """
+        In-memory index of devices by ID, name and management IP
+        :param sm: SecurityManagerApis used by refresh, defaulted to None for an inventory built from a snapshot
+        :param include_zones: Also load the zones of every device with zone_search, defaulted to False
+        :param page_size: Number of devices requested, defaulted to 10000
+        :param workers: Number of zone searches run in parallel, defaulted to 8
+        """
+        self.sm = sm
+        self.include_zones = include_zones
+        self.page_size = page_size
+        self.workers = workers
+        self._lock = threading.Lock()
+        self.__build([], {})
+
+    def __build(self, devices: list, zones: dict):
+        by_id = {}
+        by_name = {}
+        by_ip = {}
+        fields = {}
+        for device in devices:
+            f = _device_fields(device)
+            by_id[f['id']] = device
+            fields[f['id']] = f
+            if f['name']:
+                by_name.setdefault(f['name'].lower(), f['id'])
+            if f['management_ip']:
+                by_ip.setdefault(f['management_ip'], f['id'])
+        # Indexes are swapped in one step so readers never see a partial refresh
+        with self._lock:
+            self._devices, self._fields, self._by_name, self._by_ip = by_id, fields, by_name, by_ip
+            self._zones = {str(k): v for k, v in zones.items()}
+
+    def refresh(self, devices=None, zones=None):
+        """
+        Method to rebuild the index, from the server or from a snapshot
+        :param devices: List of device JSON to index, defaulted to None which loads every device with sm
+        :param zones: Dictionary of device ID to zone list for a snapshot, defaulted to None
+        :return: self
+        """
+        if devices is None:
+            if self.sm is None:
+                raise Exception('DeviceInventory needs a SecurityManagerApis to refresh from the server')
+            devices = list(self.sm.stream_devices(self.page_size))
+            if self.include_zones and zones is None:
+                zones = self.__load_zones([str(d['id']) for d in devices])
+        self.__build(devices, zones or {})
+        return self
+
+    def __load_zones(self, device_ids: list) -> dict:
+        def zone_search(device_id):
+            return device_id, self.sm.zone_search(device_id, self.page_size).get('results', [])
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='zones') as executor:
+            return dict(executor.map(zone_search, device_ids))
+
+    def get(self, device_id):
+        """
+        Method to retrieve device JSON by ID
+        :param device_id: Device ID
+        :return: Device JSON or None
+        """
+        return self._devices.get(str(device_id))
+
+    def by_name(self, name: str):
+        """
+        Method to retrieve device JSON by name, case-insensitive
+        :param name: Device name
+        :return: Device JSON or None
+        """
+        device_id = self._by_name.get(name.lower())
+        return self._devices.get(device_id) if device_id is not None else None
+
+    def by_ip(self, management_ip: str):
+        """
+        Method to retrieve device JSON by management IP
+        :param management_ip: Management IP of device
+        :return: Device JSON or None
+        """
+        device_id = self._by_ip.get(management_ip)
+        return self._devices.get(device_id) if device_id is not None else None
+
+    def resolve(self, reference):
+        """
+        Method to resolve a device ID, name or management IP to the device ID
+        :param reference: Device ID, name or management IP
+        :return: Device ID as string or None
+        """
+        reference = str(reference)
+        if reference in self._devices:
+            return reference
+        return self._by_name.get(reference.lower()) or self._by_ip.get(reference)
+
+    def find(self, vendor=None, product=None, group=None, name_contains=None, predicate=None) -> list:
+        """
+        Method to filter devices, every given filter has to match
+        :param vendor: Vendor of device pack, case-insensitive
+        :param product: Device pack name, case-insensitive
+        :param group: Name of device group the device belongs to
+        :param name_contains: Substring of device name, case-insensitive
+        :param predicate: Callable taking device JSON and returning True to keep it
+        :return: List of device JSON
+        """
+        devices, fields = self._devices, self._fields
+        matches = []
+        for device_id, f in fields.items():
+            if vendor is not None and (f['vendor'] or '').lower() != vendor.lower():
+                continue
+            if product is not None and (f['product'] or '').lower() != product.lower():
+                continue
+            if group is not None and group not in f['groups']:
+                continue
+            if name_contains is not None and name_contains.lower() not in (f['name'] or '').lower():
+                continue
+            if predicate is not None and not predicate(devices[device_id]):
+                continue
+            matches.append(devices[device_id])
+        return matches
+
+    def zones(self, device_id) -> list:
+        """
+        Method to retrieve the zones of a device, loaded when include_zones is True
+        :param device_id: Device ID
+        :return: List of zone JSON
+        """
+        return self._zones.get(str(device_id), [])
+
+    def save(self, path: str):
+        """
+        Method to persist the inventory to a SQLite database, replacing its previous content
+        :param path: Path of database file
+        """
+        devices, fields, zones = self._devices, self._fields, self._zones
+        with sqlite3.connect(path) as db:
+            db.execute('CREATE TABLE IF NOT EXISTS devices (id TEXT PRIMARY KEY, name TEXT, management_ip TEXT, vendor TEXT, '
+                       'product TEXT, json TEXT NOT NULL)')
+            db.execute('CREATE TABLE IF NOT EXISTS zones (device_id TEXT PRIMARY KEY, json TEXT NOT NULL)')
+            db.execute('CREATE INDEX IF NOT EXISTS devices_name ON devices (name COLLATE NOCASE)')
+            db.execute('CREATE INDEX IF NOT EXISTS devices_ip ON devices (management_ip)')
+            db.execute('DELETE FROM devices')
+            db.execute('DELETE FROM zones')
+            db.executemany('INSERT INTO devices VALUES (?, ?, ?, ?, ?, ?)',
+                           ((i, f['name'], f['management_ip'], f['vendor'], f['product'], json.dumps(devices[i])) for i, f in fields.items()))
+            db.executemany('INSERT INTO zones VALUES (?, ?)', ((i, json.dumps(z)) for i, z in zones.items()))
+        db.close()
+
+    def load(self, path: str):
+        """
+        Method to rebuild the inventory from a SQLite database written by save
+        :param path: Path of database file
+        :return: self
+        """
+        with sqlite3.connect(path) as db:
+            devices = [json.loads(row[0]) for row in db.execute('SELECT json FROM devices')]
+            zones = {row[0]: json.loads(row[1]) for row in db.execute('SELECT device_id, json FROM zones')}
+        db.close()
+        return self.refresh(devices, zones)
+
+    @classmethod
+    def from_sqlite(cls, path: str, sm=None):
+        """
+        Method to build an inventory from a SQLite database written by save
+        :param path: Path of database file
+        :param sm: Optional SecurityManagerApis for later refreshes
+        :return: DeviceInventory
+        """
+        return cls(sm).load(path)
+
+    def __contains__(self, reference):
+        return self.resolve(reference) is not None
+
+    def __iter__(self):
+        return iter(list(self._devices.values()))
+
+    def __len__(self):
+        return len(self._devices)
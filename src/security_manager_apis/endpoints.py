@@ -0,0 +1,186 @@
+""" Registry of REST endpoint templates, parsed once per process and shared by every API client """
+import os
+import re
+import string
+import threading
+from configparser import ConfigParser
+from security_manager_apis.get_properties_data import initfile
+
+# Environment variable naming a properties file whose [REST] entries replace the packaged ones
+OVERRIDES_ENV = 'FIREMON_ENDPOINTS_FILE'
+
+# Path segments whose field is not simply named <segment>_id
+_SEGMENT_NAMES = {'id': 'id', 'name': 'name', 'siql': 'query_type', 'firewallobject': 'object_type', 'users': 'user_id'}
+
+
+def _snake_case(token: str) -> str:
+    return re.sub(r'(?<!^)(?=[A-Z])', '_', token).replace('-', '_').lower()
+
+
+def _field_name(prefix: str) -> str:
+    """
+    Naming a positional field after the text in front of it
+    :param prefix: Template text up to the field
+    :return: host for the leading field, the query key for query values, query for a whole query string, otherwise <segment>_id
+    """
+    if not prefix:
+        return 'host'
+    if prefix.endswith('?') or prefix.endswith('&'):
+        return 'query'
+    token = re.split(r'[/?&]', prefix.rstrip('/='))[-1]
+    if prefix.endswith('='):
+        return _snake_case(token)
+    return _SEGMENT_NAMES.get(token, _snake_case(token) + '_id')
+
+
+class EndpointURL(str):
+    """ URL that remembers the properties key it was built from, used to label metrics """
+    key = None
+
+
+class Endpoint:
+    """ Precompiled URL template accepting its fields positionally, in template order, or by name """
+
+    __slots__ = ('key', 'template', 'params', '_positional', '_named')
+
+    def __init__(self, key: str, template: str):
+        self.key = key
+        self.template = template
+        positional = []
+        named = []
+        params = []
+        for literal, field, _, _ in string.Formatter().parse(template):
+            literal = literal.replace('{', '{{').replace('}', '}}')
+            positional.append(literal)
+            named.append(literal)
+            if field is None:
+                continue
+            name = field or _field_name(''.join(named).replace('{{', '{').replace('}}', '}'))
+            while name in params:
+                name += '_'
+            params.append(name)
+            positional.append('{}')
+            named.append('{' + name + '}')
+        self.params = tuple(params)
+        self._positional = ''.join(positional)
+        self._named = ''.join(named)
+
+    def url(self, *args, **kwargs) -> str:
+        """
+        Method to build the URL of the endpoint
+        :param args: Field values in template order
+        :param kwargs: Field values by name, see params
+        :return: URL as string carrying the endpoint key
+        """
+        if kwargs:
+            if args:
+                kwargs.update(zip(self.params, args))
+            url = EndpointURL(self._named.format_map(kwargs))
+        else:
+            url = EndpointURL(self._positional.format(*args))
+        url.key = self.key
+        return url
+
+    __call__ = url
+
+    def __repr__(self):
+        return f'Endpoint({self.key!r}, {self.template!r})'
+
+
+class EndpointRegistry:
+    """ Endpoints by properties key, with runtime overrides """
+
+    def __init__(self, path=initfile):
+        """
+        :param path: Properties file with a [REST] section, defaulted to the packaged application.properties
+        """
+        self._endpoints = {}
+        self._lock = threading.Lock()
+        self.load(path)
+
+    def load(self, path: str):
+        """
+        Method to add or replace endpoints from a properties file with a [REST] section
+        :param path: Path of the properties file
+        """
+        parser = ConfigParser(interpolation=None)
+        if not parser.read(path):
+            raise Exception(f'Endpoint file {path} could not be read')
+        self.update(dict(parser.items('REST')))
+
+    def update(self, templates: dict):
+        """
+        Method to add or replace endpoints
+        :param templates: Properties key to URL template, fields may be positional {} or named {domain_id}
+        """
+        compiled = {key: Endpoint(key, template) for key, template in templates.items()}
+        with self._lock:
+            # Copy-on-write so readers never see a half-updated registry
+            endpoints = dict(self._endpoints)
+            endpoints.update(compiled)
+            self._endpoints = endpoints
+
+    def override(self, key: str, template: str):
+        """
+        Method to replace one endpoint for every client in the process
+        :param key: Properties key, e.g. pull_pp_tkt_api_url
+        :param template: URL template
+        """
+        self.update({key: template})
+
+    def get(self, key: str) -> Endpoint:
+        try:
+            return self._endpoints[key]
+        except KeyError:
+            raise Exception(f'Unknown endpoint {key}') from None
+
+    __getitem__ = get
+
+    def url(self, key: str, *args, **kwargs) -> str:
+        """
+        Method to build the URL of an endpoint
+        :param key: Properties key, e.g. pull_pp_tkt_api_url
+        :param args: Field values in template order
+        :param kwargs: Field values by name
+        :return: URL as string
+        """
+        return self.get(key).url(*args, **kwargs)
+
+    def to_parser(self) -> ConfigParser:
+        """
+        Method to build a ConfigParser with the current templates in a [REST] section, as get_properties_data returned
+        :return: ConfigParser
+        """
+        parser = ConfigParser(interpolation=None)
+        parser.read_dict({'REST': {key: endpoint.template for key, endpoint in self._endpoints.items()}})
+        return parser
+
+    def __contains__(self, key):
+        return key in self._endpoints
+
+    def __iter__(self):
+        return iter(self._endpoints)
+
+    def __len__(self):
+        return len(self._endpoints)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_endpoint_registry() -> EndpointRegistry:
+    """
+    Returning the registry shared by every client, built on first use from application.properties
+    and the file named by FIREMON_ENDPOINTS_FILE, if set
+    :return: EndpointRegistry
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                registry = EndpointRegistry()
+                if os.environ.get(OVERRIDES_ENV):
+                    registry.load(os.environ[OVERRIDES_ENV])
+                _registry = registry
+    return _registry
@@ -0,0 +1,108 @@
+""" Single authenticated, pooled session shared by every FireMon API client """
+import threading
+import requests
+import authenticate_user
+from security_manager_apis.endpoints import get_endpoint_registry
+from security_manager_apis.security_manager import SecurityManagerApis
+from security_manager_apis.policy_planner import PolicyPlannerApis
+from security_manager_apis.policy_optimizer import PolicyOptimizerApis
+from security_manager_apis.orchestration_apis import OrchestrationApis
+
+
+class FireMonClient:
+
+    def __init__(self, host: str, username: str, password: str, verify_ssl: bool, domain_id: str, suppress_ssl_warning=False,
+                 pool_connections=10, pool_maxsize=10, token_cache=None, scheduler=None, metrics=None,
+                 recorder=None):
+        """
+        Owns one keep-alive connection pool and one authentication token, and hands out product API
+        clients that all share them. Logging in happens once, on the first API call.
+        :param host: Base URL
+        :param username: Username
+        :param password: Password
+        :param verify_ssl: Verify SSL (True or False)
+        :param domain_id: Domain ID, typically 1
+        :param suppress_ssl_warning: Suppress SSL warning (True or False), default to False
+        :param pool_connections: Number of connection pools to cache, defaulted to 10
+        :param pool_maxsize: Maximum number of keep-alive connections, size this to the number of worker threads
+        :param token_cache: MemoryTokenCache or FileTokenCache used to reuse a login, defaulted to None
+        :param scheduler: AdaptiveScheduler pacing the requests of every client handed out, defaulted to None
+        :param metrics: RequestMetrics recording the requests of every client handed out, defaulted to None
+        :param recorder: TrafficRecorder capturing the requests of every client handed out, defaulted to None
+        """
+        if suppress_ssl_warning:
+            requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
+        self.endpoints = get_endpoint_registry()
+        self.host = host
+        self.username = username
+        self.verify_ssl = verify_ssl
+        self.domain_id = domain_id
+        self.authentication = authenticate_user.Authentication(self.host, username, password, verify_ssl, pool_connections, pool_maxsize, token_cache,
+                                                               scheduler=scheduler, metrics=metrics, recorder=recorder)
+        self.fm_api_session = self.authentication.get_auth_token()
+        self._views = {}
+        self._views_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __view(self, key: tuple, factory):
+        with self._views_lock:
+            if key not in self._views:
+                self._views[key] = factory()
+            return self._views[key]
+
+    def security_manager(self) -> SecurityManagerApis:
+        """
+        Method to retrieve the Security Manager client sharing this session
+        :return: SecurityManagerApis
+        """
+        return self.__view(('sm',), lambda: SecurityManagerApis(self.host, self.username, None, self.verify_ssl, self.domain_id,
+                                                                 session=self.fm_api_session))
+
+    def policy_planner(self, workflow_name: str) -> PolicyPlannerApis:
+        """
+        Method to retrieve the Policy Planner client for a workflow sharing this session
+        :param workflow_name: Name of targeted workflow
+        :return: PolicyPlannerApis
+        """
+        return self.__view(('pp', workflow_name), lambda: PolicyPlannerApis(self.host, self.username, None, self.verify_ssl, self.domain_id,
+                                                                             workflow_name, session=self.fm_api_session))
+
+    def policy_optimizer(self, workflow_name: str) -> PolicyOptimizerApis:
+        """
+        Method to retrieve the Policy Optimizer client for a workflow sharing this session
+        :param workflow_name: Name of targeted workflow
+        :return: PolicyOptimizerApis
+        """
+        return self.__view(('po', workflow_name), lambda: PolicyOptimizerApis(self.host, self.username, None, self.verify_ssl, self.domain_id,
+                                                                               workflow_name, session=self.fm_api_session))
+
+    def orchestration(self) -> OrchestrationApis:
+        """
+        Method to retrieve the Orchestration client sharing this session
+        :return: OrchestrationApis
+        """
+        return self.__view(('orch',), lambda: OrchestrationApis(self.host, self.username, None, self.verify_ssl, self.domain_id,
+                                                                 session=self.fm_api_session))
+
+    def logout(self):
+        """
+        Method to logout of the shared session, the next API call on any client handed out logs in again
+        :return: Response object
+        """
+        return authenticate_user.logout_session(self.fm_api_session, self.endpoints.url('logout_api_url', self.host))
+
+    def close(self):
+        """
+        Method to close the pooled connections and the Policy Planner job runners without logging out
+        """
+        with self._views_lock:
+            views = list(self._views.values())
+        for view in views:
+            if isinstance(view, PolicyPlannerApis):
+                view.close()
+        self.fm_api_session.close()
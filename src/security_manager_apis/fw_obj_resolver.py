@@ -0,0 +1,105 @@
+""" Resolves firewall object references with one request per unique object """
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import requests
+
+
+class FirewallObjectResolver:
+
+    def __init__(self, get_fw_obj, workers=8):
+        """
+        Deduplicating, memoizing resolver of (obj_type, device_id, match_id) keys
+        :param get_fw_obj: Callable taking obj_type, device_id and match_id, e.g. SecurityManagerApis.get_fw_obj
+        :param workers: Number of objects fetched in parallel, defaulted to 8
+        """
+        self.get_fw_obj = get_fw_obj
+        self.workers = workers
+        self.fetched = 0
+        self.errors = {}
+        self._objects = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(key) -> tuple:
+        obj_type, device_id, match_id = key
+        return str(obj_type).upper(), str(device_id), str(match_id)
+
+    def __fetch(self, key: tuple, future: Future):
+        try:
+            obj = self.get_fw_obj(*key)
+        except requests.exceptions.HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                self.__settle(key, future, error=e)
+                return
+            # A missing object is remembered like any other answer
+            obj = None
+        except Exception as e:
+            self.__settle(key, future, error=e)
+            return
+        self.__settle(key, future, obj)
+
+    def __settle(self, key: tuple, future: Future, obj=None, error=None):
+        with self._lock:
+            del self._in_flight[key]
+            self.fetched += 1
+            if error is None:
+                self._objects[key] = obj
+                self.errors.pop(key, None)
+            else:
+                self.errors[key] = error
+        future.set_result(obj)
+
+    def resolve(self, keys, workers=None) -> dict:
+        """
+        Method to resolve firewall object references, only objects not resolved before are fetched
+        :param keys: Iterable of (obj_type, device_id, match_id), duplicates are fetched once
+        :param workers: Number of objects fetched in parallel, defaulted to the resolver setting
+        :return: Dictionary of each given key to firewall object JSON, or None when the object does not exist or
+                 could not be fetched. Failures are kept in errors and retried by the next call.
+        """
+        normalized = {key: self._normalize(key) for key in keys}
+        # Objects already resolved are read under the lock, a concurrent forget cannot drop them midway
+        resolved = {}
+        waiting = {}
+        to_fetch = []
+        with self._lock:
+            for key in set(normalized.values()):
+                if key in self._objects:
+                    resolved[key] = self._objects[key]
+                    continue
+                future = self._in_flight.get(key)
+                if future is None:
+                    future = self._in_flight[key] = Future()
+                    to_fetch.append(key)
+                waiting[key] = future
+        if to_fetch:
+            with ThreadPoolExecutor(max_workers=min(workers or self.workers, len(to_fetch)), thread_name_prefix='fw-obj') as executor:
+                for key in to_fetch:
+                    executor.submit(self.__fetch, key, waiting[key])
+        # Keys fetched by a concurrent call are awaited rather than requested again
+        resolved.update((key, future.result()) for key, future in waiting.items())
+        return {key: resolved[norm] for key, norm in normalized.items()}
+
+    def get(self, obj_type: str, device_id: str, match_id: str):
+        """
+        Method to retrieve an already resolved firewall object without a request
+        :return: Firewall object JSON or None
+        """
+        with self._lock:
+            return self._objects.get(self._normalize((obj_type, device_id, match_id)))
+
+    def forget(self, device_id=None):
+        """
+        Method to drop resolved objects, e.g. after a device retrieval
+        :param device_id: Only drop objects of this device, defaulted to None which drops every object
+        """
+        with self._lock:
+            if device_id is None:
+                self._objects.clear()
+            else:
+                for key in [k for k in self._objects if k[1] == str(device_id)]:
+                    del self._objects[key]
+
+    def __len__(self):
+        return len(self._objects)
@@ -0,0 +1,159 @@
+""" Incremental decoding of the results array of large JSON responses """
+import codecs
+import json
+import re
+
+_NON_WHITESPACE = re.compile(r'[^ \t\n\r]')
+# Consumed text is dropped from the buffer once it grows past this many characters
+_COMPACT_AT = 1 << 16
+
+
+class _Buffer:
+    """ Text decoded from a stream of byte chunks, read on demand """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, at_least=1) -> bool:
+        """
+        Reading chunks until at_least more characters are buffered or the stream ends
+        :return: False when nothing more could be read
+        """
+        if self.eof:
+            return False
+        if self.pos > _COMPACT_AT:
+            self.text = self.text[self.pos:]
+            self.pos = 0
+        wanted = len(self.text) + at_least
+        parts = [self.text]
+        size = len(self.text)
+        while size < wanted:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                parts.append(self.decoder.decode(b'', final=True))
+                self.eof = True
+                break
+            part = self.decoder.decode(chunk)
+            parts.append(part)
+            size += len(part)
+        self.text = ''.join(parts)
+        return True
+
+    def peek(self) -> str:
+        """
+        Skipping whitespace and returning the next character without consuming it
+        :return: Character, or an empty string at the end of the stream
+        """
+        while True:
+            match = _NON_WHITESPACE.search(self.text, self.pos)
+            if match is not None:
+                self.pos = match.start()
+                return self.text[self.pos]
+            self.pos = len(self.text)
+            if not self.fill():
+                return ''
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f'Expected {char!r} at position {self.pos} of JSON stream, found {found!r}')
+        self.pos += 1
+
+    def value(self, decoder: json.JSONDecoder):
+        """
+        Decoding the next complete JSON value. A value is only accepted once the character following it
+        is buffered, so numbers split across chunks are never cut short.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.text, self.pos)
+                if end < len(self.text) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Growing the buffer geometrically keeps re-parsing of very large values linear
+            self.fill(max(len(self.text) - self.pos, 1 << 12))
+
+
+def iter_json_array(chunks, key='results', meta=None):
+    """
+    Generator yielding the items of an array inside a JSON document as they arrive
+    :param chunks: Iterable of bytes, e.g. Response.iter_content(65536)
+    :param key: Top-level key of the array, defaulted to results. Use None when the document itself is an array
+    :param meta: Optional dictionary receiving every other top-level key, e.g. total, filled as the document is read
+    :return: Generator of decoded items
+    """
+    buf = _Buffer(chunks)
+    decoder = json.JSONDecoder()
+    if key is not None:
+        buf.expect('{')
+        while True:
+            if buf.peek() == '}':
+                return
+            name = buf.value(decoder)
+            buf.expect(':')
+            if name == key and buf.peek() == '[':
+                break
+            value = buf.value(decoder)
+            if meta is not None:
+                meta[name] = value
+            if buf.peek() == ',':
+                buf.pos += 1
+    buf.expect('[')
+    if buf.peek() == ']':
+        buf.pos += 1
+    else:
+        while True:
+            yield buf.value(decoder)
+            if buf.peek() == ',':
+                buf.pos += 1
+                continue
+            buf.expect(']')
+            break
+    if key is not None and meta is not None:
+        # Keys after the array are still collected once every item was consumed
+        while buf.peek() == ',':
+            buf.pos += 1
+            name = buf.value(decoder)
+            buf.expect(':')
+            meta[name] = buf.value(decoder)
+
+
+def iter_response_items(resp, key='results', meta=None, chunk_size=65536):
+    """
+    Generator yielding the items of a streamed response, the response is closed once the generator ends
+    :param resp: Response object requested with stream=True
+    :param key: Top-level key of the array, defaulted to results
+    :param meta: Optional dictionary receiving every other top-level key
+    :param chunk_size: Bytes read from the socket at a time, defaulted to 65536
+    :return: Generator of decoded items
+    """
+    try:
+        yield from iter_json_array(resp.iter_content(chunk_size), key, meta)
+    finally:
+        resp.close()
+
+
+def write_ndjson(records, f) -> int:
+    """
+    Method to write records as newline delimited JSON
+    :param records: Iterable of JSON-serializable records
+    :param f: Path or text file stream
+    :return: Number of records written
+    """
+    if isinstance(f, str):
+        with open(f, 'w', encoding='utf-8') as stream:
+            return write_ndjson(records, stream)
+    count = 0
+    for record in records:
+        f.write(json.dumps(record, separators=(',', ':')))
+        f.write('\n')
+        count += 1
+    return count
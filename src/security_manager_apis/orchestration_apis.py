@@ -1,20 +1,101 @@
+import threading
+import time
+from functools import partial
+from urllib.parse import urlencode
 import requests
 import authenticate_user
-from security_manager_apis.get_properties_data import get_properties_data
+from security_manager_apis.endpoints import get_endpoint_registry
+from security_manager_apis.siql_pager import iter_siql_pages, iter_siql_records
+from security_manager_apis.rulerec_service import RuleRecommendationService
+from security_manager_apis.worker_pool import notify, run_bounded
+
+# Control types pca_api runs when none are given
+DEFAULT_PCA_CONTROLS = ('RULE_SEARCH', 'ALLOWED_SERVICES', 'SERVICE_RISK_ANALYSIS', 'DEVICE_ACCESS_ANALYSIS', 'NETWORK_ACCESS_ANALYSIS')
+
+
+def control_query(control_types) -> str:
+    """
+    Method to build the controlType query of the pca api
+    :param control_types: List of control types, or comma delimited string
+    :return: URL query as string
+    """
+    if isinstance(control_types, str):
+        control_types = [c.strip() for c in control_types.split(',') if c.strip()]
+    return urlencode([('controlType', c) for c in control_types])
+
+
+class DevicePcaResult:
+    """ Outcome of the pre-change assessment of one device """
+
+    def __init__(self, device_id: str):
+        self.device_id = device_id
+        self.status_code = None
+        self.json = None
+        self.error = None
+        self.elapsed = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.status_code is not None and self.status_code < 400
+
+    def __repr__(self):
+        return f'DevicePcaResult(device_id={self.device_id!r}, status_code={self.status_code}, elapsed={self.elapsed}, error={self.error!r})'
+
+
+class DevicePcaReport:
+    """ Pre-change assessments of many devices, filled in as each device finishes """
+
+    def __init__(self, control_types):
+        self.control_types = control_types
+        self.results = {}
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def succeeded(self) -> list:
+        return [r for r in self.results.values() if r.ok]
+
+    @property
+    def failed(self) -> list:
+        return [r for r in self.results.values() if not r.ok]
+
+    def add(self, result: DevicePcaResult, on_result=None):
+        with self._lock:
+            self.results[result.device_id] = result
+        notify(on_result, result)
+
+    def to_dict(self) -> dict:
+        """
+        Method to merge the report into plain data
+        :return: Dictionary of device ID to PCA JSON, or to a dictionary with error and status_code for failed devices
+        """
+        return {device_id: r.json if r.ok else {'error': r.error, 'status_code': r.status_code} for device_id, r in self.results.items()}
+
+    def __repr__(self):
+        return (f'DevicePcaReport(devices={len(self.results)}, succeeded={len(self.succeeded)}, failed={len(self.failed)}, '
+                f'elapsed={self.elapsed:.2f}s)')
 
 
 class OrchestrationApis:
     """ Adding code for calling orchestration APIs """
 
-    def __init__(self, host: str, username: str, password: str, verify_ssl: bool, domain_id: str, suppress_ssl_warning=False):
+    def __init__(self, host: str, username: str, password: str, verify_ssl: bool, domain_id: str, suppress_ssl_warning=False,
+                 session=None, token_cache=None):
         """ User needs to pass host,username,password,and verify_ssl as parameters while
         creating instance of this class and internally Authentication class instance
-        will be created which will set authentication token in the header to get firemon API access """
+        will be created which will set authentication token in the header to get firemon API access.
+        An already authenticated session can be passed instead to share it between clients,
+        and a token_cache lets short-lived clients reuse an earlier login. """
         if suppress_ssl_warning:
             requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
-        self.parser = get_properties_data()
+        self.endpoints = get_endpoint_registry()
+        # Kept for scripts that read templates with parser.get('REST', key)
+        self.parser = self.endpoints.to_parser()
         self.host = host
-        self.fm_api_session = authenticate_user.Authentication(self.host, username, password, verify_ssl).get_auth_token()
+        if session is None:
+            session = authenticate_user.Authentication(self.host, username, password, verify_ssl, token_cache=token_cache).get_auth_token()
+        self.fm_api_session = session
         self.domain_id = domain_id
 
     def __api_request(self, method: str, endpoint: str, payload=None, parameters=None, data=None, timeout=None, files=None):
@@ -32,23 +113,101 @@ class OrchestrationApis:
     def rulerec_api(self, params: dict, req_json: dict) -> dict:
         """ Calling orchestration rulerec api by passing json data as request body, headers, params and domainId 
             which returns you list of rule recommendations for given input as response"""
-        rulerec_url = self.parser.get('REST', 'rulerec_api_url').format(self.host, self.domain_id)
+        rulerec_url = self.endpoints.url('rulerec_api_url', self.host, self.domain_id)
         resp = self.__api_request('POST', rulerec_url, req_json, params)
         return resp.json()
 
-    def pca_api(self, device_id: str, change_json: list) -> dict:
+    def rulerec_service(self, ttl=600, max_entries=512, workers=8) -> RuleRecommendationService:
+        """
+        Method to build a rule recommendation layer that caches recommendations by canonical request and sends
+        concurrent identical requests once
+        :param ttl: Seconds a recommendation is reused, defaulted to 600
+        :param max_entries: Number of recommendations kept, defaulted to 512
+        :param workers: Number of distinct requests sent in parallel by recommend_many, defaulted to 8
+        :return: RuleRecommendationService
+        """
+        return RuleRecommendationService(self, ttl, max_entries, workers)
+
+    def pca_api(self, device_id: str, change_json: list, control_types=DEFAULT_PCA_CONTROLS) -> dict:
         """ Calling orchestration pca api by passing json data as request body, headers, deviceId and domainId 
-            which returns you pre-change assessments for the given device """
-        control_list = 'controlType=RULE_SEARCH&controlType=ALLOWED_SERVICES&controlType=SERVICE_RISK_ANALYSIS&controlType=DEVICE_ACCESS_ANALYSIS&controlType=NETWORK_ACCESS_ANALYSIS'
-        pca_url = self.parser.get('REST', 'pca_api_url').format(self.host, self.domain_id, device_id, control_list)
+            which returns you pre-change assessments for the given device. control_types is a list of
+            control types or a comma delimited string, defaulted to DEFAULT_PCA_CONTROLS """
+        pca_url = self.endpoints.url('pca_api_url', self.host, self.domain_id, device_id, control_query(control_types))
         resp = self.__api_request('POST', pca_url, change_json)
         return resp.json()
 
+    def device_group_ids(self, device_group_id: str, page_size=1000) -> list:
+        """
+        Method to retrieve the IDs of the devices of a device group
+        :param device_group_id: ID of device group
+        :param page_size: Number of devices per page, defaulted to 1000
+        :return: List of device IDs as strings
+        """
+        endpoint = self.endpoints.url('siql_query_sm_api', self.host, 'device')
+        query = f'domain{{id={self.domain_id}}} AND devicegroup{{id={device_group_id}}}'
+
+        def fetch(page):
+            return self.__api_request('GET', endpoint, None, {'q': query, 'pageSize': page_size, 'page': page}).json()
+
+        return [str(device['id']) for device in iter_siql_records(iter_siql_pages(fetch, page_size))]
+
+    def __device_pca(self, device_id: str, change_json, control_types) -> DevicePcaResult:
+        result = DevicePcaResult(device_id)
+        started = time.perf_counter()
+        try:
+            result.json = self.pca_api(device_id, change_json, control_types)
+            result.status_code = 200
+        except requests.exceptions.HTTPError as e:
+            result.status_code = e.response.status_code if e.response is not None else None
+            result.error = str(e)
+        except Exception as e:
+            result.error = f'{type(e).__name__}: {e}'
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    def pca_devices(self, change_json, devices=None, device_group_id=None, control_types=DEFAULT_PCA_CONTROLS, workers=8,
+                    on_result=None) -> DevicePcaReport:
+        """
+        Method to run the pre-change assessment of a change set on many devices at once
+        :param change_json: Change set sent to every device, or dictionary of device ID to the change set of that device. Devices
+                            without an entry fail without being sent
+        :param devices: Iterable of device IDs or device JSON, defaulted to the keys of change_json when it is a dictionary
+        :param device_group_id: ID of a device group whose devices are assessed, instead of devices
+        :param control_types: List of control types or comma delimited string, defaulted to DEFAULT_PCA_CONTROLS
+        :param workers: Number of devices assessed in parallel, defaulted to 8
+        :param on_result: Callable receiving each DevicePcaResult as it finishes, defaulted to None
+        :return: DevicePcaReport with a DevicePcaResult per device, in completion order
+        """
+        per_device = isinstance(change_json, dict)
+        if device_group_id is not None:
+            devices = self.device_group_ids(device_group_id)
+        elif devices is None:
+            if not per_device:
+                raise Exception('Either devices or device_group_id is required')
+            devices = list(change_json)
+        report = DevicePcaReport(control_types)
+
+        def calls():
+            for device in devices:
+                device_id = str(device['id'] if isinstance(device, dict) else device)
+                changes = change_json
+                if per_device:
+                    changes = change_json.get(device_id)
+                    if changes is None and not isinstance(device, dict):
+                        changes = change_json.get(device)
+                    if changes is None:
+                        result = DevicePcaResult(device_id)
+                        result.error = f'No change set for device {device_id}'
+                        report.add(result, on_result)
+                        continue
+                yield partial(self.__device_pca, device_id, changes, control_types)
+
+        run_bounded(calls(), workers, lambda result: report.add(result, on_result), 'orch-pca')
+        report.elapsed = time.perf_counter() - report.started
+        return report
+
     def logout(self) -> list:
         """
         Method to logout of current session
         """
-        self.fm_api_session.headers['Connection'] = 'Close'
-        endpoint = self.parser.get('REST', 'logout_api_url').format(self.host)
-        resp = self.__api_request('POST', endpoint)
-        return resp
+        return authenticate_user.logout_session(self.fm_api_session, self.endpoints.url('logout_api_url', self.host))
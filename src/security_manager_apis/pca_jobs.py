@@ -0,0 +1,230 @@
+""" Pre-Change Assessments run as background jobs, polled with adaptive backoff until their results are complete """
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+import requests
+
+# Status values reported while an assessment is still running
+RUNNING_STATES = frozenset(('NEW', 'QUEUED', 'PENDING', 'STARTED', 'RUNNING', 'IN_PROGRESS', 'INPROGRESS', 'PROCESSING'))
+
+# Status codes of a results request that mean the assessment has not produced results yet
+NOT_READY_CODES = (202, 204, 404)
+
+
+def pca_complete(result) -> bool:
+    """
+    Method to check whether Pre-Change Assessment results are complete. Results that are not ready yet are
+    answered with one of NOT_READY_CODES, so only an explicit running status marks results as incomplete
+    :param result: JSON of retrieve_pca, None when the response had no body
+    :return: False when the results, or one of their items, report a running status, otherwise True
+    """
+    if isinstance(result, dict):
+        status = result.get('status') or result.get('state')
+        if isinstance(status, str) and status.upper() in RUNNING_STATES:
+            return False
+        items = result.get('results')
+    else:
+        items = result
+    if isinstance(items, list):
+        for item in items:
+            status = item.get('status') if isinstance(item, dict) else None
+            if isinstance(status, str) and status.upper() in RUNNING_STATES:
+                return False
+    return True
+
+
+class PcaJob(Future):
+    """ Future of the results of one Pre-Change Assessment """
+
+    def __init__(self, ticket_id: str, control_types: str, enable_risk_sa: str):
+        super().__init__()
+        self.ticket_id = str(ticket_id)
+        self.control_types = control_types
+        self.enable_risk_sa = enable_risk_sa
+        self.polls = 0
+        self.started = None
+        self.elapsed = None
+        self._interval = None
+        self._errors = 0
+
+    def __repr__(self):
+        state = 'done' if self.done() else 'running'
+        return f'PcaJob(ticket_id={self.ticket_id!r}, {state}, polls={self.polls}, elapsed={self.elapsed})'
+
+
+class PcaJobRunner:
+
+    def __init__(self, pp, workers=8, initial_interval=2.0, max_interval=30.0, backoff=1.5, timeout=1800, start_timeout=60,
+                 max_errors=3, is_complete=pca_complete, start_workers=32):
+        """
+        Starts Pre-Change Assessments and polls their results from one scheduler thread, so waiting on many jobs
+        costs no more threads than sending their requests
+        :param pp: PolicyPlannerApis the assessments run on
+        :param workers: Number of poll requests sent in parallel, defaulted to 8
+        :param initial_interval: Seconds before the first poll, defaulted to 2. Once jobs complete, the first poll
+                                 is scheduled near the typical completion time instead
+        :param max_interval: Longest delay between polls in seconds, defaulted to 30
+        :param backoff: Factor the delay grows by after every incomplete poll, defaulted to 1.5
+        :param timeout: Seconds after which a job fails, defaulted to 1800
+        :param start_timeout: Seconds to wait for the run request, the job keeps polling when it times out, defaulted to 60
+        :param max_errors: Consecutive failed polls after which a job fails, defaulted to 3
+        :param is_complete: Callable taking the results JSON and returning True once they are complete
+        :param start_workers: Number of run requests sent in parallel, defaulted to 32. Run requests can take up to
+                              start_timeout, so they have their own threads and never hold up polls
+        """
+        self.pp = pp
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        self.max_errors = max_errors
+        self.is_complete = is_complete
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pp-pca')
+        self._starter = ThreadPoolExecutor(max_workers=start_workers, thread_name_prefix='pp-pca-start')
+        self._queue = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._typical = None
+        self._closed = False
+        self._thread = threading.Thread(target=self.__schedule, name='pp-pca-scheduler', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def submit(self, ticket_id: str, control_types: str, enable_risk_sa='false') -> PcaJob:
+        """
+        Method to start a Pre-Change Assessment
+        :param ticket_id: Ticket ID
+        :param control_types: Comma delimited control types, see PolicyPlannerApis.do_pca
+        :param enable_risk_sa: true or false, defaulted to false
+        :return: PcaJob resolving to the results JSON
+        """
+        if self._closed:
+            raise Exception('PcaJobRunner is closed')
+        job = PcaJob(ticket_id, control_types, enable_risk_sa)
+        self._starter.submit(self.__start, job)
+        return job
+
+    def submit_many(self, ticket_ids, control_types: str, enable_risk_sa='false') -> dict:
+        """
+        Method to start Pre-Change Assessments for many tickets at once
+        :param ticket_ids: Iterable of ticket IDs
+        :param control_types: Comma delimited control types, see PolicyPlannerApis.do_pca
+        :param enable_risk_sa: true or false, defaulted to false
+        :return: Dictionary of ticket ID to PcaJob
+        """
+        return {str(ticket_id): self.submit(ticket_id, control_types, enable_risk_sa) for ticket_id in ticket_ids}
+
+    def close(self, wait=True):
+        """
+        Method to stop the runner, pending jobs fail
+        :param wait: Wait for requests in flight, defaulted to True
+        """
+        with self._cond:
+            self._closed = True
+            queued = [job for _, _, job in self._queue]
+            self._queue = []
+            self._cond.notify_all()
+        for job in queued:
+            self.__fail(job, Exception(f'PCA of ticket {job.ticket_id} was abandoned, the runner was closed'))
+        self._starter.shutdown(wait=wait)
+        self._executor.shutdown(wait=wait)
+
+    def __first_interval(self) -> float:
+        if self._typical is None:
+            return self.initial_interval
+        # Jobs of a batch tend to take about as long as each other
+        return min(self.max_interval, max(0.1, self._typical * 0.9))
+
+    def __enqueue(self, job: PcaJob, delay: float):
+        # Jitter keeps a batch of jobs from polling in lockstep
+        when = time.monotonic() + delay * random.uniform(0.9, 1.1)
+        with self._cond:
+            if self._closed:
+                queued = False
+            else:
+                heapq.heappush(self._queue, (when, next(self._counter), job))
+                self._cond.notify()
+                queued = True
+        if not queued:
+            self.__fail(job, Exception(f'PCA of ticket {job.ticket_id} was abandoned, the runner was closed'))
+
+    def __schedule(self):
+        while True:
+            with self._cond:
+                while not self._closed and (not self._queue or self._queue[0][0] > time.monotonic()):
+                    self._cond.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                if self._closed:
+                    return
+                _, _, job = heapq.heappop(self._queue)
+            try:
+                self._executor.submit(self.__poll, job)
+            except RuntimeError:
+                return
+
+    def __fail(self, job: PcaJob, error: Exception):
+        job.elapsed = time.monotonic() - job.started if job.started is not None else None
+        if not job.done():
+            job.set_exception(error)
+
+    def __start(self, job: PcaJob):
+        # A job can be cancelled until its run request is sent
+        if not job.set_running_or_notify_cancel():
+            return
+        job.started = time.monotonic()
+        try:
+            self.pp.do_pca(job.ticket_id, job.control_types, job.enable_risk_sa, self.start_timeout)
+        except requests.exceptions.ReadTimeout:
+            # The assessment keeps running on the server, its results are polled as usual
+            pass
+        except Exception as e:
+            return self.__fail(job, e)
+        job._interval = self.__first_interval()
+        self.__enqueue(job, job._interval)
+
+    def __retrieve(self, ticket_id: str):
+        """
+        Retrieving the results of an assessment
+        :return: Whether the server answered with results, and the results JSON or None when the body is empty
+        """
+        pp = self.pp
+        endpoint = pp.endpoints.url('get_pca_pp_tkt_api', pp.host, pp.domain_id, pp.workflow_id, ticket_id)
+        resp = pp.fm_api_session.request('GET', endpoint)
+        if resp.status_code in NOT_READY_CODES:
+            return False, None
+        resp.raise_for_status()
+        return True, resp.json() if resp.content else None
+
+    def __poll(self, job: PcaJob):
+        job.polls += 1
+        try:
+            ready, result = self.__retrieve(job.ticket_id)
+            job._errors = 0
+        except (requests.exceptions.HTTPError, requests.exceptions.ConnectionError, requests.exceptions.Timeout, ValueError) as e:
+            job._errors += 1
+            if job._errors >= self.max_errors:
+                return self.__fail(job, e)
+            ready, result = False, None
+        except Exception as e:
+            return self.__fail(job, e)
+        elapsed = time.monotonic() - job.started
+        if ready and self.is_complete(result):
+            job.elapsed = elapsed
+            self._typical = elapsed if self._typical is None else self._typical * 0.8 + elapsed * 0.2
+            job.set_result(result)
+            return
+        if self.timeout is not None and elapsed >= self.timeout:
+            return self.__fail(job, Exception(f'PCA of ticket {job.ticket_id} did not complete within {self.timeout} seconds'))
+        job._interval = min(self.max_interval, job._interval * self.backoff)
+        delay = job._interval
+        if self.timeout is not None:
+            delay = min(delay, self.timeout - elapsed)
+        self.__enqueue(job, delay)
@@ -1,26 +1,38 @@
 import requests
 import authenticate_user
-from security_manager_apis.get_properties_data import get_properties_data
+from security_manager_apis.endpoints import get_endpoint_registry
+from security_manager_apis.workflow_cache import WorkflowClientMixin, default_workflow_cache
+from security_manager_apis.ticket_stage_cache import StagedTicketMixin
+from security_manager_apis.siql_pager import iter_siql_pages, iter_siql_records
 
 
-class PolicyOptimizerApis:
+class PolicyOptimizerApis(StagedTicketMixin, WorkflowClientMixin):
+    workflow_product = 'policyoptimizer'
 
     def __init__(self, host: str, username: str, password: str, verify_ssl: bool, domain_id: str, workflow_name: str,
-                 suppress_ssl_warning=False):
+                 suppress_ssl_warning=False, session=None, token_cache=None, workflow_cache=None):
         """ User needs to pass host,username,password,and verify_ssl as parameters while
             creating instance of this class and internally Authentication class instance
-            will be created which will set authentication token in the header to get firemon API access
+            will be created which will set authentication token in the header to get firemon API access.
+            An already authenticated session can be passed instead to share it between clients,
+            and a token_cache lets short-lived clients reuse an earlier login. The workflow ID is
+            resolved on first use through workflow_cache, which defaults to a cache shared by all clients.
         """
         if suppress_ssl_warning:
             requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
-        self.parser = get_properties_data()
+        self.endpoints = get_endpoint_registry()
+        # Kept for scripts that read templates with parser.get('REST', key)
+        self.parser = self.endpoints.to_parser()
         self.host = host
-        self.fm_api_session = authenticate_user.Authentication(self.host, username, password, verify_ssl).get_auth_token()
+        if session is None:
+            session = authenticate_user.Authentication(self.host, username, password, verify_ssl, token_cache=token_cache).get_auth_token()
+        self.fm_api_session = session
         self.host = host
         self.domain_id = domain_id
-        self.workflow_id = self.get_workflow_id_by_workflow_name(domain_id, workflow_name)
-        self.workflow_task_id = ""
-        self.workflow_packet_task_id = ""
+        self.workflow_name = workflow_name
+        self.workflow_cache = workflow_cache if workflow_cache is not None else default_workflow_cache
+        self._workflow_id = None
+        self.init_ticket_stages()
 
     def __api_request(self, method: str, endpoint: str, payload=None, parameters=None, data=None, timeout=None, files=None):
         try:
@@ -40,55 +52,67 @@ class PolicyOptimizerApis:
         :param request_body: JSON body for ticket.
         :return: Response code
         """
-        endpoint = self.parser.get('REST', 'create_po_ticket').format(self.host, self.domain_id)
+        endpoint = self.endpoints.url('create_po_ticket', self.host, self.domain_id)
         resp = self.__api_request('POST', endpoint, request_body)
         return resp
 
     def get_po_ticket(self, ticket_id: str) -> dict:
         """
-        Method to retrieve Policy Optimizer ticket JSON
+        Method to retrieve Policy Optimizer ticket JSON, the IDs of its current stage are cached for later calls
         :param ticket_id: ID of ticket
         :return: JSON of ticket
         """
-        endpoint = self.parser.get('REST', 'get_po_ticket').format(self.host, self.domain_id, self.workflow_id, ticket_id)
-        resp = self.__api_request('GET', endpoint)
-        self.get_workflow_packet_task_id(resp.json())
-        self.get_workflow_task_id(resp.json())
-        return resp.json()
+        endpoint = self.endpoints.url('get_po_ticket', self.host, self.domain_id, self.workflow_id, ticket_id)
+        ticket_json = self.__api_request('GET', endpoint).json()
+        self._remember_stage(ticket_id, ticket_json)
+        return ticket_json
+
+    def _pull_ticket(self, ticket_id: str) -> dict:
+        return self.get_po_ticket(ticket_id)
 
-    def assign_po_ticket(self, ticket_id: str, user_id: str):
+    def assign_po_ticket(self, ticket_id: str, user_id: str, ticket=None):
         """
         Method to assign user to Policy Optimizer ticket
         :param ticket_id: ID of ticket
         :param user_id: ID of user
+        :param ticket: Already fetched ticket JSON or TicketHandle, defaulted to None
         :return: Response
         """
-        self.get_po_ticket(ticket_id)
-        endpoint = self.parser.get('REST', 'assign_po_ticket').format(self.host, self.domain_id, self.workflow_id, self.workflow_task_id, ticket_id, self.workflow_packet_task_id)
-        resp = self.__api_request('PUT', endpoint, None, None, user_id)
-        return resp
+        def send(workflow_task_id, workflow_packet_task_id):
+            endpoint = self.endpoints.url('assign_po_ticket', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id, workflow_packet_task_id)
+            return self.__api_request('PUT', endpoint, None, None, user_id)
 
-    def complete_po_ticket(self, ticket_id: str, decision: dict):
+        return self._staged_request(ticket_id, ticket, send)
+
+    def complete_po_ticket(self, ticket_id: str, decision: dict, ticket=None):
         """
         Method to complete a Policy Optimizer ticket
         :param ticket_id: ID of ticket
         :param decision: Decision JSON
+        :param ticket: Already fetched ticket JSON or TicketHandle, defaulted to None
         :return: Response
         """
-        self.get_po_ticket(ticket_id)
-        endpoint = self.parser.get('REST', 'complete_po_ticket').format(self.host, self.domain_id, self.workflow_id, self.workflow_task_id, ticket_id, self.workflow_packet_task_id, 'complete')
-        resp = self.__api_request('PUT', endpoint, decision)
+        def send(workflow_task_id, workflow_packet_task_id):
+            endpoint = self.endpoints.url('complete_po_ticket', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id, workflow_packet_task_id, 'complete')
+            return self.__api_request('PUT', endpoint, decision)
+
+        resp = self._staged_request(ticket_id, ticket, send)
+        self.stage_cache.invalidate(ticket_id)
         return resp
 
-    def cancel_po_ticket(self, ticket_id: str):
+    def cancel_po_ticket(self, ticket_id: str, ticket=None):
         """
         Method to cancel a Policy Optimizer ticket
         :param ticket_id: ID of ticket
+        :param ticket: Already fetched ticket JSON or TicketHandle, defaulted to None
         :return: Response
         """
-        self.get_po_ticket(ticket_id)
-        endpoint = self.parser.get('REST', 'complete_po_ticket').format(self.host, self.domain_id, self.workflow_id, self.workflow_task_id, ticket_id, self.workflow_packet_task_id, 'cancelled')
-        resp = self.__api_request('PUT', endpoint, {})
+        def send(workflow_task_id, workflow_packet_task_id):
+            endpoint = self.endpoints.url('complete_po_ticket', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id, workflow_packet_task_id, 'cancelled')
+            return self.__api_request('PUT', endpoint, {})
+
+        resp = self._staged_request(ticket_id, ticket, send)
+        self.stage_cache.invalidate(ticket_id)
         return resp
 
     def siql_query_po_ticket(self, parameters: dict) -> dict:
@@ -97,18 +121,31 @@ class PolicyOptimizerApis:
         :param parameters: search parameters
         :return: Response JSON
         """
-        endpoint = self.parser.get('REST', 'siql_query_po').format(self.host, self.domain_id)
+        endpoint = self.endpoints.url('siql_query_po', self.host, self.domain_id)
         resp = self.__api_request('GET', endpoint, None, parameters)
         return resp.json()
 
+    def iter_siql(self, parameters: dict, page_size=100, prefetch=2, pages=False):
+        """
+        Method to iterate over every Policy Optimizer ticket matching a SIQL query, the next page is
+        fetched in the background while the current one is consumed
+        :param parameters: search parameters, page and pageSize are set by the iterator
+        :param page_size: Number of results per page, defaulted to 100
+        :param prefetch: Number of pages fetched ahead of the caller, defaulted to 2
+        :param pages: Yield whole page JSON instead of individual tickets, defaulted to False
+        :return: Generator of tickets, or of page JSON when pages is True
+        """
+        def fetch_page(page):
+            return self.siql_query_po_ticket(dict(parameters, pageSize=page_size, page=page))
+
+        page_iter = iter_siql_pages(fetch_page, page_size, prefetch)
+        return page_iter if pages else iter_siql_records(page_iter)
+
     def logout(self) -> list:
         """
         Method to logout of session
         """
-        self.fm_api_session.headers['Connection'] = 'Close'
-        endpoint = self.parser.get('REST', 'logout_api_url').format(self.host)
-        resp = self.__api_request('POST', endpoint)
-        return resp
+        return authenticate_user.logout_session(self.fm_api_session, self.endpoints.url('logout_api_url', self.host))
 
     def get_workflow_packet_task_id(self, ticket_json: dict):
         """
@@ -133,23 +170,3 @@ class PolicyOptimizerApis:
         for t in workflow_packet_tasks:
             if t['workflowTask']['name'] == curr_stage and 'completed' not in t:
                 self.workflow_task_id = str(t['workflowTask']['id'])
-
-    def get_workflow_id_by_workflow_name(self, domain_id: str, workflow_name: str) -> str:
-        """ Takes domainId and workflow name as input parameters and returns you
-            the workflowId for given workflow name """
-        endpoint = self.parser.get('REST', 'find_all_po_workflows_url').format(self.host, domain_id)
-        resp = self.__api_request('GET', endpoint)
-        count_of_workflows = resp.json().get('total')
-
-        # Here, default pageSize is 10
-        # CASE 1 :If total workflows > 10 then second call will be made to get all the remaining workflows
-        # CASE 2 :No need to make a second call if total workflows < 10 as we already have all of them
-        if count_of_workflows > 10:
-            parameters = {'includeDisabled': False, 'pageSize': count_of_workflows}
-            resp = self.__api_request('GET', endpoint, None, parameters)
-
-        list_of_workflows = resp.json().get('results')
-        for workflow in list_of_workflows:
-            if workflow['workflow']['name'] == workflow_name:
-                workflow_id = workflow['workflow']['id']
-                return workflow_id
@@ -1,7 +1,17 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 import requests
 import authenticate_user
-from security_manager_apis.get_properties_data import get_properties_data
+from security_manager_apis.endpoints import get_endpoint_registry
+from security_manager_apis.workflow_cache import WorkflowClientMixin, default_workflow_cache
+from security_manager_apis.ticket_stage_cache import STAGE_ERROR_CODES, StagedTicketMixin
+from security_manager_apis.siql_pager import iter_siql_pages, iter_siql_records
+from security_manager_apis.requirement_batch import run_requirement_batch
+from security_manager_apis.ticket_pipeline import TicketPipelineReport, run_ticket_pipeline
+from security_manager_apis.pca_jobs import PcaJob, PcaJobRunner
+from security_manager_apis.attachment_transfer import CHUNK_SIZE, SPOOL_SIZE, MultipartStream, attachment_file_names, download_all, download_to, spool
 
 
 def is_assigned(ticket_json: dict) -> bool:
@@ -31,9 +41,11 @@ def parse_controls(controls: str) -> str:
     return output
 
 
-class PolicyPlannerApis:
+class PolicyPlannerApis(StagedTicketMixin, WorkflowClientMixin):
+    workflow_product = 'policyplanner'
 
-    def __init__(self, host: str, username: str, password: str, verify_ssl: bool, domain_id: str, workflow_name: str, suppress_ssl_warning=False):
+    def __init__(self, host: str, username: str, password: str, verify_ssl: bool, domain_id: str, workflow_name: str, suppress_ssl_warning=False,
+                 session=None, token_cache=None, workflow_cache=None):
         """
         Method to create Policy Planner ticket
         :param host: Base URL
@@ -43,21 +55,32 @@ class PolicyPlannerApis:
         :param domain_id: Domain ID, typically 1
         :param workflow_name: Name of targeted workflow
         :param suppress_ssl_warning: Suppress SSL warning (True or False), default to False
+        :param session: Authenticated session to share, e.g. from FireMonClient. No login is done when passed
+        :param token_cache: MemoryTokenCache or FileTokenCache used to reuse a login, defaulted to None
+        :param workflow_cache: WorkflowCache used to resolve workflow_name on first use, defaulted to a cache shared by all clients
         :return: None
         """
         if suppress_ssl_warning:
             requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
-        self.parser = get_properties_data()
+        self.endpoints = get_endpoint_registry()
+        # Kept for scripts that read templates with parser.get('REST', key)
+        self.parser = self.endpoints.to_parser()
         self.host = host
-        self.fm_api_session = authenticate_user.Authentication(self.host, username, password, verify_ssl).get_auth_token()
+        if session is None:
+            session = authenticate_user.Authentication(self.host, username, password, verify_ssl, token_cache=token_cache).get_auth_token()
+        self.fm_api_session = session
         self.domain_id = domain_id
-        self.workflow_id = self.get_workflow_id_by_workflow_name(domain_id, workflow_name)
-        self.workflow_task_id = ""
-        self.workflow_packet_task_id = ""
-
-    def __api_request(self, method: str, endpoint: str, payload=None, parameters=None, data=None, timeout=None, files=None):
+        self.workflow_name = workflow_name
+        self.workflow_cache = workflow_cache if workflow_cache is not None else default_workflow_cache
+        self._workflow_id = None
+        self.init_ticket_stages()
+        self._pca_jobs = None
+        self._pca_jobs_lock = threading.Lock()
+
+    def __api_request(self, method: str, endpoint: str, payload=None, parameters=None, data=None, timeout=None, files=None, headers=None):
         try:
-            resp = self.fm_api_session.request(method, endpoint, json=payload, params=parameters, data=data, timeout=timeout, files=files)
+            resp = self.fm_api_session.request(method, endpoint, json=payload, params=parameters, data=data, timeout=timeout, files=files,
+                                               headers=headers)
             resp.raise_for_status()
             return resp
         except requests.exceptions.HTTPError:
@@ -67,28 +90,68 @@ class PolicyPlannerApis:
         except Exception:
             raise
 
+    def __stream_request(self, endpoint: str, headers=None, timeout=None):
+        # 416 is left to the caller, it answers a resume of a file that is already complete
+        resp = self.fm_api_session.request('GET', endpoint, headers=headers, timeout=timeout, stream=True)
+        if resp.status_code != 416:
+            try:
+                resp.raise_for_status()
+            except requests.exceptions.HTTPError:
+                resp.close()
+                raise
+        return resp
+
     def create_pp_ticket(self, request_body: dict) -> dict:
         """
         Method to create Policy Planner ticket
         :param request_body: JSON body for ticket.
         :return: JSON of ticket
         """
-        endpoint = self.parser.get('REST', 'create_pp_tkt_api_url').format(self.host, self.domain_id, self.workflow_id)
+        endpoint = self.endpoints.url('create_pp_tkt_api_url', self.host, self.domain_id, self.workflow_id)
         resp = self.__api_request('POST', endpoint, request_body)
         return resp.json()
 
-    def siql_query_pp_ticket(self, siql_query: str, page_size: int) -> dict:
+    def create_pp_tickets(self, specs, workers=8, on_progress=None) -> TicketPipelineReport:
+        """
+        Method to open many Policy Planner tickets. The steps of each ticket run in order, create, requirements, attachments,
+        assign and pca, while tickets run in parallel. Stage IDs are taken from the create response instead of pulling each
+        ticket, and a failed ticket stops at the failed step without stopping the batch.
+        :param specs: Iterable of dictionaries with keys ticket (JSON body for ticket), and optionally requirements
+        (requirement JSON or list of them), attachments (list of dictionaries with file_name, f and description),
+        assignee (ID of user) and pca (dictionary with control_types, enable_risk_sa and timeout, or control types as string)
+        :param workers: Number of tickets worked on in parallel, defaulted to 8
+        :param on_progress: Callable receiving the TicketPipelineResult and the name of the step that finished, or 'failed'
+        :return: TicketPipelineReport with a TicketPipelineResult per spec, in order
+        """
+        self._resolve_workflow()
+        return run_ticket_pipeline(self, specs, workers, on_progress)
+
+    def siql_query_pp_ticket(self, siql_query: str, page_size: int, page=0) -> dict:
         """
         Method to execute a SIQL Query to search for Policy Planner tickets
         :param siql_query: SIQL query
         :param page_size: Number of results to return
+        :param page: Page of results to return, starting at 0
         :return: JSON of results
         """
-        endpoint = self.parser.get('REST', 'siql_query_pp_tkt_api').format(self.host, self.domain_id)
-        parameters = {'q': siql_query, 'pageSize': page_size, 'domainid': self.domain_id}
+        endpoint = self.endpoints.url('siql_query_pp_tkt_api', self.host, self.domain_id)
+        parameters = {'q': siql_query, 'pageSize': page_size, 'page': page, 'domainid': self.domain_id}
         resp = self.__api_request('GET', endpoint, None, parameters)
         return resp.json()
 
+    def iter_siql(self, siql_query: str, page_size=100, prefetch=2, pages=False):
+        """
+        Method to iterate over every Policy Planner ticket matching a SIQL query, the next page is
+        fetched in the background while the current one is consumed
+        :param siql_query: SIQL query
+        :param page_size: Number of results per page, defaulted to 100
+        :param prefetch: Number of pages fetched ahead of the caller, defaulted to 2
+        :param pages: Yield whole page JSON instead of individual tickets, defaulted to False
+        :return: Generator of tickets, or of page JSON when pages is True
+        """
+        page_iter = iter_siql_pages(lambda page: self.siql_query_pp_ticket(siql_query, page_size, page), page_size, prefetch)
+        return page_iter if pages else iter_siql_records(page_iter)
+
     def update_pp_ticket(self, ticket_id: str, request_body: dict) -> str:
         """
         Method to update Policy Planner ticket
@@ -96,22 +159,45 @@ class PolicyPlannerApis:
         :param ticket_id: Ticket ID
         :return: Status code of API Call
         """
-        endpoint = self.parser.get('REST', 'update_pp_tkt_api_url').format(self.host, self.domain_id, self.workflow_id, ticket_id)
+        endpoint = self.endpoints.url('update_pp_tkt_api_url', self.host, self.domain_id, self.workflow_id, ticket_id)
         resp = self.__api_request('PUT', endpoint, request_body)
+        self.stage_cache.invalidate(ticket_id)
         return resp
 
     def pull_pp_ticket(self, ticket_id: str) -> dict:
         """
-        Method to retrieve Policy Planner ticket
+        Method to retrieve Policy Planner ticket, the IDs of its current stage are cached for later calls
         :param ticket_id: ID of ticket
         :return: JSON of ticket
         """
-        endpoint = self.parser.get('REST', 'pull_pp_tkt_api_url').format(self.host, self.domain_id, self.workflow_id, ticket_id)
+        endpoint = self.endpoints.url('pull_pp_tkt_api_url', self.host, self.domain_id, self.workflow_id, ticket_id)
         resp = self.__api_request('GET', endpoint).json()
-        self.get_workflow_packet_task_id(resp)
-        self.get_workflow_task_id(resp)
+        self._remember_stage(ticket_id, resp)
         return resp
 
+    def _pull_ticket(self, ticket_id: str) -> dict:
+        return self.pull_pp_ticket(ticket_id)
+
+    def __staged_batch(self, ticket_id: str, ticket, items: list, workers: int) -> dict:
+        """
+        Running send(workflow_task_id) of every key, req_id, send item with a single stage lookup. When cached
+        stage IDs turn out to be stale, the ticket is pulled again and the rejected items are retried once.
+        """
+        workflow_task_id, _, fresh = self._stage_ids(ticket_id, ticket)
+        workflow_id = self._resolve_workflow()
+
+        def bind(batch, task_id):
+            return [(key, req_id, (lambda send=send: send(workflow_id, task_id))) for key, req_id, send in batch]
+
+        results = run_requirement_batch(bind(items, workflow_task_id), workers)
+        rejected = [item for item in items if results[item[0]].status_code in STAGE_ERROR_CODES]
+        if rejected and not fresh:
+            self.stage_cache.invalidate(ticket_id)
+            retry_task_id, _, _ = self._stage_ids(ticket_id)
+            if retry_task_id != workflow_task_id:
+                results.update(run_requirement_batch(bind(rejected, retry_task_id), workers))
+        return results
+
     def pull_pp_ticket_attachments(self, ticket_id: str, page_size=100) -> dict:
         """
         Method to retrieve Policy Planner ticket attachments
@@ -119,7 +205,7 @@ class PolicyPlannerApis:
         :param page_size: # of Results
         :return: JSON of attachments
         """
-        endpoint = self.parser.get('REST', 'get_attachments_pp_tkt_api').format(self.host, self.domain_id, self.workflow_id, ticket_id, page_size)
+        endpoint = self.endpoints.url('get_attachments_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id, page_size)
         resp = self.__api_request('GET', endpoint)
         return resp.json()
 
@@ -130,10 +216,46 @@ class PolicyPlannerApis:
         :param attachment_id: ID of attachment to download
         :return: JSON of ticket
         """
-        endpoint = self.parser.get('REST', 'download_attachment_pp_tkt_api').format(self.host, self.domain_id, self.workflow_id, ticket_id, attachment_id)
+        endpoint = self.endpoints.url('download_attachment_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id, attachment_id)
         resp = self.__api_request('GET', endpoint)
         return resp
 
+    def download_pp_ticket_attachment_to(self, ticket_id: str, attachment_id: str, dest, resume=True, retries=3, chunk_size=CHUNK_SIZE,
+                                         on_progress=None, timeout=None) -> int:
+        """
+        Method to stream a Policy Planner ticket attachment to disk without holding it in memory. An interrupted
+        download is continued with a Range request
+        :param ticket_id: ID of ticket
+        :param attachment_id: ID of attachment to download
+        :param dest: File path, or object with a write method such as a file opened in binary mode
+        :param resume: Continue a partial file at dest instead of starting over, defaulted to True
+        :param retries: Number of times an interrupted download is continued, defaulted to 3
+        :param chunk_size: Bytes read per chunk, defaulted to 1 MiB
+        :param on_progress: Callable receiving the number of bytes of each chunk, defaulted to None
+        :param timeout: Seconds to wait for each chunk, defaulted to None
+        :return: Size of the attachment in bytes
+        """
+        endpoint = self.endpoints.url('download_attachment_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id, attachment_id)
+        return download_to(lambda headers: self.__stream_request(endpoint, headers, timeout), dest, resume, retries, chunk_size, on_progress)
+
+    def download_pp_ticket_attachments(self, ticket_id: str, directory: str, workers=4, resume=True, page_size=1000) -> dict:
+        """
+        Method to download every attachment of a Policy Planner ticket into a directory, several at a time
+        :param ticket_id: ID of ticket
+        :param directory: Directory the attachments are written to, created when missing
+        :param workers: Number of attachments downloaded in parallel, defaulted to 4
+        :param resume: Continue partial files left by an earlier run, defaulted to True
+        :param page_size: # of attachments listed
+        :return: Dictionary of attachment ID to AttachmentDownload with the path, size and error of each file
+        """
+        attachments = self.pull_pp_ticket_attachments(ticket_id, page_size)
+        if isinstance(attachments, dict):
+            attachments = attachments.get('results') or attachments.get('attachments') or []
+        os.makedirs(directory, exist_ok=True)
+        targets = {attachment_id: os.path.join(directory, name) for attachment_id, name in attachment_file_names(attachments).items()}
+        return download_all(lambda attachment_id, path: self.download_pp_ticket_attachment_to(ticket_id, attachment_id, path, resume),
+                            targets, workers)
+
     def pull_pp_ticket_events(self, ticket_id: str, page_size=100) -> dict:
         """
         Method to retrieve Policy Planner ticket history events
@@ -141,64 +263,81 @@ class PolicyPlannerApis:
         :param page_size: Number of results to retrieve
         :return: JSON of results
         """
-        endpoint = self.parser.get('REST', 'get_events_pp_tkt_api').format(self.host, self.domain_id, self.workflow_id, ticket_id, page_size)
+        endpoint = self.endpoints.url('get_events_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id, page_size)
         resp = self.__api_request('GET', endpoint)
         return resp.json()
 
-    def assign_pp_ticket(self, ticket_id: str, user_id: str):
+    def assign_pp_ticket(self, ticket_id: str, user_id: str, ticket=None):
         """
         Method to assign user to Policy Planner ticket
         :param ticket_id: ID of ticket
         :param user_id: ID of user
+        :param ticket: Already fetched ticket JSON or TicketHandle, defaulted to None
         :return: API response object
         """
-        self.pull_pp_ticket(ticket_id)
-        endpoint = self.parser.get('REST', 'assign_pp_tkt_api_url').format(self.host, self.domain_id, self.workflow_id, self.workflow_task_id, ticket_id, self.workflow_packet_task_id)
-        self.fm_api_session.headers['Content-Type'] = 'text/plain'
-        resp = self.__api_request('PUT', endpoint, None, None, user_id)
-        self.fm_api_session.headers['Content-Type'] = 'applicationjson'
-        return resp
+        def send(workflow_task_id, workflow_packet_task_id):
+            endpoint = self.endpoints.url('assign_pp_tkt_api_url', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id, workflow_packet_task_id)
+            # Content type is set on the request, not the shared session, so parallel calls are unaffected
+            return self.__api_request('PUT', endpoint, None, None, user_id, headers={'Content-Type': 'text/plain'})
 
-    def unassign_pp_ticket(self, ticket_id: str):
+        return self._staged_request(ticket_id, ticket, send)
+
+    def unassign_pp_ticket(self, ticket_id: str, ticket=None):
         """
         Method to unassign user from Policy Planner ticket
         :param ticket_id: ID of ticket
+        :param ticket: Already fetched ticket JSON or TicketHandle, defaulted to None
         :return: Response status code
         """
-        self.pull_pp_ticket(ticket_id)
-        endpoint = self.parser.get('REST', 'unassign_pp_tkt_api_url').format(self.host, self.domain_id, self.workflow_id, self.workflow_task_id, ticket_id, self.workflow_packet_task_id)
-        resp = self.__api_request('PUT', endpoint)
-        return resp
+        def send(workflow_task_id, workflow_packet_task_id):
+            endpoint = self.endpoints.url('unassign_pp_tkt_api_url', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id, workflow_packet_task_id)
+            return self.__api_request('PUT', endpoint)
+
+        return self._staged_request(ticket_id, ticket, send)
 
-    def add_req_pp_ticket(self, ticket_id: str, req_json: dict):
+    def add_req_pp_ticket(self, ticket_id: str, req_json: dict, ticket=None):
         """
         Method to add requirement to Policy Planner ticket
         :param ticket_id: ID of ticket
         :param req_json: Requirement JSON
+        :param ticket: Already fetched ticket JSON or TicketHandle, defaulted to None
         :return: Response status code
         """
-        self.pull_pp_ticket(ticket_id)
-        endpoint = self.parser.get('REST', 'add_req_pp_tkt_api_url').format(self.host, self.domain_id, self.workflow_id, self.workflow_task_id, ticket_id)
-        resp = self.__api_request('POST', endpoint, req_json)
-        return resp
+        def send(workflow_task_id, workflow_packet_task_id):
+            endpoint = self.endpoints.url('add_req_pp_tkt_api_url', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id)
+            return self.__api_request('POST', endpoint, req_json)
 
-    def replace_req_pp_ticket(self, ticket_id: str, req_json: dict):
-        self.pull_pp_ticket(ticket_id)
-        endpoint = self.parser.get('REST', 'replace_req_pp_tkt_api_url').format(self.host, self.domain_id, self.workflow_id, self.workflow_task_id, ticket_id)
-        resp = self.__api_request('POST', endpoint, req_json)
-        return resp
+        return self._staged_request(ticket_id, ticket, send)
 
-    def complete_task_pp_ticket(self, ticket_id: str, button_action: str, timeout=None):
+    def replace_req_pp_ticket(self, ticket_id: str, req_json: dict, ticket=None):
         """
-        Method to complete Policy Planner ticket task
+        Method to replace all requirements on Policy Planner ticket
+        :param ticket_id: ID of ticket
+        :param req_json: Requirement JSON
+        :param ticket: Already fetched ticket JSON or TicketHandle, defaulted to None
+        :return: Response object
+        """
+        def send(workflow_task_id, workflow_packet_task_id):
+            endpoint = self.endpoints.url('replace_req_pp_tkt_api_url', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id)
+            return self.__api_request('POST', endpoint, req_json)
+
+        return self._staged_request(ticket_id, ticket, send)
+
+    def complete_task_pp_ticket(self, ticket_id: str, button_action: str, timeout=None, ticket=None):
+        """
+        Method to complete Policy Planner ticket task, the cached stage of the ticket is dropped afterwards
         :param ticket_id: Ticket ID
         :param button_action: button value as string, options are: submit, complete, autoDesign, verify, approved
         :param timeout:
+        :param ticket: Already fetched ticket JSON or TicketHandle, defaulted to None
         :return: Response object
         """
-        self.pull_pp_ticket(ticket_id)
-        endpoint = self.parser.get('REST', 'comp_task_pp_tkt_api').format(self.host, self.domain_id, self.workflow_id, self.workflow_task_id, ticket_id, self.workflow_packet_task_id, button_action)
-        resp = self.__api_request('PUT', endpoint, {}, None, None, timeout)
+        def send(workflow_task_id, workflow_packet_task_id):
+            endpoint = self.endpoints.url('comp_task_pp_tkt_api', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id, workflow_packet_task_id, button_action)
+            return self.__api_request('PUT', endpoint, {}, None, None, timeout)
+
+        resp = self._staged_request(ticket_id, ticket, send)
+        self.stage_cache.invalidate(ticket_id)
         return resp
 
     def do_pca(self, ticket_id: str, control_types: str, enable_risk_sa: str, timeout=None):
@@ -214,7 +353,7 @@ class PolicyPlannerApis:
         :return: response code and reason
         """
         controls_formatted = parse_controls(control_types)
-        endpoint = self.parser.get('REST', 'run_pca_pp_tkt_api').format(self.host, self.domain_id, self.workflow_id, ticket_id, controls_formatted, enable_risk_sa)
+        endpoint = self.endpoints.url('run_pca_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id, controls_formatted, enable_risk_sa)
         resp = self.__api_request('POST', endpoint, None, None, None, timeout)
         return resp
 
@@ -224,7 +363,7 @@ class PolicyPlannerApis:
         :param ticket_id: Ticket ID as string
         :return: JSON response of PCA
         """
-        endpoint = self.parser.get('REST', 'get_pca_pp_tkt_api').format(self.host, self.domain_id, self.workflow_id, ticket_id)
+        endpoint = self.endpoints.url('get_pca_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id)
         resp = self.__api_request('GET', endpoint)
         return resp.json()
 
@@ -242,17 +381,74 @@ class PolicyPlannerApis:
         self.do_pca(ticket_id, control_types, enable_risk_sa)
         return self.retrieve_pca(ticket_id)
 
-    def stage_attachment(self, file_name: str, f) -> dict:
+    @property
+    def pca_jobs(self) -> PcaJobRunner:
+        """
+        Runner of the Pre-Change Assessment jobs of this client, created on first use with default polling. Assign a
+        PcaJobRunner(policyplan, ...) to change workers, intervals or timeout
+        """
+        if self._pca_jobs is None:
+            with self._pca_jobs_lock:
+                if self._pca_jobs is None:
+                    self._pca_jobs = PcaJobRunner(self)
+        return self._pca_jobs
+
+    @pca_jobs.setter
+    def pca_jobs(self, runner: PcaJobRunner):
+        self._pca_jobs = runner
+
+    def close(self):
+        """
+        Method to stop the Pre-Change Assessment runner and its threads, jobs still running fail. The session is left open
+        """
+        with self._pca_jobs_lock:
+            runner, self._pca_jobs = self._pca_jobs, None
+        if runner is not None:
+            runner.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def submit_pca(self, ticket_id: str, control_types: str, enable_risk_sa='false') -> PcaJob:
+        """
+        Method to start a Pre-Change Assessment without waiting for it
+        :param ticket_id: Ticket ID
+        :param control_types: Control types as comma delimited string, see do_pca
+        :param enable_risk_sa: true or false, defaulted to false
+        :return: PcaJob, a Future resolving to the JSON of complete PCA results
+        """
+        return self.submit_pcas([ticket_id], control_types, enable_risk_sa)[str(ticket_id)]
+
+    def submit_pcas(self, ticket_ids, control_types: str, enable_risk_sa='false') -> dict:
+        """
+        Method to start Pre-Change Assessments for many tickets at once. Results are polled with adaptive backoff
+        until complete, so a batch takes about as long as its slowest assessment.
+        :param ticket_ids: Iterable of ticket IDs
+        :param control_types: Control types as comma delimited string, see do_pca
+        :param enable_risk_sa: true or false, defaulted to false
+        :return: Dictionary of ticket ID to PcaJob, use concurrent.futures.wait or as_completed on the values
+        """
+        self._resolve_workflow()
+        return self.pca_jobs.submit_many(ticket_ids, control_types, enable_risk_sa)
+
+    def stage_attachment(self, file_name: str, f, stream=False) -> dict:
         """
         Method to stage attachment to Policy Planner ticket
         :param file_name: File Name
         :param f: file stream
+        :param stream: Send the file in chunks as it is read instead of building the request in memory, defaulted to False.
+                       Files whose size cannot be told, e.g. pipes, are sent chunked
         :return: JSON response
         """
-        endpoint = self.parser.get('REST', 'stage_att_pp_tkt_api').format(self.host, self.domain_id, self.workflow_id)
-        self.fm_api_session.headers['Content-Type'] = 'multipart/form-data'
-        resp = self.__api_request('POST', endpoint, None, None, None, None, {file_name: f})
-        self.fm_api_session.headers['Content-Type'] = 'applicationjson'
+        endpoint = self.endpoints.url('stage_att_pp_tkt_api', self.host, self.domain_id, self.workflow_id)
+        if stream:
+            body = MultipartStream(file_name, file_name, f)
+            resp = self.__api_request('POST', endpoint, data=body, headers={'Content-Type': body.content_type})
+        else:
+            resp = self.__api_request('POST', endpoint, None, None, None, None, {file_name: f}, {'Content-Type': 'multipart/form-data'})
         return resp.json()
 
     def post_attachment(self, ticket_id: str, attachment_json: dict) -> dict:
@@ -262,86 +458,133 @@ class PolicyPlannerApis:
         :param attachment_json: staged file JSON
         :return: JSON response
         """
-        endpoint = self.parser.get('REST', 'post_att_pp_tkt_api').format(self.host, self.domain_id, self.workflow_id, ticket_id)
+        endpoint = self.endpoints.url('post_att_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id)
         resp = self.__api_request('PUT', endpoint, attachment_json)
         return resp.json()
 
-    def add_attachment(self, ticket_id: str, file_name: str, f, description: str):
+    def add_attachment(self, ticket_id: str, file_name: str, f, description: str, stream=False):
         """
         Method to add attachment to Policy Planner ticket
         :param ticket_id: ID of ticket
         :param file_name: File name
         :param f: File stream
         :param description: File description
+        :param stream: Send the file in chunks as it is read, see stage_attachment, defaulted to False
         """
-        attachment_staged = self.stage_attachment(file_name, f)
+        attachment_staged = self.stage_attachment(file_name, f, stream)
         attachment_staged['attachments'][0]['description'] = description
         attachment_posted = self.post_attachment(ticket_id, attachment_staged)
         return attachment_posted
 
-    def csv_req_upload(self, ticket_id: str, file_name: str, f, behavior="append"):
+    def csv_req_upload(self, ticket_id: str, file_name: str, f, behavior="append", spool_size=SPOOL_SIZE):
         """
-        Method to bulk CSV upload Policy Planner requirements
+        Method to bulk CSV upload Policy Planner requirements. The file is read once, so pipes and other streams
+        that cannot be rewound work, and the original CSV is attached while the requirements are posted
         :param ticket_id: ID of ticket
         :param file_name: File name
         :param f: File stream
         :param behavior: Add requirement behavior, either append or replace
-        """
-        endpoint = self.parser.get('REST', 'parse_csv_pp_tkt_api').format(self.host, self.domain_id, self.workflow_id)
-        self.fm_api_session.headers['Content-Type'] = 'multipart/form-data'
-        resp = self.__api_request('POST', endpoint, None, None, None, None, {file_name: f})
-        requirements_parsed = resp.json()
-        requirements_formatted = {'requirements': []}
-        for r in requirements_parsed['policyPlanRequirementErrorDTOs']:
-            requirements_formatted['requirements'].append(r['policyPlanRequirementDTO'])
-        self.fm_api_session.headers['Content-Type'] = 'application/json; charset=utf-8'
-        if behavior == "replace":
-            post_req = self.replace_req_pp_ticket(ticket_id, requirements_formatted)
-        else:
-            post_req = self.add_req_pp_ticket(ticket_id, requirements_formatted)
-        f.seek(0)
-        self.fm_api_session.headers['Content-Type'] = 'multipart/form-data'
-        self.add_attachment(ticket_id, file_name, f, 'Attached original CSV file')
-        self.fm_api_session.headers['Content-Type'] = 'applicationjson'
+        :param spool_size: Bytes of the file kept in memory before it is buffered in a temporary file, defaulted to 8 MiB
+        """
+        endpoint = self.endpoints.url('parse_csv_pp_tkt_api', self.host, self.domain_id, self.workflow_id)
+        with spool(f, spool_size) as source, ThreadPoolExecutor(max_workers=2, thread_name_prefix='pp-csv') as executor:
+            # The stage IDs the requirements are posted to are looked up while the CSV is parsed
+            handle = executor.submit(self.ticket_handle, ticket_id) if self.stage_cache.get(ticket_id) is None else None
+            body = MultipartStream(file_name, file_name, source)
+            resp = self.__api_request('POST', endpoint, data=body, headers={'Content-Type': body.content_type})
+            requirements_parsed = resp.json()
+            requirements_formatted = {'requirements': []}
+            for r in requirements_parsed['policyPlanRequirementErrorDTOs']:
+                requirements_formatted['requirements'].append(r['policyPlanRequirementDTO'])
+            ticket = handle.result() if handle is not None else None
+            source.seek(0)
+            attached = executor.submit(self.add_attachment, ticket_id, file_name, source, 'Attached original CSV file', True)
+            if behavior == "replace":
+                post_req = self.replace_req_pp_ticket(ticket_id, requirements_formatted, ticket=ticket)
+            else:
+                post_req = self.add_req_pp_ticket(ticket_id, requirements_formatted, ticket=ticket)
+            attached.result()
         return post_req
 
-    def get_reqs(self, ticket_id: str) -> dict:
+    def get_reqs(self, ticket_id: str, ticket=None) -> dict:
         """
         Method to retrieve JSON object of Policy Planner ticket requirements
         :param ticket_id: Ticket ID
+        :param ticket: Already fetched ticket JSON or TicketHandle, defaulted to None
         :return: JSON of requirements
         """
-        self.pull_pp_ticket(ticket_id)
-        endpoint = self.parser.get('REST', 'get_recs_pp_tkt_api').format(self.host, self.domain_id, self.workflow_id, self.workflow_task_id, ticket_id)
-        resp = self.__api_request('GET', endpoint)
-        return resp.json()
+        def send(workflow_task_id, workflow_packet_task_id):
+            endpoint = self.endpoints.url('get_recs_pp_tkt_api', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id)
+            return self.__api_request('GET', endpoint)
 
-    def get_changes(self, ticket_id: str) -> dict:
+        return self._staged_request(ticket_id, ticket, send).json()
+
+    def get_changes(self, ticket_id: str, ticket=None) -> dict:
         """
         Method to retrieve JSON of changes for a Policy Planner ticket
         :param ticket_id: Ticket ID
+        :param ticket: Already fetched ticket JSON or TicketHandle, defaulted to None
         :return: JSON of changes
         """
-        self.pull_pp_ticket(ticket_id)
-        endpoint = self.parser.get('REST', 'get_pp_tkt_changes').format(self.host, self.domain_id, self.workflow_id, self.workflow_task_id, ticket_id)
-        resp = self.__api_request('GET', endpoint)
-        return resp.json()
+        def send(workflow_task_id, workflow_packet_task_id):
+            endpoint = self.endpoints.url('get_pp_tkt_changes', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id)
+            return self.__api_request('GET', endpoint)
 
-    def del_all_reqs(self, ticket_id: str) -> dict:
+        return self._staged_request(ticket_id, ticket, send).json()
+
+    def del_all_reqs(self, ticket_id: str, ticket=None) -> dict:
         """
         Method to delete all requirements for a Policy Planner ticket
         :param ticket_id: Ticket ID as string
+        :param ticket: Already fetched ticket JSON or TicketHandle, defaulted to None
         :return: dictionary of response codes
         """
-        self.pull_pp_ticket(ticket_id)
-        req_json = self.get_reqs(ticket_id)
+        req_json = self.get_reqs(ticket_id, ticket)
+        # Stage IDs are kept per thread, so these are the ones get_reqs just used
+        workflow_task_id = self.workflow_task_id
         reqs = {}
         for r in req_json['results']:
-            endpoint = self.parser.get('REST', 'del_recs_pp_tkt_api').format(self.host, self.domain_id, self.workflow_id, self.workflow_task_id, ticket_id, str(r['id']))
+            endpoint = self.endpoints.url('del_recs_pp_tkt_api', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id, str(r['id']))
             resp = self.__api_request('DELETE', endpoint)
             reqs[r['id']] = resp.status_code
         return reqs
 
+    def del_reqs(self, ticket_id: str, req_ids=None, workers=8, ticket=None) -> dict:
+        """
+        Method to delete requirements of a Policy Planner ticket in parallel
+        :param ticket_id: Ticket ID as string
+        :param req_ids: IDs of requirements to delete, defaulted to None which deletes every requirement
+        :param workers: Number of requests sent in parallel, defaulted to 8
+        :param ticket: Already fetched ticket JSON or TicketHandle, defaulted to None
+        :return: Dictionary of requirement ID to RequirementResult with status code and timing
+        """
+        if req_ids is None:
+            req_ids = [r['id'] for r in self.get_reqs(ticket_id, ticket)['results']]
+
+        def delete(req_id):
+            def send(workflow_id, workflow_task_id):
+                endpoint = self.endpoints.url('del_recs_pp_tkt_api', self.host, self.domain_id, workflow_id, workflow_task_id, ticket_id, str(req_id))
+                return self.__api_request('DELETE', endpoint)
+            return send
+
+        return self.__staged_batch(ticket_id, ticket, [(req_id, req_id, delete(req_id)) for req_id in req_ids], workers)
+
+    def approve_reqs(self, ticket_id: str, req_ids: list, workers=8) -> dict:
+        """
+        Method to approve Policy Planner requirements in parallel
+        :param ticket_id: ID of ticket
+        :param req_ids: IDs of requirements to approve
+        :param workers: Number of requests sent in parallel, defaulted to 8
+        :return: Dictionary of requirement ID to RequirementResult with status code and timing
+        """
+        workflow_id = self.workflow_id
+
+        def approve(req_id):
+            endpoint = self.endpoints.url('app_req_pp_tkt_api', self.host, self.domain_id, workflow_id, ticket_id, req_id)
+            return lambda: self.__api_request('PUT', endpoint, {})
+
+        return run_requirement_batch(((req_id, req_id, approve(req_id)) for req_id in req_ids), workers)
+
     def approve_req(self, ticket_id: str, req_id: str):
         """
         Method to approve a Policy Planner requirement
@@ -349,36 +592,59 @@ class PolicyPlannerApis:
         :param req_id: ID of requirement
         :return: Response code, reason, JSON as tuple
         """
-        endpoint = self.parser.get('REST', 'app_req_pp_tkt_api').format(self.host, self.domain_id, self.workflow_id, ticket_id, req_id)
+        endpoint = self.endpoints.url('app_req_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id, req_id)
         resp = self.__api_request('PUT', endpoint, {})
         return resp
 
-    def add_change(self, ticket_id: str, req_id: str, change: dict) -> tuple[int, str, Any]:
+    def add_change(self, ticket_id: str, req_id: str, change: dict, ticket=None) -> tuple[int, str, Any]:
         """
         Method to add change to a Policy Planner requirement
         :param ticket_id: ID of ticket
         :param req_id: ID of requirement
         :param change: JSON of change
+        :param ticket: Already fetched ticket JSON or TicketHandle, defaulted to None
         :return: Response code, reason, JSON as list
         """
-        self.pull_pp_ticket(ticket_id)
-        endpoint = self.parser.get('REST', 'add_change_pp_tkt_api').format(self.host, self.domain_id, self.workflow_id, self.workflow_task_id, ticket_id, req_id)
-        resp = self.__api_request('POST', endpoint, change)
+        def send(workflow_task_id, workflow_packet_task_id):
+            endpoint = self.endpoints.url('add_change_pp_tkt_api', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id, req_id)
+            return self.__api_request('POST', endpoint, change)
+
+        resp = self._staged_request(ticket_id, ticket, send)
         return resp.status_code, resp.reason, resp.json()
 
-    def update_change(self, ticket_id: str, req_id: str, change_id: str, change_json: dict):
+    def add_changes(self, ticket_id: str, changes, workers=8, ticket=None) -> dict:
+        """
+        Method to add changes to Policy Planner requirements in parallel
+        :param ticket_id: ID of ticket
+        :param changes: Iterable of requirement ID and change JSON pairs
+        :param workers: Number of requests sent in parallel, defaulted to 8
+        :param ticket: Already fetched ticket JSON or TicketHandle, defaulted to None
+        :return: Dictionary of position in changes to RequirementResult with status code, JSON and timing
+        """
+        def add(req_id, change):
+            def send(workflow_id, workflow_task_id):
+                endpoint = self.endpoints.url('add_change_pp_tkt_api', self.host, self.domain_id, workflow_id, workflow_task_id, ticket_id, req_id)
+                return self.__api_request('POST', endpoint, change)
+            return send
+
+        items = [(i, req_id, add(req_id, change)) for i, (req_id, change) in enumerate(changes)]
+        return self.__staged_batch(ticket_id, ticket, items, workers)
+
+    def update_change(self, ticket_id: str, req_id: str, change_id: str, change_json: dict, ticket=None):
         """
         Method to update a change on a Policy Planner requirement
         :param ticket_id: ID of ticket
         :param req_id: ID of requirement
         :param change_id: ID of change
         :param change_json: JSON of change
+        :param ticket: Already fetched ticket JSON or TicketHandle, defaulted to None
         :return: Response code, reason, JSON as list
         """
-        self.pull_pp_ticket(ticket_id)
-        endpoint = self.parser.get('REST', 'update_pp_tkt_change').format(self.host, self.domain_id, self.workflow_id, self.workflow_task_id, ticket_id, req_id, change_id)
-        resp = self.__api_request('PUT', endpoint, change_json)
-        return resp
+        def send(workflow_task_id, workflow_packet_task_id):
+            endpoint = self.endpoints.url('update_pp_tkt_change', self.host, self.domain_id, self.workflow_id, workflow_task_id, ticket_id, req_id, change_id)
+            return self.__api_request('PUT', endpoint, change_json)
+
+        return self._staged_request(ticket_id, ticket, send)
 
     def add_comment(self, ticket_id: str, comment: str):
         """
@@ -389,7 +655,7 @@ class PolicyPlannerApis:
         comment_json = {
             'comment': comment
         }
-        endpoint = self.parser.get('REST', 'add_comment_pp_tkt_api').format(self.host, self.domain_id, self.workflow_id, ticket_id)
+        endpoint = self.endpoints.url('add_comment_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id)
         resp = self.__api_request('POST', endpoint, comment_json)
         return resp
 
@@ -399,7 +665,7 @@ class PolicyPlannerApis:
         :param ticket_id: Ticket ID
         :return: Comment JSON
         """
-        endpoint = self.parser.get('REST', 'get_comments_pp_tkt_api').format(self.host, self.domain_id, self.workflow_id, ticket_id)
+        endpoint = self.endpoints.url('get_comments_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id)
         resp = self.__api_request('GET', endpoint)
         return resp.json()
 
@@ -409,7 +675,7 @@ class PolicyPlannerApis:
         :param ticket_id: Ticket ID
         :param comment_id: Comment ID
         """
-        endpoint = self.parser.get('REST', 'del_comment_pp_tkt_api').format(self.host, self.domain_id, self.workflow_id, ticket_id, comment_id)
+        endpoint = self.endpoints.url('del_comment_pp_tkt_api', self.host, self.domain_id, self.workflow_id, ticket_id, comment_id)
         resp = self.__api_request('DELETE', endpoint)
         return resp
 
@@ -417,10 +683,7 @@ class PolicyPlannerApis:
         """
         Method to logout of session
         """
-        self.fm_api_session.headers['Connection'] = 'Close'
-        endpoint = self.parser.get('REST', 'logout_api_url').format(self.host)
-        resp = self.__api_request('POST', endpoint)
-        return resp
+        return authenticate_user.logout_session(self.fm_api_session, self.endpoints.url('logout_api_url', self.host))
 
     def get_workflow_packet_task_id(self, ticket_json: dict):
         """
@@ -446,21 +709,3 @@ class PolicyPlannerApis:
             if t['workflowTask']['name'] == curr_stage and 'completed' not in t:
                 self.workflow_task_id = str(t['workflowTask']['id'])
 
-    def get_workflow_id_by_workflow_name(self, domain_id: str, workflow_name: str) -> str:
-        """ Takes domainId and workflow name as input parameters and returns you
-            the workflowId for given workflow name """
-        endpoint = self.parser.get('REST', 'find_all_workflows_url').format(self.host, domain_id)
-        resp = self.__api_request('GET', endpoint)
-        count_of_workflows = resp.json().get('total')
-
-        # Here, default pageSize is 10
-        # CASE 1 :If total workflows > 10 then second call will be made to get all the remaining workflows
-        # CASE 2 :No need to make a second call if total workflows < 10 as we already have all of them
-        if count_of_workflows > 10:
-            parameters = {'includeDisabled': False, 'pageSize': count_of_workflows}
-            resp = self.__api_request('GET', endpoint, None, parameters)
-        list_of_workflows = resp.json().get('results')
-        for workflow in list_of_workflows:
-            if workflow['workflow']['name'] == workflow_name:
-                workflow_id = workflow['workflow']['id']
-                return workflow_id
\ No newline at end of file
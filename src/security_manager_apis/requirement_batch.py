@@ -0,0 +1,72 @@
+""" Runs one Policy Planner request per requirement over a bounded pool of worker threads """
+import time
+from functools import partial
+import requests
+from security_manager_apis.worker_pool import run_bounded
+
+
+class RequirementResult:
+    """ Outcome of one request of a bulk requirement operation """
+
+    def __init__(self, req_id):
+        self.req_id = req_id
+        self.status_code = None
+        self.reason = None
+        self.json = None
+        self.elapsed = None
+        self.error = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.status_code is not None and self.status_code < 400
+
+    def __repr__(self):
+        return f'RequirementResult(req_id={self.req_id!r}, status_code={self.status_code}, elapsed={self.elapsed}, error={self.error!r})'
+
+
+def run_requirement_call(key, req_id, call) -> tuple:
+    """
+    Sending one request and recording its status and timing instead of raising
+    :param key: Key of the item in the returned status map
+    :param req_id: ID of requirement
+    :param call: Callable sending the request and returning the Response object
+    :return: key and RequirementResult as tuple
+    """
+    result = RequirementResult(req_id)
+    started = time.perf_counter()
+    try:
+        resp = call()
+    except requests.exceptions.HTTPError as e:
+        resp = e.response
+        result.error = str(e)
+    except Exception as e:
+        resp = None
+        result.error = f'{type(e).__name__}: {e}'
+    result.elapsed = time.perf_counter() - started
+    if resp is not None:
+        result.status_code = resp.status_code
+        result.reason = resp.reason
+        try:
+            result.json = resp.json() if resp.content else None
+        except ValueError:
+            result.json = None
+    return key, result
+
+
+def run_requirement_batch(items, workers: int) -> dict:
+    """
+    Running requirement calls over a pool of worker threads
+    :param items: Iterable of key, req_id, call tuples
+    :param workers: Number of requests sent in parallel
+    :return: Dictionary of key to RequirementResult, in the order of items
+    """
+    results = {}
+    keys = []
+
+    def calls():
+        for key, req_id, call in items:
+            keys.append(key)
+            yield partial(run_requirement_call, key, req_id, call)
+
+    run_bounded(calls(), workers, lambda item: results.update([item]), 'pp-req')
+    return {key: results[key] for key in keys}
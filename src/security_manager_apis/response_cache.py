@@ -0,0 +1,156 @@
+""" Size-bounded, time-limited cache of read-only GET responses """
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a response stays fresh, by properties key of the endpoint
+DEFAULT_TTLS = {
+    'get_dev_sm_api': 300,
+    'dev_obj_sm_api': 300,
+    'fw_obj_sm_api': 600,
+    'zone_search_sm_api': 600,
+    'get_device_group_name': 120,
+    'user_by_username': 120,
+}
+
+
+class CacheEntry:
+    """ Cached response together with its validators """
+
+    __slots__ = ('endpoint_key', 'scope', 'response', 'etag', 'last_modified', 'expires')
+
+    def __init__(self, endpoint_key: str, scope, response, expires: float):
+        self.endpoint_key = endpoint_key
+        self.scope = scope
+        self.response = response
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+        self.expires = expires
+
+    @property
+    def fresh(self) -> bool:
+        return time.monotonic() < self.expires
+
+    def validators(self) -> dict:
+        """
+        Method to build the headers of a conditional request
+        :return: If-None-Match and If-Modified-Since headers, empty when the server sent no validators
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+
+    def __init__(self, ttl=300, ttls=None, max_entries=1024):
+        """
+        :param ttl: Seconds a response stays fresh for endpoints not in ttls, defaulted to 300
+        :param ttls: Properties key to seconds, merged over DEFAULT_TTLS. A TTL of 0 disables caching for the endpoint
+        :param max_entries: Number of responses kept, the least recently used is evicted first, defaulted to 1024
+        """
+        self.ttl = ttl
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url: str, parameters=None) -> tuple:
+        return url, tuple(sorted(parameters.items())) if parameters else ()
+
+    def ttl_for(self, endpoint_key: str) -> float:
+        return self.ttls.get(endpoint_key, self.ttl)
+
+    def lookup(self, key: tuple):
+        """
+        Method to retrieve a cached response. A stale entry is still returned so it can be revalidated,
+        the caller checks entry.fresh.
+        :param key: Key built with ResponseCache.key
+        :return: CacheEntry or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+                if not (entry.etag or entry.last_modified):
+                    # Without validators a stale entry is of no use
+                    del self._entries[key]
+                    return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def store(self, endpoint_key: str, key: tuple, response, scope=None):
+        """
+        Method to cache a response
+        :param endpoint_key: Properties key of the endpoint
+        :param key: Key built with ResponseCache.key
+        :param response: Response object
+        :param scope: Optional ID the entry belongs to, e.g. a device ID, used by invalidate
+        """
+        ttl = self.ttl_for(endpoint_key)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = CacheEntry(endpoint_key, None if scope is None else str(scope), response, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def revalidated(self, key: tuple):
+        """
+        Method to extend a stale entry after the server answered 304 Not Modified
+        :param key: Key built with ResponseCache.key
+        :return: CacheEntry or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.expires = time.monotonic() + self.ttl_for(entry.endpoint_key)
+                self.revalidations += 1
+            return entry
+
+    def invalidate(self, *endpoint_keys, scope=None):
+        """
+        Method to drop cached responses
+        :param endpoint_keys: Properties keys of the endpoints to drop, every endpoint when none are given
+        :param scope: Only drop entries of this ID, e.g. a device ID, defaulted to None which drops all of them
+        """
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if endpoint_keys and entry.endpoint_key not in endpoint_keys:
+                    continue
+                if scope is not None and entry.scope != str(scope):
+                    continue
+                del self._entries[key]
+
+    def clear(self):
+        """
+        Method to drop every cached response, counters are kept
+        """
+        self.invalidate()
+
+    def stats(self) -> dict:
+        """
+        Method to retrieve the cache counters
+        :return: Dictionary of entries, hits, misses, revalidations, evictions and hit_ratio
+        """
+        lookups = self.hits + self.misses
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'revalidations': self.revalidations,
+                'evictions': self.evictions, 'hit_ratio': self.hits / lookups if lookups else 0.0}
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,164 @@
+""" Memoizing, coalescing layer over the orchestration rule recommendation api """
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+def canonical_key(params, req_json) -> str:
+    """
+    Method to build the cache key of a rule recommendation request, requests that differ only in the order of
+    their fields share a key
+    :param params: Parameters of the request
+    :param req_json: JSON of requirements
+    :return: SHA-256 hex digest of the canonical JSON of both
+    """
+    canonical = json.dumps([params or {}, req_json], sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class RuleRecommendationService:
+
+    def __init__(self, orchestration, ttl=600, max_entries=512, workers=8):
+        """
+        Caches rule recommendations by canonical request, and merges concurrent identical requests into one call
+        :param orchestration: OrchestrationApis the recommendations are requested from
+        :param ttl: Seconds a recommendation is reused, defaulted to 600
+        :param max_entries: Number of recommendations kept, the least recently used is evicted first, defaulted to 512
+        :param workers: Number of distinct requests sent in parallel by recommend_many, defaulted to 8
+        """
+        self.orchestration = orchestration
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.workers = workers
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def __cached(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, recommendation = entry
+        if time.monotonic() >= expires:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def __store(self, key: str, recommendation):
+        self._entries[key] = (time.monotonic() + self.ttl, recommendation)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def __claim(self, key: str) -> tuple:
+        """
+        Looking a request up in the cache, then among the requests in flight
+        :return: Cache entry or None, Future of the request, and whether the caller has to send it
+        """
+        with self._lock:
+            entry = self.__cached(key)
+            if entry is not None:
+                self.hits += 1
+                return entry, None, False
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return None, future, False
+            self.misses += 1
+            future = self._in_flight[key] = Future()
+            return None, future, True
+
+    def __send(self, key: str, params, req_json, future: Future):
+        try:
+            recommendation = self.orchestration.rulerec_api(params, req_json)
+        except BaseException as e:
+            # Failures are handed to every waiting caller but not cached
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            return
+        with self._lock:
+            del self._in_flight[key]
+            if self.ttl > 0:
+                self.__store(key, recommendation)
+        future.set_result(recommendation)
+
+    def recommend(self, params: dict, req_json: dict) -> dict:
+        """
+        Method to retrieve rule recommendations, reused from the cache or from an identical request in flight
+        :param params: Parameters to use for recommendation, see OrchestrationApis.rulerec_api
+        :param req_json: JSON of requirements to provide recommendation for
+        :return: JSON of rule recommendations, a copy the caller may modify
+        """
+        key = canonical_key(params, req_json)
+        entry, future, send = self.__claim(key)
+        if entry is not None:
+            return copy.deepcopy(entry[1])
+        if send:
+            self.__send(key, params, req_json, future)
+        return copy.deepcopy(future.result())
+
+    def recommend_many(self, items, workers=None) -> list:
+        """
+        Method to retrieve rule recommendations for many requests, distinct requests are sent in parallel
+        :param items: Iterable of (params, req_json) tuples, identical requests are sent once
+        :param workers: Number of requests sent in parallel, defaulted to the service setting
+        :return: List in the order of items of rule recommendation JSON, or of the exception a request raised
+        """
+        keyed = [(canonical_key(params, req_json), params, req_json) for params, req_json in items]
+        claimed = {}
+        to_send = []
+        for key, params, req_json in keyed:
+            if key in claimed:
+                continue
+            claimed[key] = self.__claim(key)
+            if claimed[key][2]:
+                to_send.append((key, params, req_json))
+        if to_send:
+            with ThreadPoolExecutor(max_workers=min(workers or self.workers, len(to_send)), thread_name_prefix='rulerec') as executor:
+                for key, params, req_json in to_send:
+                    executor.submit(self.__send, key, params, req_json, claimed[key][1])
+        results = []
+        for key, _, _ in keyed:
+            entry, future, _ = claimed[key]
+            if entry is not None:
+                results.append(copy.deepcopy(entry[1]))
+            elif future.exception() is not None:
+                results.append(future.exception())
+            else:
+                results.append(copy.deepcopy(future.result()))
+        return results
+
+    def invalidate(self, params=None, req_json=None):
+        """
+        Method to drop cached recommendations, e.g. after a policy change
+        :param params: Parameters of the request to drop, defaulted to None which drops every recommendation
+        :param req_json: JSON of requirements of the request to drop
+        """
+        with self._lock:
+            if params is None and req_json is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(canonical_key(params, req_json), None)
+
+    def stats(self) -> dict:
+        """
+        Method to retrieve cache counters
+        :return: Dictionary of entries, hits, misses, coalesced, evictions and in_flight
+        """
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced,
+                    'evictions': self.evictions, 'in_flight': len(self._in_flight)}
+
+    def __len__(self):
+        return len(self._entries)
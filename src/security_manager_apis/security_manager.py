@@ -1,8 +1,17 @@
 import json
+import time
 import requests
 import csv
+from functools import partial
 import authenticate_user
-from security_manager_apis.get_properties_data import get_properties_data
+from security_manager_apis.endpoints import get_endpoint_registry
+from security_manager_apis.response_cache import ResponseCache
+from security_manager_apis.fw_obj_resolver import FirewallObjectResolver
+from security_manager_apis.json_stream import iter_response_items, write_ndjson
+from security_manager_apis.device_inventory import DeviceInventory
+from security_manager_apis.siql_pager import iter_siql_pages, iter_siql_records
+from security_manager_apis.siql_export import SiqlExportReport, export_siql_pages
+from security_manager_apis.worker_pool import notify, run_bounded
 
 
 def verify_route_json(route_input: dict):
@@ -60,23 +69,129 @@ def build_route_json(line_input: list) -> dict:
     return supp_route
 
 
+class RouteResult:
+    """ Outcome of importing one line of a supplemental route file """
+
+    def __init__(self, line: int, device_id=None, route=None, error=None):
+        self.line = line
+        self.device_id = device_id
+        self.route = route
+        self.status_code = None
+        self.reason = None
+        self.latency = None
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and (self.status_code is None or self.status_code < 400)
+
+    def __repr__(self):
+        return f'RouteResult(line={self.line}, status_code={self.status_code}, latency={self.latency}, error={self.error!r})'
+
+
+class RouteImportReport:
+    """ Per-line results and throughput of a bulk supplemental route import """
+
+    def __init__(self):
+        self.results = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def succeeded(self) -> int:
+        return sum(1 for r in self.results if r.ok)
+
+    @property
+    def failed(self) -> list:
+        return [r for r in self.results if not r.ok]
+
+    @property
+    def rows_per_sec(self) -> float:
+        return len(self.results) / self.elapsed if self.elapsed else 0.0
+
+    def add(self, result: RouteResult, on_result=None):
+        self.results.append(result)
+        notify(on_result, result)
+
+    def finish(self):
+        self.results.sort(key=lambda r: r.line)
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def __repr__(self):
+        return (f'RouteImportReport(total={len(self.results)}, succeeded={self.succeeded}, failed={len(self.failed)}, '
+                f'elapsed={self.elapsed:.2f}s, rows_per_sec={self.rows_per_sec:.1f})')
+
+
+def iter_route_rows(f):
+    """
+    Streaming parse of a supplemental route file, each data line is built and validated before it is yielded
+    :param f: file stream, the first line is treated as a header
+    :return: Generator of RouteResult, with route set or error describing why the line is invalid
+    """
+    csv_reader = csv.reader(f, delimiter=',')
+    next(csv_reader, None)
+    for line, row in enumerate(csv_reader, start=2):
+        if not row:
+            continue
+        result = RouteResult(line, row[0])
+        try:
+            result.route = build_route_json(row)
+            verify_route_json(result.route)
+        except Exception as e:
+            result.route = None
+            result.error = f'{type(e).__name__}: {e}'
+        yield result
+
+
+def post_route(add_supp_route, result: RouteResult) -> RouteResult:
+    """
+    Posting one validated supplemental route and recording status, latency and error on its result
+    :param add_supp_route: add_supp_route method of a SecurityManagerApis instance
+    :param result: RouteResult from iter_route_rows
+    :return: The same RouteResult
+    """
+    start = time.perf_counter()
+    try:
+        resp = add_supp_route(result.device_id, result.route)
+        result.status_code, result.reason = resp.status_code, resp.reason
+    except requests.exceptions.HTTPError as e:
+        result.status_code, result.reason = e.response.status_code, e.response.reason
+        result.error = str(e)
+    except Exception as e:
+        result.error = f'{type(e).__name__}: {e}'
+    result.latency = time.perf_counter() - start
+    return result
+
+
 class SecurityManagerApis:
 
-    def __init__(self, host: str, username: str, password: str, verify_ssl: bool, domain_id: str, suppress_ssl_warning=False):
+    def __init__(self, host: str, username: str, password: str, verify_ssl: bool, domain_id: str, suppress_ssl_warning=False,
+                 session=None, token_cache=None, response_cache=None):
         """ User needs to pass host,username,password,and verify_ssl as parameters while
             creating instance of this class and internally Authentication class instance
-            will be created which will set authentication token in the header to get firemon API access
+            will be created which will set authentication token in the header to get firemon API access.
+            An already authenticated session can be passed instead to share it between clients,
+            and a token_cache lets short-lived clients reuse an earlier login. Passing a ResponseCache, or True
+            for one with default settings, caches the responses of read-only device, object, zone, group and user lookups.
         """
         if suppress_ssl_warning:
             requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
-        self.parser = get_properties_data()
+        self.endpoints = get_endpoint_registry()
+        # Kept for scripts that read templates with parser.get('REST', key)
+        self.parser = self.endpoints.to_parser()
         self.host = host
-        self.fm_api_session = authenticate_user.Authentication(self.host, username, password, verify_ssl).get_auth_token()
+        if session is None:
+            session = authenticate_user.Authentication(self.host, username, password, verify_ssl, token_cache=token_cache).get_auth_token()
+        self.fm_api_session = session
         self.domain_id = domain_id
+        self.response_cache = ResponseCache() if response_cache is True else response_cache
+        self.fw_obj_resolver = FirewallObjectResolver(self.get_fw_obj)
 
-    def __api_request(self, method: str, endpoint: str, payload=None, parameters=None, data=None, timeout=None, files=None):
+    def __api_request(self, method: str, endpoint: str, payload=None, parameters=None, data=None, timeout=None, files=None, headers=None):
         try:
-            resp = self.fm_api_session.request(method, endpoint, json=payload, params=parameters, data=data, timeout=timeout, files=files)
+            resp = self.fm_api_session.request(method, endpoint, json=payload, params=parameters, data=data, timeout=timeout, files=files,
+                                               headers=headers)
             resp.raise_for_status()
             return resp
         except requests.exceptions.HTTPError:
@@ -86,47 +201,169 @@ class SecurityManagerApis:
         except Exception:
             raise
 
+    def __cached_get(self, endpoint_key: str, endpoint: str, parameters=None, scope=None):
+        """
+        GET through the response cache when one is configured. Stale entries carrying an ETag or
+        Last-Modified are revalidated with a conditional request.
+        """
+        cache = self.response_cache
+        if cache is None:
+            return self.__api_request('GET', endpoint, None, parameters)
+        key = cache.key(endpoint, parameters)
+        entry = cache.lookup(key)
+        if entry is not None and entry.fresh:
+            return entry.response
+        resp = self.__api_request('GET', endpoint, None, parameters, headers=entry.validators() if entry is not None else None)
+        if resp.status_code == 304 and entry is not None:
+            cache.revalidated(key)
+            return entry.response
+        cache.store(endpoint_key, key, resp, scope)
+        return resp
+
+    def __stream_request(self, endpoint: str, parameters=None, meta=None, ndjson_path=None):
+        """
+        GET whose results array is decoded item by item while the body is read from the socket, or written
+        straight to a newline delimited JSON file when ndjson_path is given
+        """
+        resp = self.fm_api_session.request('GET', endpoint, params=parameters, stream=True)
+        try:
+            resp.raise_for_status()
+        except requests.exceptions.HTTPError:
+            resp.close()
+            raise
+        items = iter_response_items(resp, 'results', meta)
+        if ndjson_path is not None:
+            try:
+                return write_ndjson(items, ndjson_path)
+            finally:
+                items.close()
+        return items
+
+    def __invalidate(self, *endpoint_keys, scope=None):
+        if self.response_cache is not None:
+            self.response_cache.invalidate(*endpoint_keys, scope=scope)
+
     def get_devices(self) -> dict:
         """
         Method to retrieve devices from Security Manager
         """
-        endpoint = self.parser.get('REST', 'get_dev_sm_api').format(self.host, self.domain_id)
-        resp = self.__api_request('GET', endpoint)
+        endpoint = self.endpoints.url('get_dev_sm_api', self.host, self.domain_id)
+        resp = self.__cached_get('get_dev_sm_api', endpoint)
         return resp.json()
 
+    def stream_devices(self, page_size=None, meta=None, ndjson_path=None):
+        """
+        Method to retrieve devices from Security Manager one at a time as the response arrives, memory use
+        stays flat however many devices are returned
+        :param page_size: Number of devices to return, defaulted to None which uses the server default
+        :param meta: Optional dictionary receiving the other fields of the response, e.g. total
+        :param ndjson_path: Path or text file stream the devices are written to as newline delimited JSON, defaulted to None
+        :return: Generator of device JSON, or the number of devices written when ndjson_path is given
+        """
+        endpoint = self.endpoints.url('get_dev_sm_api', self.host, self.domain_id)
+        parameters = {'pageSize': page_size} if page_size is not None else None
+        return self.__stream_request(endpoint, parameters, meta, ndjson_path)
+
+    def device_inventory(self, include_zones=False) -> DeviceInventory:
+        """
+        Method to load every device, and optionally their zones, into a local index
+        :param include_zones: Also load the zones of every device, defaulted to False
+        :return: DeviceInventory with lookups by ID, name and management IP
+        """
+        return DeviceInventory(self, include_zones).refresh()
+
     def manual_device_retrieval(self, device_id: str):
         """
         Method to execute manual device retrieval
         :device_id: Device ID
         :return: Response status code
         """
-        endpoint = self.parser.get('REST', 'man_ret_dev_sm_api').format(self.host, self.domain_id, device_id)
+        endpoint = self.endpoints.url('man_ret_dev_sm_api', self.host, self.domain_id, device_id)
         payload = {}
         resp = self.__api_request('POST', endpoint, payload)
+        # A retrieval can change anything known about the device
+        self.__invalidate('get_dev_sm_api')
+        self.__invalidate('dev_obj_sm_api', 'fw_obj_sm_api', 'zone_search_sm_api', scope=device_id)
+        self.fw_obj_resolver.forget(device_id)
         return resp
 
-    def siql_query(self, query_type: str, query: str, page_size: int) -> dict:
+    def siql_query(self, query_type: str, query: str, page_size: int, page=0) -> dict:
         """
         Method to execute SIQL query of Security Manager objects
         :param query_type: What type of object to query. Options are: secrule, policy, serviceobj, networkobj, device
         :param query: SIQL query to run
         :param page_size: Number of results to return
+        :param page: Page of results to return, starting at 0
         :return: JSON of results
         """
-        endpoint = self.parser.get('REST', 'siql_query_sm_api').format(self.host, query_type)
-        parameters = {'q': query, 'pageSize': page_size}
+        endpoint = self.endpoints.url('siql_query_sm_api', self.host, query_type)
+        parameters = {'q': query, 'pageSize': page_size, 'page': page}
         resp = self.__api_request('GET', endpoint, None, parameters)
         return resp.json()
 
+    def stream_siql_query(self, query_type: str, query: str, page_size: int, page=0, meta=None, ndjson_path=None):
+        """
+        Method to execute SIQL query of Security Manager objects, yielding results one at a time as the
+        response arrives instead of decoding the whole page at once
+        :param query_type: What type of object to query. Options are: secrule, policy, serviceobj, networkobj, device
+        :param query: SIQL query to run
+        :param page_size: Number of results to return
+        :param page: Page of results to return, starting at 0
+        :param meta: Optional dictionary receiving the other fields of the response, e.g. total
+        :param ndjson_path: Path or text file stream the results are written to as newline delimited JSON, defaulted to None
+        :return: Generator of results, or the number of results written when ndjson_path is given
+        """
+        endpoint = self.endpoints.url('siql_query_sm_api', self.host, query_type)
+        parameters = {'q': query, 'pageSize': page_size, 'page': page}
+        return self.__stream_request(endpoint, parameters, meta, ndjson_path)
+
+    def iter_siql(self, query_type: str, query: str, page_size=100, prefetch=2, pages=False):
+        """
+        Method to iterate over every result of a SIQL query of Security Manager objects, the next page is
+        fetched in the background while the current one is consumed
+        :param query_type: What type of object to query. Options are: secrule, policy, serviceobj, networkobj, device
+        :param query: SIQL query to run
+        :param page_size: Number of results per page, defaulted to 100
+        :param prefetch: Number of pages fetched ahead of the caller, defaulted to 2
+        :param pages: Yield whole page JSON instead of individual records, defaulted to False
+        :return: Generator of records, or of page JSON when pages is True
+        """
+        page_iter = iter_siql_pages(lambda page: self.siql_query(query_type, query, page_size, page), page_size, prefetch)
+        return page_iter if pages else iter_siql_records(page_iter)
+
+    def export_siql(self, query_type: str, query: str, directory: str, name=None, page_size=1000, workers=8, pages_per_shard=10,
+                    fmt='ndjson', compression='gzip', resume=True, on_progress=None) -> SiqlExportReport:
+        """
+        Method to export every result of a SIQL query of Security Manager objects to compressed files. The pages are
+        split into shards that are fetched and written in parallel, and a manifest next to the shards lets an
+        interrupted export resume with the shards that are missing
+        :param query_type: What type of object to query. Options are: secrule, policy, serviceobj, networkobj, device
+        :param query: SIQL query to run
+        :param directory: Directory the shards and manifest are written to
+        :param name: Prefix of the file names, defaulted to query_type
+        :param page_size: Number of results per page, defaulted to 1000
+        :param workers: Number of shards exported in parallel, size the connection pool to match, defaulted to 8
+        :param pages_per_shard: Pages written to each file, defaulted to 10
+        :param fmt: ndjson, or parquet which requires pyarrow, defaulted to ndjson
+        :param compression: gzip, bz2, xz or None for NDJSON, a Parquet codec such as zstd or snappy for Parquet, defaulted to gzip
+        :param resume: Keep the shards an earlier run of the same export finished, defaulted to True
+        :param on_progress: Callable receiving each SiqlShardResult once it is written, or has failed
+        :return: SiqlExportReport with the files, rows and rows per second
+        """
+        return export_siql_pages(lambda page: self.siql_query(query_type, query, page_size, page), directory, name or query_type, page_size,
+                                 workers, pages_per_shard, fmt, compression, resume, identity={'query_type': query_type, 'query': query},
+                                 on_progress=on_progress)
+
     def create_device_group(self, device_group_name: str):
         """
         Method to create device group in Security Manager
         :param device_group_name: name of device group
         :return: Response object
         """
-        endpoint = self.parser.get('REST', 'create_device_group').format(self.host, self.domain_id)
+        endpoint = self.endpoints.url('create_device_group', self.host, self.domain_id)
         payload = {'name': device_group_name, 'domainId': self.domain_id}
         resp = self.__api_request('POST', endpoint, payload)
+        self.__invalidate('get_device_group_name')
         return resp
 
     def add_to_device_group(self, device_group_id: str, device_id: str):
@@ -136,8 +373,10 @@ class SecurityManagerApis:
         :param device_id: Device ID
         :return: Response object
         """
-        endpoint = self.parser.get('REST', 'add_device_to_group').format(self.host, self.domain_id, device_group_id, device_id)
+        endpoint = self.endpoints.url('add_device_to_group', self.host, self.domain_id, device_group_id, device_id)
         resp = self.__api_request('POST', endpoint)
+        self.__invalidate('get_device_group_name')
+        self.__invalidate('dev_obj_sm_api', scope=device_id)
         return resp
 
     def get_device_group_by_name(self, device_group_name: str):
@@ -146,8 +385,8 @@ class SecurityManagerApis:
         :param device_group_name: Name of Device Group
         :return: Response object
         """
-        endpoint = self.parser.get('REST', 'get_device_group_name').format(self.host, self.domain_id, device_group_name)
-        resp = self.__api_request('GET', endpoint)
+        endpoint = self.endpoints.url('get_device_group_name', self.host, self.domain_id, device_group_name)
+        resp = self.__cached_get('get_device_group_name', endpoint)
         return resp
 
     def zone_search(self, device_id: str, page_size: int) -> dict:
@@ -157,9 +396,9 @@ class SecurityManagerApis:
         :param page_size: Number of results to return
         :return: JSON of results
         """
-        endpoint = self.parser.get('REST', 'zone_search_sm_api').format(self.host, self.domain_id, device_id)
+        endpoint = self.endpoints.url('zone_search_sm_api', self.host, self.domain_id, device_id)
         parameters = {'pageSize': page_size}
-        resp = self.__api_request('GET', endpoint, None, parameters)
+        resp = self.__cached_get('zone_search_sm_api', endpoint, parameters, scope=device_id)
         return resp.json()
 
     def get_fw_obj(self, obj_type: str, device_id: str, match_id: str) -> dict:
@@ -170,18 +409,28 @@ class SecurityManagerApis:
         :param match_id: Match ID of targeted object
         :return: Firewall object JSON
         """
-        endpoint = self.parser.get('REST', 'fw_obj_sm_api').format(self.host, obj_type, device_id, match_id)
-        resp = self.__api_request('GET', endpoint)
+        endpoint = self.endpoints.url('fw_obj_sm_api', self.host, obj_type, device_id, match_id)
+        resp = self.__cached_get('fw_obj_sm_api', endpoint, scope=device_id)
         return resp.json()
 
+    def resolve_fw_objs(self, keys, workers=8) -> dict:
+        """
+        Method to resolve many firewall object references. Duplicates are fetched once and objects resolved
+        earlier by this client are not fetched again.
+        :param keys: Iterable of (obj_type, device_id, match_id)
+        :param workers: Number of objects fetched in parallel, defaulted to 8
+        :return: Dictionary of each key to firewall object JSON, None when missing or failed (see fw_obj_resolver.errors)
+        """
+        return self.fw_obj_resolver.resolve(keys, workers)
+
     def get_device_obj(self, device_id: str) -> dict:
         """
         Method to retrieve device object JSON
         :param device_id: Device ID
         :return: Device object JSON
         """
-        endpoint = self.parser.get('REST', 'dev_obj_sm_api').format(self.host, self.domain_id, device_id)
-        resp = self.__api_request('GET', endpoint)
+        endpoint = self.endpoints.url('dev_obj_sm_api', self.host, self.domain_id, device_id)
+        resp = self.__cached_get('dev_obj_sm_api', endpoint, scope=device_id)
         return resp.json()
 
     def add_supp_route(self, device_id: str, supplemental_route: dict):
@@ -192,8 +441,9 @@ class SecurityManagerApis:
         :return: List containing status code, reason, json
         """
         verify_route_json(supplemental_route)
-        endpoint = self.parser.get('REST', 'supp_route_sm_api').format(self.host, device_id)
+        endpoint = self.endpoints.url('supp_route_sm_api', self.host, device_id)
         resp = self.__api_request('POST', endpoint, supplemental_route)
+        self.__invalidate('dev_obj_sm_api', 'zone_search_sm_api', scope=device_id)
         return resp
 
     def get_rule_doc(self, device_id: str, rule_id: str) -> dict:
@@ -203,7 +453,7 @@ class SecurityManagerApis:
         :param rule_id: ID of rule
         :return: JSON response
         """
-        endpoint = self.parser.get('REST', 'get_rule_doc').format(self.host, self.domain_id, device_id, rule_id)
+        endpoint = self.endpoints.url('get_rule_doc', self.host, self.domain_id, device_id, rule_id)
         resp = self.__api_request('GET', endpoint)
         return resp.json()
 
@@ -214,7 +464,7 @@ class SecurityManagerApis:
         :param rule_doc: Rule Doc JSON
         :return: JSON response code and reason as list
         """
-        endpoint = self.parser.get('REST', 'update_rule_doc').format(self.host, self.domain_id, device_id)
+        endpoint = self.endpoints.url('update_rule_doc', self.host, self.domain_id, device_id)
         resp = self.__api_request('PUT', endpoint, rule_doc)
         return resp
 
@@ -224,7 +474,7 @@ class SecurityManagerApis:
         :param page_size: Number of results, defaulted to 20
         :return: JSON response
         """
-        endpoint = self.parser.get('REST', 'get_all_users').format(self.host, self.domain_id, page_size)
+        endpoint = self.endpoints.url('get_all_users', self.host, self.domain_id, page_size)
         resp = self.__api_request('GET', endpoint)
         return resp.json()
 
@@ -235,8 +485,8 @@ class SecurityManagerApis:
         :param page_size: Number of results, defaulted to 20
         :return: JSON response
         """
-        endpoint = self.parser.get('REST', 'user_by_username').format(self.host, self.domain_id, page_size, username)
-        resp = self.__api_request('GET', endpoint)
+        endpoint = self.endpoints.url('user_by_username', self.host, self.domain_id, page_size, username)
+        resp = self.__cached_get('user_by_username', endpoint)
         return resp.json()
 
     def get_user_groups(self, page_size=20) -> dict:
@@ -245,7 +495,7 @@ class SecurityManagerApis:
         :param page_size: Number of results, defaulted to 20
         :return: JSON response
         """
-        endpoint = self.parser.get('REST', 'get_user_groups').format(self.host, self.domain_id, page_size)
+        endpoint = self.endpoints.url('get_user_groups', self.host, self.domain_id, page_size)
         resp = self.__api_request('GET', endpoint)
         return resp.json()
 
@@ -256,7 +506,7 @@ class SecurityManagerApis:
         :param user_group_id: ID of user group to query
         :return: JSON response
         """
-        endpoint = self.parser.get('REST', 'get_users_in_user_groups').format(self.host, self.domain_id, user_group_id, page_size)
+        endpoint = self.endpoints.url('get_users_in_user_groups', self.host, self.domain_id, user_group_id, page_size)
         resp = self.__api_request('GET', endpoint)
         return resp.json()
 
@@ -267,34 +517,35 @@ class SecurityManagerApis:
         :param user_id: ID of user to add to user group
         :return: Response object
         """
-        endpoint = self.parser.get('REST', 'assign_to_user_group').format(self.host, self.domain_id, user_group_id, user_id)
+        endpoint = self.endpoints.url('assign_to_user_group', self.host, self.domain_id, user_group_id, user_id)
         resp = self.__api_request('POST', endpoint)
+        self.__invalidate('user_by_username')
         return resp
 
     def logout(self) -> list:
         """
         Method to logout of current session
         """
-        self.fm_api_session.headers['Connection'] = 'Close'
-        endpoint = self.parser.get('REST', 'logout_api_url').format(self.host)
-        resp = self.__api_request('POST', endpoint)
-        return resp
+        return authenticate_user.logout_session(self.fm_api_session, self.endpoints.url('logout_api_url', self.host))
 
-    def bulk_add_supp_route(self, f) -> int:
+    def bulk_add_supp_route(self, f, workers=8, dry_run=False, on_result=None) -> RouteImportReport:
         """
-        Bulk adding Supplemental Routes via formatted text file
+        Bulk adding Supplemental Routes via formatted text file. The file is streamed, every line is validated
+        before it is queued and valid routes are posted by a pool of worker threads.
         :param f: file stream
-        :return: 0
-        """
-        csv_reader = csv.reader(f, delimiter=',')
-        line_count = 0
-        for row in csv_reader:
-            if line_count == 0:
-                print("Starting Bulk Supplemental Route Import...")
-                line_count += 1
-            else:
-                line_count += 1
-                upload = self.add_supp_route(row[0], build_route_json(row))
-                print("Line " + str(line_count) + ":", upload[0], upload[1])
-        print(f'Processed {line_count} lines.')
-        return 0
+        :param workers: Number of routes posted in parallel, defaulted to 8
+        :param dry_run: Only validate the file without posting any route, defaulted to False
+        :param on_result: Optional callable receiving each RouteResult as soon as it completes
+        :return: RouteImportReport with a RouteResult per line and throughput stats
+        """
+        report = RouteImportReport()
+
+        def calls():
+            for result in iter_route_rows(f):
+                if result.error is not None or dry_run:
+                    report.add(result, on_result)
+                else:
+                    yield partial(post_route, self.add_supp_route, result)
+
+        run_bounded(calls(), workers, lambda result: report.add(result, on_result), 'supp-route')
+        return report.finish()
@@ -0,0 +1,264 @@
+""" Parallel export of full SIQL result sets to compressed NDJSON or Parquet shards, with a checkpoint to resume from """
+import bz2
+import gzip
+import json
+import lzma
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from security_manager_apis.worker_pool import notify
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# File openers and extensions of the NDJSON compressions
+NDJSON_COMPRESSIONS = {
+    'gzip': (gzip.open, '.ndjson.gz'),
+    'bz2': (bz2.open, '.ndjson.bz2'),
+    'xz': (lzma.open, '.ndjson.xz'),
+    None: (open, '.ndjson'),
+}
+
+# Status codes of a page request worth sending again
+RETRY_CODES = (429, 500, 502, 503, 504)
+
+
+class SiqlShardResult:
+    """ Outcome of the export of one range of pages """
+
+    def __init__(self, index: int, first_page: int, pages: int, path: str):
+        self.index = index
+        self.first_page = first_page
+        self.pages = pages
+        self.path = path
+        self.rows = 0
+        self.elapsed = 0.0
+        self.resumed = False
+        self.error = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        return (f'SiqlShardResult(index={self.index}, pages={self.first_page}-{self.first_page + self.pages - 1}, rows={self.rows}, '
+                f'resumed={self.resumed}, error={self.error!r})')
+
+
+class SiqlExportReport:
+    """ Results of an export, with a shard result for every range of pages """
+
+    def __init__(self, name: str, manifest: str):
+        self.name = name
+        self.manifest = manifest
+        self.total = 0
+        self.shards = []
+        self.elapsed = 0.0
+
+    @property
+    def rows(self) -> int:
+        return sum(s.rows for s in self.shards if s.ok)
+
+    @property
+    def rows_exported(self) -> int:
+        """ Rows written by this run, shards kept from an earlier run are left out """
+        return sum(s.rows for s in self.shards if s.ok and not s.resumed)
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows_exported / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def failed(self) -> list:
+        return [s for s in self.shards if not s.ok]
+
+    @property
+    def files(self) -> list:
+        return [s.path for s in self.shards if s.ok]
+
+    @property
+    def complete(self) -> bool:
+        """ True when every shard was written and the rows add up to the total reported by the first page """
+        return not self.failed and self.rows == self.total
+
+    def __repr__(self):
+        return (f'SiqlExportReport(name={self.name!r}, total={self.total}, rows={self.rows}, shards={len(self.shards)}, '
+                f'failed={len(self.failed)}, elapsed={self.elapsed:.2f}s, rows_per_sec={self.rows_per_sec:.0f})')
+
+
+def _read_manifest(path: str):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(path: str, manifest: dict):
+    # Replacing the file in one step keeps the checkpoint readable if the process dies while writing it
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _fetch(fetch_page, page: int, retries: int) -> dict:
+    """
+    Fetching one page, sending it again after connection errors, timeouts and status codes of RETRY_CODES
+    """
+    attempt = 0
+    while True:
+        try:
+            return fetch_page(page)
+        except requests.exceptions.HTTPError as e:
+            if attempt >= retries or e.response is None or e.response.status_code not in RETRY_CODES:
+                raise
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt >= retries:
+                raise
+        attempt += 1
+        time.sleep(min(10.0, 0.5 * 2 ** attempt))
+
+
+def _parquet_table(rows: list):
+    """
+    Arrow table of records, top level fields become columns and nested values are kept as JSON text so records
+    of varying shape share one schema
+    """
+    columns = {}
+    for row in rows:
+        for key in row:
+            columns.setdefault(key, None)
+    data = {key: [] for key in columns}
+    for row in rows:
+        for key in columns:
+            value = row.get(key)
+            data[key].append(json.dumps(value, separators=(',', ':'), ensure_ascii=False) if isinstance(value, (dict, list)) else value)
+    try:
+        return pyarrow.table(data)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        # A field holding values of different types is written as text
+        return pyarrow.table({key: [None if v is None else str(v) for v in values] for key, values in data.items()})
+
+
+def _write_shard(fetch_page, shard: SiqlShardResult, fmt: str, compression, retries: int, first=None):
+    """
+    Writing the pages of a shard to a temporary file, which is renamed once every page is written
+    :param first: Already fetched JSON of the first page of the shard, defaulted to None
+    """
+    started = time.perf_counter()
+    tmp = shard.path + '.part'
+    pages = (first if i == 0 and first is not None else _fetch(fetch_page, shard.first_page + i, retries) for i in range(shard.pages))
+    try:
+        if fmt == 'parquet':
+            rows = []
+            for page in pages:
+                rows.extend(page.get('results') or ())
+            pyarrow.parquet.write_table(_parquet_table(rows), tmp, compression=compression or 'none')
+            shard.rows = len(rows)
+        else:
+            opener = NDJSON_COMPRESSIONS[compression][0]
+            with opener(tmp, 'wt', encoding='utf-8') as f:
+                for page in pages:
+                    results = page.get('results') or ()
+                    f.writelines(json.dumps(record, separators=(',', ':'), ensure_ascii=False) + '\n' for record in results)
+                    shard.rows += len(results)
+        os.replace(tmp, shard.path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        shard.elapsed = time.perf_counter() - started
+
+
+def export_siql_pages(fetch_page, directory: str, name: str, page_size=1000, workers=8, pages_per_shard=10, fmt='ndjson',
+                      compression='gzip', resume=True, retries=3, identity=None, on_progress=None) -> SiqlExportReport:
+    """
+    Exporting every page of a SIQL paged-search. The page range is split into shards of pages_per_shard pages that
+    are fetched and written in parallel, and a manifest records the finished shards so an interrupted export
+    picks up where it stopped
+    :param fetch_page: Callable taking a page number (starting at 0) and returning the page JSON
+    :param directory: Directory the shards and the manifest are written to, created when missing
+    :param name: Prefix of the shard files and of the manifest
+    :param page_size: Number of results per page, defaulted to 1000
+    :param workers: Number of shards exported in parallel, defaulted to 8
+    :param pages_per_shard: Pages written to each file, defaulted to 10
+    :param fmt: ndjson or parquet, defaulted to ndjson
+    :param compression: gzip, bz2, xz or None for NDJSON, a Parquet codec such as zstd or snappy for Parquet
+    :param resume: Keep the shards a matching manifest lists as finished, defaulted to True
+    :param retries: Number of times a failed page request is sent again, defaulted to 3
+    :param identity: Dictionary describing the query, an existing manifest is only resumed when it matches
+    :param on_progress: Callable receiving each SiqlShardResult once it is finished, or has failed
+    :return: SiqlExportReport
+    """
+    if fmt == 'parquet':
+        if pyarrow is None:
+            raise ImportError("Parquet export requires pyarrow. Install with: pip install security-manager-apis[parquet]")
+        extension = '.parquet'
+    elif fmt == 'ndjson':
+        if compression not in NDJSON_COMPRESSIONS:
+            raise Exception(f"Unknown NDJSON compression '{compression}', use one of gzip, bz2, xz or None")
+        extension = NDJSON_COMPRESSIONS[compression][1]
+    else:
+        raise Exception(f"Unknown export format '{fmt}', use ndjson or parquet")
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, f'{name}.manifest.json')
+    report = SiqlExportReport(name, manifest_path)
+    started = time.perf_counter()
+
+    first = _fetch(fetch_page, 0, retries)
+    report.total = first.get('total') or 0
+    page_count = math.ceil(report.total / page_size) if report.total else 1
+    settings = {'identity': identity or {}, 'page_size': page_size, 'pages_per_shard': pages_per_shard, 'format': fmt,
+                'compression': compression}
+    manifest = _read_manifest(manifest_path)
+    if manifest is not None and not resume:
+        # Shards of the earlier run may have other names than this run writes, so none of them are left behind
+        for entry in manifest.get('shards', {}).values():
+            stale = os.path.join(directory, entry['file'])
+            if os.path.exists(stale):
+                os.remove(stale)
+        manifest = None
+    if manifest is not None and (manifest.get('settings') != settings or manifest.get('total') != report.total):
+        # Pages of another query, page size or result count do not line up with the shards on disk
+        raise Exception(f'{manifest_path} belongs to another export, or the number of results changed since it was written. '
+                        'Pass resume=False to start over')
+    done = manifest['shards'] if manifest is not None else {}
+    manifest = {'settings': settings, 'total': report.total, 'shards': done}
+    lock = threading.Lock()
+
+    for index, first_page in enumerate(range(0, page_count, pages_per_shard)):
+        path = os.path.join(directory, f'{name}-{index:05d}{extension}')
+        shard = SiqlShardResult(index, first_page, min(pages_per_shard, page_count - first_page), path)
+        entry = done.get(str(index))
+        if entry is not None and os.path.exists(path):
+            shard.rows = entry['rows']
+            shard.resumed = True
+        report.shards.append(shard)
+    _write_manifest(manifest_path, manifest)
+
+    def run(shard):
+        try:
+            _write_shard(fetch_page, shard, fmt, compression, retries, first if shard.first_page == 0 else None)
+        except Exception as e:
+            shard.error = f'{type(e).__name__}: {e}'
+        else:
+            with lock:
+                done[str(shard.index)] = {'file': os.path.basename(shard.path), 'rows': shard.rows, 'pages': shard.pages}
+                _write_manifest(manifest_path, manifest)
+        notify(on_progress, shard)
+
+    pending = [s for s in report.shards if not s.resumed]
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(workers, len(pending)), thread_name_prefix='siql-export') as executor:
+            for future in as_completed([executor.submit(run, shard) for shard in pending]):
+                future.result()
+    report.elapsed = time.perf_counter() - started
+    return report
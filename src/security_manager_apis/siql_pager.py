@@ -0,0 +1,118 @@
+""" Auto-paginating iterators over SIQL paged-search endpoints """
+import asyncio
+import collections
+import math
+import queue
+import threading
+
+_DONE = object()
+
+
+class _PageError:
+
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def iter_siql_pages(fetch_page, page_size: int, prefetch=2):
+    """
+    Generator walking every page of a SIQL paged-search, page N+1 is fetched on a background thread while the
+    caller works on page N. At most prefetch + 2 pages are held in memory at once.
+    :param fetch_page: Callable taking a page number (starting at 0) and returning the page JSON
+    :param page_size: Number of results per page, used with the total field to find the last page
+    :param prefetch: Number of fetched pages allowed to wait for the caller, defaulted to 2
+    :return: Generator of page JSON
+    """
+    if prefetch < 1:
+        raise ValueError("prefetch must be at least 1")
+    pages = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def worker():
+        page_number = 0
+        page_count = None
+        try:
+            while page_count is None or page_number < page_count:
+                page = fetch_page(page_number)
+                if page_count is None:
+                    page_count = math.ceil((page.get('total') or 0) / page_size)
+                if not put(page) or not page.get('results'):
+                    break
+                page_number += 1
+        except BaseException as e:
+            put(_PageError(e))
+        put(_DONE)
+
+    thread = threading.Thread(target=worker, name='siql-prefetch', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = pages.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _PageError):
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def iter_siql_records(page_iter):
+    """
+    Generator flattening SIQL pages into individual records
+    :param page_iter: Iterable of page JSON, e.g. from iter_siql_pages
+    :return: Generator of records from the results field of each page
+    """
+    for page in page_iter:
+        for record in page.get('results') or ():
+            yield record
+
+
+async def aiter_siql_pages(fetch_page, page_size: int, prefetch=2):
+    """
+    Async generator counterpart of iter_siql_pages, up to prefetch pages are requested ahead of the caller
+    :param fetch_page: Coroutine function taking a page number (starting at 0) and returning the page JSON
+    :param page_size: Number of results per page, used with the total field to find the last page
+    :param prefetch: Number of pages requested ahead of the caller, defaulted to 2
+    :return: Async generator of page JSON
+    """
+    if prefetch < 1:
+        raise ValueError("prefetch must be at least 1")
+    first = await fetch_page(0)
+    page_count = math.ceil((first.get('total') or 0) / page_size)
+    pending = collections.deque()
+    next_page = 1
+    try:
+        page = first
+        while True:
+            while next_page < page_count and len(pending) < prefetch:
+                pending.append(asyncio.ensure_future(fetch_page(next_page)))
+                next_page += 1
+            yield page
+            if not pending or not page.get('results'):
+                break
+            page = await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def aiter_siql_records(page_iter):
+    """
+    Async generator flattening SIQL pages into individual records
+    :param page_iter: Async iterable of page JSON, e.g. from aiter_siql_pages
+    :return: Async generator of records from the results field of each page
+    """
+    async for page in page_iter:
+        for record in page.get('results') or ():
+            yield record
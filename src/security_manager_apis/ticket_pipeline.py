@@ -0,0 +1,155 @@
+""" Opens many fully populated Policy Planner tickets, running the steps of each ticket in order and tickets in parallel """
+import time
+from functools import partial
+import requests
+from security_manager_apis.ticket_stage_cache import TicketHandle
+from security_manager_apis.worker_pool import notify, run_bounded
+
+# Steps of a ticket, in the order they run
+PIPELINE_STAGES = ('create', 'requirements', 'attachments', 'assign', 'pca')
+
+
+class TicketPipelineResult:
+    """ Progress and outcome of one ticket of a bulk creation """
+
+    def __init__(self, index: int):
+        self.index = index
+        self.ticket_id = None
+        self.ticket = None
+        self.completed = []
+        self.stage_times = {}
+        self.failed_stage = None
+        self.status_code = None
+        self.error = None
+        self.elapsed = None
+
+    @property
+    def ok(self) -> bool:
+        return self.failed_stage is None and self.elapsed is not None
+
+    def __repr__(self):
+        return (f'TicketPipelineResult(index={self.index}, ticket_id={self.ticket_id!r}, completed={self.completed}, '
+                f'failed_stage={self.failed_stage!r}, error={self.error!r})')
+
+
+class TicketPipelineReport:
+    """ Results of a bulk ticket creation, in the order of the specs """
+
+    def __init__(self):
+        self.results = []
+        self.elapsed = 0.0
+
+    @property
+    def succeeded(self) -> list:
+        return [r for r in self.results if r.ok]
+
+    @property
+    def failed(self) -> list:
+        return [r for r in self.results if not r.ok]
+
+    @property
+    def ticket_ids(self) -> list:
+        return [r.ticket_id for r in self.results if r.ticket_id is not None]
+
+    @property
+    def tickets_per_sec(self) -> float:
+        return len(self.results) / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return (f'TicketPipelineReport(total={len(self.results)}, succeeded={len(self.succeeded)}, failed={len(self.failed)}, '
+                f'elapsed={self.elapsed:.2f}s, tickets_per_sec={self.tickets_per_sec:.1f})')
+
+
+def _as_list(value) -> list:
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def _ticket_handle(ticket_json):
+    """
+    Handle built from the create response, or None when the response does not carry the workflow tasks
+    """
+    try:
+        handle = TicketHandle.from_json(ticket_json)
+    except (KeyError, TypeError):
+        return None
+    return handle if handle.workflow_task_id else None
+
+
+def _run_stages(pp, index: int, spec: dict, on_progress=None) -> TicketPipelineResult:
+    """
+    Running the steps of one ticket in order, stopping at the first failure
+    :return: TicketPipelineResult
+    """
+    result = TicketPipelineResult(index)
+    started = time.perf_counter()
+    handle = None
+    stage = 'create'
+
+    def step(name, call):
+        stage_started = time.perf_counter()
+        value = call()
+        result.stage_times[name] = time.perf_counter() - stage_started
+        result.completed.append(name)
+        notify(on_progress, result, name)
+        return value
+
+    try:
+        result.ticket = step('create', lambda: pp.create_pp_ticket(spec['ticket']))
+        result.ticket_id = str(result.ticket['id'])
+        # The create response carries the first stage, so later steps need not pull the ticket
+        handle = _ticket_handle(result.ticket)
+        if spec.get('requirements') is not None:
+            stage = 'requirements'
+            step(stage, lambda: [pp.add_req_pp_ticket(result.ticket_id, req, ticket=handle) for req in _as_list(spec['requirements'])])
+        if spec.get('attachments'):
+            stage = 'attachments'
+
+            def attach():
+                for attachment in spec['attachments']:
+                    if isinstance(attachment, dict):
+                        pp.add_attachment(result.ticket_id, attachment['file_name'], attachment['f'], attachment.get('description', ''))
+                    else:
+                        pp.add_attachment(result.ticket_id, *attachment)
+
+            step(stage, attach)
+        if spec.get('assignee') is not None:
+            stage = 'assign'
+            step(stage, lambda: pp.assign_pp_ticket(result.ticket_id, str(spec['assignee']), ticket=handle))
+        if spec.get('pca'):
+            stage = 'pca'
+            pca = spec['pca']
+            if isinstance(pca, str):
+                pca = {'control_types': pca}
+            step(stage, lambda: pp.do_pca(result.ticket_id, pca['control_types'], pca.get('enable_risk_sa', 'false'), pca.get('timeout')))
+    except requests.exceptions.HTTPError as e:
+        result.failed_stage = stage
+        result.status_code = e.response.status_code if e.response is not None else None
+        result.error = str(e)
+    except Exception as e:
+        result.failed_stage = stage
+        result.error = f'{type(e).__name__}: {e}'
+    result.elapsed = time.perf_counter() - started
+    if result.failed_stage is not None:
+        notify(on_progress, result, 'failed')
+    return result
+
+
+def run_ticket_pipeline(pp, specs, workers=8, on_progress=None) -> TicketPipelineReport:
+    """
+    Creating tickets from specs over a pool of worker threads
+    :param pp: PolicyPlannerApis
+    :param specs: Iterable of ticket specs, see PolicyPlannerApis.create_pp_tickets
+    :param workers: Number of tickets worked on in parallel
+    :param on_progress: Callable receiving the TicketPipelineResult and the name of the step that just finished, or failed
+    :return: TicketPipelineReport
+    """
+    report = TicketPipelineReport()
+    started = time.perf_counter()
+    results = {}
+    calls = (partial(_run_stages, pp, index, spec, on_progress) for index, spec in enumerate(specs))
+    run_bounded(calls, workers, lambda result: results.update([(result.index, result)]), 'pp-tkt')
+    report.results = [results[i] for i in range(len(results))]
+    report.elapsed = time.perf_counter() - started
+    return report
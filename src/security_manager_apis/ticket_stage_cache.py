@@ -0,0 +1,176 @@
+""" Cache of the current workflow stage IDs of Policy Planner and Policy Optimizer tickets """
+import abc
+import threading
+import requests
+
+# Status codes returned when a request targets a workflow task the ticket is no longer in
+STAGE_ERROR_CODES = (400, 404, 409)
+
+
+def get_stage_ids(ticket_json: dict) -> tuple:
+    """
+    Method to retrieve workflowTaskId and workflowPacketTaskId of the current stage of a ticket
+    :param ticket_json: JSON of ticket, retrieved using pull_pp_ticket or get_po_ticket
+    :return: workflowTaskId and workflowPacketTaskId as tuple of strings
+    """
+    workflow_task_id = ''
+    workflow_packet_task_id = ''
+    curr_stage = ticket_json['status']
+    for t in ticket_json['workflowPacketTasks']:
+        if t['workflowTask']['name'] == curr_stage and 'completed' not in t:
+            workflow_task_id = str(t['workflowTask']['id'])
+            workflow_packet_task_id = str(t['id'])
+    return workflow_task_id, workflow_packet_task_id
+
+
+class TicketHandle:
+    """ Ticket ID together with the IDs of its current stage, lets a series of operations skip re-reading the ticket """
+
+    def __init__(self, ticket_id: str, workflow_task_id: str, workflow_packet_task_id: str, status=None):
+        self.ticket_id = str(ticket_id)
+        self.workflow_task_id = workflow_task_id
+        self.workflow_packet_task_id = workflow_packet_task_id
+        self.status = status
+
+    @classmethod
+    def from_json(cls, ticket_json: dict):
+        """
+        Method to build a handle from ticket JSON
+        :param ticket_json: JSON of ticket
+        :return: TicketHandle
+        """
+        return cls(ticket_json['id'], *get_stage_ids(ticket_json), status=ticket_json.get('status'))
+
+    def __repr__(self):
+        return (f'TicketHandle(ticket_id={self.ticket_id!r}, status={self.status!r}, workflow_task_id={self.workflow_task_id!r}, '
+                f'workflow_packet_task_id={self.workflow_packet_task_id!r})')
+
+
+class TicketStageCache:
+    """ Thread-safe map of ticket ID to the IDs of its current stage """
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def get(self, ticket_id: str):
+        """
+        Method to retrieve the cached stage of a ticket
+        :param ticket_id: ID of ticket
+        :return: Tuple of workflowTaskId and workflowPacketTaskId, or None
+        """
+        with self._lock:
+            return self._stages.get(str(ticket_id))
+
+    def set(self, ticket_id: str, stage_ids: tuple):
+        """
+        Method to cache the stage of a ticket
+        :param ticket_id: ID of ticket
+        :param stage_ids: Tuple of workflowTaskId and workflowPacketTaskId
+        """
+        with self._lock:
+            self._stages[str(ticket_id)] = stage_ids
+
+    def invalidate(self, ticket_id=None):
+        """
+        Method to drop the cached stage of a ticket
+        :param ticket_id: ID of ticket, defaulted to None which drops every ticket
+        """
+        with self._lock:
+            if ticket_id is None:
+                self._stages.clear()
+            else:
+                self._stages.pop(str(ticket_id), None)
+
+    def __len__(self):
+        return len(self._stages)
+
+
+class StagedTicketMixin(abc.ABC):
+    """
+    Stage handling shared by the Policy Planner and Policy Optimizer clients. The client calls init_ticket_stages
+    from its constructor and implements _pull_ticket, which reads a ticket and passes its JSON to _remember_stage
+    """
+
+    def init_ticket_stages(self):
+        self.stage_cache = TicketStageCache()
+        # Stage IDs of the last call are kept per thread, so threads sharing the client cannot overwrite each other's
+        self._stage_local = threading.local()
+
+    @abc.abstractmethod
+    def _pull_ticket(self, ticket_id: str) -> dict:
+        """
+        Method to read a ticket, remembering its stage
+        :param ticket_id: ID of ticket
+        :return: JSON of ticket
+        """
+
+    def _remember_stage(self, ticket_id: str, ticket_json: dict):
+        self.workflow_task_id, self.workflow_packet_task_id = get_stage_ids(ticket_json)
+        self.stage_cache.set(ticket_id, (self.workflow_task_id, self.workflow_packet_task_id))
+
+    @property
+    def workflow_task_id(self) -> str:
+        """ workflowTaskId of the ticket stage last resolved by the calling thread """
+        return getattr(self._stage_local, 'workflow_task_id', '')
+
+    @workflow_task_id.setter
+    def workflow_task_id(self, workflow_task_id: str):
+        self._stage_local.workflow_task_id = workflow_task_id
+
+    @property
+    def workflow_packet_task_id(self) -> str:
+        """ workflowPacketTaskId of the ticket stage last resolved by the calling thread """
+        return getattr(self._stage_local, 'workflow_packet_task_id', '')
+
+    @workflow_packet_task_id.setter
+    def workflow_packet_task_id(self, workflow_packet_task_id: str):
+        self._stage_local.workflow_packet_task_id = workflow_packet_task_id
+
+    def ticket_handle(self, ticket_id: str) -> TicketHandle:
+        """
+        Method to retrieve a handle on a ticket that can be passed as ticket to later calls
+        :param ticket_id: ID of ticket
+        :return: TicketHandle holding the IDs of the current stage
+        """
+        return TicketHandle.from_json(self._pull_ticket(ticket_id))
+
+    def invalidate_ticket_stage(self, ticket_id=None):
+        """
+        Method to drop cached stage IDs, e.g. after the ticket was moved outside of this client
+        :param ticket_id: ID of ticket, defaulted to None which drops every ticket
+        """
+        self.stage_cache.invalidate(ticket_id)
+
+    def _stage_ids(self, ticket_id: str, ticket=None) -> tuple:
+        """
+        Resolving the stage IDs of a ticket from a handle, ticket JSON, the stage cache or, failing those, a read
+        :return: workflowTaskId, workflowPacketTaskId and whether they were just read from the server
+        """
+        if isinstance(ticket, TicketHandle):
+            stage_ids, fresh = (ticket.workflow_task_id, ticket.workflow_packet_task_id), False
+        elif ticket is not None:
+            stage_ids, fresh = get_stage_ids(ticket), False
+            self.stage_cache.set(ticket_id, stage_ids)
+        else:
+            stage_ids, fresh = self.stage_cache.get(ticket_id), False
+            if stage_ids is None:
+                self._pull_ticket(ticket_id)
+                stage_ids, fresh = self.stage_cache.get(ticket_id), True
+        self.workflow_task_id, self.workflow_packet_task_id = stage_ids
+        return stage_ids[0], stage_ids[1], fresh
+
+    def _staged_request(self, ticket_id: str, ticket, send):
+        """
+        Calling send with the stage IDs of a ticket. When IDs that were not just read are rejected, the
+        ticket is read again and send is retried once.
+        """
+        workflow_task_id, workflow_packet_task_id, fresh = self._stage_ids(ticket_id, ticket)
+        try:
+            return send(workflow_task_id, workflow_packet_task_id)
+        except requests.exceptions.HTTPError as e:
+            if fresh or e.response is None or e.response.status_code not in STAGE_ERROR_CODES:
+                raise
+            self.stage_cache.invalidate(ticket_id)
+            workflow_task_id, workflow_packet_task_id, _ = self._stage_ids(ticket_id)
+            return send(workflow_task_id, workflow_packet_task_id)
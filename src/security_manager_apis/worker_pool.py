@@ -0,0 +1,41 @@
+""" Thread pool that works through an iterable of calls of any length while only a few of them are queued at a time """
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+
+def notify(callback, *args):
+    """
+    Calling a user supplied progress callback, logging instead of raising what it raises so one bad callback
+    cannot abort a batch or mark a finished step as failed
+    :param callback: Callable or None
+    :param args: Arguments of the callback
+    """
+    if callback is None:
+        return
+    try:
+        callback(*args)
+    except Exception:
+        logger.exception('Progress callback %r raised', callback)
+
+
+def run_bounded(calls, workers: int, on_result, thread_name_prefix=''):
+    """
+    Running calls over a pool of worker threads. At most twice as many calls as there are workers are queued,
+    so calls is consumed lazily and memory stays flat however many it yields
+    :param calls: Iterable of callables taking no arguments
+    :param workers: Number of calls run in parallel
+    :param on_result: Callable receiving the return value of each call, in order of completion, on the calling thread
+    :param thread_name_prefix: Name prefix of the worker threads
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=thread_name_prefix) as executor:
+        pending = set()
+        for call in calls:
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    on_result(future.result())
+            pending.add(executor.submit(call))
+        for future in as_completed(pending):
+            on_result(future.result())
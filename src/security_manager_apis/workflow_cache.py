@@ -0,0 +1,229 @@
+""" Time-limited cache of workflow name to workflow ID, shared by Policy Planner and Policy Optimizer clients """
+import asyncio
+import json
+import os
+import threading
+import time
+import weakref
+
+
+class WorkflowNotFoundError(LookupError):
+    """ Raised when a client's workflow_name is not a workflow of its domain """
+
+    def __init__(self, workflow_name: str, domain_id: str):
+        super().__init__(f"Workflow '{workflow_name}' was not found in domain {domain_id}")
+        self.workflow_name = workflow_name
+        self.domain_id = domain_id
+
+
+class WorkflowCache:
+
+    def __init__(self, ttl=3600, path=None):
+        """
+        :param ttl: Seconds a resolved workflow ID stays valid, defaulted to 3600
+        :param path: Optional JSON file the cache is loaded from and saved to, defaulted to None
+        """
+        self.ttl = ttl
+        self.path = path
+        self._workflows = {}
+        self._lock = threading.RLock()
+        # One lock per domain being loaded, so a slow listing only holds up lookups of that domain
+        self._loading = {}
+        # The same for async clients, per event loop since asyncio locks belong to one loop
+        self._loading_async = weakref.WeakKeyDictionary()
+        if path is not None:
+            self.__load()
+
+    @staticmethod
+    def _key(host: str, product: str, domain_id: str) -> str:
+        return f'{product}|{host}|{domain_id}'
+
+    def __load(self):
+        try:
+            with open(self.path) as f:
+                self._workflows = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self._workflows = {}
+
+    def __save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._workflows, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, host: str, product: str, domain_id: str, workflow_name: str):
+        """
+        Method to retrieve a cached workflow ID
+        :param host: Base URL
+        :param product: policyplanner or policyoptimizer
+        :param domain_id: Domain ID
+        :param workflow_name: Name of workflow
+        :return: Workflow ID or None when unknown or expired
+        """
+        with self._lock:
+            entry = self._workflows.get(self._key(host, product, domain_id))
+        if entry is None or time.time() - entry['created'] >= self.ttl:
+            return None
+        return entry['ids'].get(workflow_name)
+
+    def update(self, host: str, product: str, domain_id: str, workflows: dict):
+        """
+        Method to cache every workflow of a domain at once
+        :param host: Base URL
+        :param product: policyplanner or policyoptimizer
+        :param domain_id: Domain ID
+        :param workflows: Workflow name to workflow ID
+        """
+        with self._lock:
+            self._workflows[self._key(host, product, domain_id)] = {'ids': dict(workflows), 'created': time.time()}
+            if self.path is not None:
+                self.__save()
+
+    def resolve(self, host: str, product: str, domain_id: str, workflow_name: str, load_workflows):
+        """
+        Method to retrieve a workflow ID, loading the workflows of the domain when it is not cached
+        :param host: Base URL
+        :param product: policyplanner or policyoptimizer
+        :param domain_id: Domain ID
+        :param workflow_name: Name of workflow
+        :param load_workflows: Callable returning every workflow of the domain as name to ID
+        :return: Workflow ID, or None when the domain has no workflow of that name
+        """
+        workflow_id = self.get(host, product, domain_id, workflow_name)
+        if workflow_id is None:
+            key = self._key(host, product, domain_id)
+            with self._lock:
+                loading = self._loading.setdefault(key, threading.Lock())
+            with loading:
+                workflow_id = self.get(host, product, domain_id, workflow_name)
+                if workflow_id is None:
+                    self.update(host, product, domain_id, load_workflows())
+                    workflow_id = self.get(host, product, domain_id, workflow_name)
+        return workflow_id
+
+    async def resolve_async(self, host: str, product: str, domain_id: str, workflow_name: str, load_workflows):
+        """
+        Method to retrieve a workflow ID from an async client, loading the workflows of the domain when it is not cached
+        :param load_workflows: Coroutine function returning every workflow of the domain as name to ID
+        :return: Workflow ID, or None when the domain has no workflow of that name
+        """
+        workflow_id = self.get(host, product, domain_id, workflow_name)
+        if workflow_id is None:
+            loop = asyncio.get_running_loop()
+            with self._lock:
+                loading = self._loading_async.setdefault(loop, {}).setdefault(self._key(host, product, domain_id), asyncio.Lock())
+            async with loading:
+                workflow_id = self.get(host, product, domain_id, workflow_name)
+                if workflow_id is None:
+                    self.update(host, product, domain_id, await load_workflows())
+                    workflow_id = self.get(host, product, domain_id, workflow_name)
+        return workflow_id
+
+    def invalidate(self, host=None, product=None, domain_id=None):
+        """
+        Method to drop cached workflows of one domain, or everything when called without arguments
+        """
+        with self._lock:
+            if host is None:
+                self._workflows.clear()
+            else:
+                self._workflows.pop(self._key(host, product, domain_id), None)
+            if self.path is not None:
+                self.__save()
+
+
+# Shared by every client that is not given its own cache
+default_workflow_cache = WorkflowCache()
+
+# Endpoint listing the workflows of a domain, by product
+WORKFLOW_ENDPOINTS = {'policyplanner': 'find_all_workflows_url', 'policyoptimizer': 'find_all_po_workflows_url'}
+
+# A page of this size normally covers every workflow, a second call is only needed beyond that
+WORKFLOW_PAGE_SIZE = 100
+
+
+def workflows_by_name(list_of_workflows: list) -> dict:
+    """
+    Method to index the results of a workflow listing by name
+    :param list_of_workflows: results field of the latest/all workflow endpoints
+    :return: Workflow name to workflow ID
+    """
+    workflows = {}
+    for workflow in list_of_workflows:
+        workflows.setdefault(workflow['workflow']['name'], workflow['workflow']['id'])
+    return workflows
+
+
+def load_workflows(fetch, endpoint: str) -> dict:
+    """
+    Method to list every workflow of a domain
+    :param fetch: Callable taking the endpoint and query parameters and returning the JSON of a listing
+    :param endpoint: URL of the workflow listing
+    :return: Workflow name to workflow ID
+    """
+    listing = fetch(endpoint, {'pageSize': WORKFLOW_PAGE_SIZE})
+    if listing.get('total') > WORKFLOW_PAGE_SIZE:
+        listing = fetch(endpoint, {'includeDisabled': False, 'pageSize': listing.get('total')})
+    return workflows_by_name(listing.get('results'))
+
+
+async def load_workflows_async(fetch, endpoint: str) -> dict:
+    """
+    Method to list every workflow of a domain from an async client
+    :param fetch: Coroutine function taking the endpoint and query parameters and returning the JSON of a listing
+    :param endpoint: URL of the workflow listing
+    :return: Workflow name to workflow ID
+    """
+    listing = await fetch(endpoint, {'pageSize': WORKFLOW_PAGE_SIZE})
+    if listing.get('total') > WORKFLOW_PAGE_SIZE:
+        listing = await fetch(endpoint, {'includeDisabled': False, 'pageSize': listing.get('total')})
+    return workflows_by_name(listing.get('results'))
+
+
+class WorkflowClientMixin:
+    """
+    Workflow lookup shared by the Policy Planner and Policy Optimizer clients. The client sets workflow_product
+    to the product its workflows are cached under, policyplanner or policyoptimizer
+    """
+    workflow_product = None
+
+    @property
+    def workflow_id(self) -> str:
+        """ ID of the targeted workflow, resolved from workflow_name through the workflow cache on first use """
+        if self._workflow_id is None:
+            workflow_id = self.get_workflow_id_by_workflow_name(self.domain_id, self.workflow_name)
+            if workflow_id is None:
+                raise WorkflowNotFoundError(self.workflow_name, self.domain_id)
+            self._workflow_id = workflow_id
+        return self._workflow_id
+
+    @workflow_id.setter
+    def workflow_id(self, workflow_id: str):
+        self._workflow_id = workflow_id
+
+    def _resolve_workflow(self) -> str:
+        """ Resolving the workflow ID on the calling thread, before handing work that needs it to worker threads """
+        return self.workflow_id
+
+    def for_workflow(self, workflow_name: str):
+        """
+        Method to retrieve a client for another workflow that shares this client's session and caches
+        :param workflow_name: Name of targeted workflow
+        :return: Client of the same type for the workflow
+        """
+        return type(self)(self.host, None, None, self.fm_api_session.verify, self.domain_id, workflow_name,
+                          session=self.fm_api_session, workflow_cache=self.workflow_cache)
+
+    def get_workflow_id_by_workflow_name(self, domain_id: str, workflow_name: str) -> str:
+        """ Takes domainId and workflow name as input parameters and returns you
+            the workflowId for given workflow name, or None when there is no such workflow. Every workflow
+            of the domain is cached on the first lookup, so later lookups make no request until the cache expires. """
+        endpoint = self.endpoints.url(WORKFLOW_ENDPOINTS[self.workflow_product], self.host, domain_id)
+        return self.workflow_cache.resolve(self.host, self.workflow_product, domain_id, workflow_name,
+                                           lambda: load_workflows(self._fetch_workflows, endpoint))
+
+    def _fetch_workflows(self, endpoint: str, parameters: dict) -> dict:
+        resp = self.fm_api_session.request('GET', endpoint, params=parameters)
+        resp.raise_for_status()
+        return resp.json()
@@ -0,0 +1,183 @@
+import io
+import re
+import pytest
+import requests
+from security_manager_apis.attachment_transfer import MultipartStream, download_to
+
+BODY = bytes(range(256)) * 40
+
+
+class FakeResponse:
+
+    def __init__(self, status_code, body=b'', fail_after=None):
+        self.status_code = status_code
+        self.body = body
+        self.fail_after = fail_after
+        self.closed = False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f'{self.status_code} Error', response=self)
+
+    def iter_content(self, chunk_size):
+        sent = 0
+        for i in range(0, len(self.body), chunk_size):
+            if self.fail_after is not None and sent >= self.fail_after:
+                raise requests.exceptions.ChunkedEncodingError('connection broken')
+            chunk = self.body[i:i + chunk_size]
+            sent += len(chunk)
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class FakeServer:
+    """ Serves BODY, honouring Range unless ranges is False, and breaking the first transfers after fail_after bytes """
+
+    def __init__(self, ranges=True, failures=0, fail_after=1000):
+        self.ranges = ranges
+        self.failures = failures
+        self.fail_after = fail_after
+        self.requests = []
+
+    def __call__(self, headers):
+        self.requests.append(headers)
+        start = 0
+        if headers and self.ranges:
+            start = int(re.match(r'bytes=(\d+)-', headers['Range']).group(1))
+            if start >= len(BODY):
+                return FakeResponse(416)
+        fail_after = None
+        if self.failures:
+            self.failures -= 1
+            fail_after = self.fail_after
+        return FakeResponse(206 if start else 200, BODY[start:], fail_after)
+
+
+def test_download_to_path(tmp_path):
+    dest = tmp_path / 'a.bin'
+    assert download_to(FakeServer(), str(dest), chunk_size=100) == len(BODY)
+    assert dest.read_bytes() == BODY
+
+
+def test_interrupted_download_resumes_with_range(tmp_path):
+    dest = tmp_path / 'a.bin'
+    server = FakeServer(failures=2, fail_after=1000)
+    assert download_to(server, str(dest), retries=3, chunk_size=500) == len(BODY)
+    assert dest.read_bytes() == BODY
+    assert server.requests == [None, {'Range': 'bytes=1000-'}, {'Range': 'bytes=2000-'}]
+
+
+def test_gives_up_after_retries(tmp_path):
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        download_to(FakeServer(failures=3), str(tmp_path / 'a.bin'), retries=2, chunk_size=500)
+
+
+def test_partial_file_is_resumed(tmp_path):
+    dest = tmp_path / 'a.bin'
+    dest.write_bytes(BODY[:3000])
+    server = FakeServer()
+    assert download_to(server, str(dest)) == len(BODY)
+    assert dest.read_bytes() == BODY
+    assert server.requests == [{'Range': 'bytes=3000-'}]
+
+
+def test_complete_file_is_not_downloaded_again(tmp_path):
+    dest = tmp_path / 'a.bin'
+    dest.write_bytes(BODY)
+    assert download_to(FakeServer(), str(dest)) == len(BODY)
+    assert dest.read_bytes() == BODY
+
+
+def test_resume_false_overwrites(tmp_path):
+    dest = tmp_path / 'a.bin'
+    dest.write_bytes(b'x' * 5000)
+    server = FakeServer()
+    assert download_to(server, str(dest), resume=False) == len(BODY)
+    assert dest.read_bytes() == BODY
+    assert server.requests == [None]
+
+
+def test_partial_file_restarts_when_range_is_ignored(tmp_path):
+    dest = tmp_path / 'a.bin'
+    dest.write_bytes(BODY[:3000])
+    assert download_to(FakeServer(ranges=False), str(dest)) == len(BODY)
+    assert dest.read_bytes() == BODY
+
+
+def test_sink_restart_rewinds_to_its_start_position():
+    sink = io.BytesIO()
+    sink.write(b'header')
+    server = FakeServer(ranges=False, failures=1, fail_after=1000)
+    assert download_to(server, sink, chunk_size=500) == len(BODY)
+    assert sink.getvalue() == b'header' + BODY
+
+
+def test_unseekable_sink_cannot_restart():
+
+    class Pipe:
+        def __init__(self):
+            self.data = b''
+
+        def write(self, chunk):
+            self.data += chunk
+
+    with pytest.raises(Exception, match='cannot be rewound'):
+        download_to(FakeServer(ranges=False, failures=1), Pipe(), chunk_size=500)
+
+
+def test_multipart_length_matches_body():
+    body = MultipartStream('file', 'a.bin', io.BytesIO(BODY))
+    data = body.read()
+    assert body.len == len(data)
+    assert data.startswith(f'--{body.boundary}\r\n'.encode())
+    assert data.endswith(f'\r\n--{body.boundary}--\r\n'.encode())
+    assert BODY in data
+    assert body.content_type == f'multipart/form-data; boundary={body.boundary}'
+
+
+def test_multipart_counts_from_the_file_position():
+    f = io.BytesIO(b'skipped' + BODY)
+    f.seek(7)
+    body = MultipartStream('file', 'a.bin', f)
+    data = body.read()
+    assert body.len == len(data)
+    assert b'skipped' not in data
+
+
+@pytest.mark.parametrize('size', [1, 7, 100, 4096])
+def test_multipart_small_reads_and_rewind(size):
+    f = io.BytesIO(b'skipped' + BODY)
+    f.seek(7)
+    body = MultipartStream('file', 'a.bin', f, chunk_size=size)
+    first = b''.join(iter(lambda: body.read(size), b''))
+    assert body.seekable()
+    assert body.seek(0) == 0
+    assert b''.join(body) == first
+    assert len(first) == body.len
+
+
+def test_multipart_text_file_is_encoded_and_sent_chunked():
+    body = MultipartStream('file', 'a.txt', io.StringIO('héllo'))
+    assert body.len is None
+    assert 'héllo'.encode('utf-8') in body.read()
+
+
+def test_multipart_without_size_is_chunked_and_cannot_rewind():
+
+    class Pipe:
+        def __init__(self, data):
+            self.f = io.BytesIO(data)
+
+        def read(self, size=-1):
+            return self.f.read(size)
+
+    body = MultipartStream('file', 'a.bin', Pipe(BODY))
+    assert body.len is None
+    assert not body.seekable()
+    assert BODY in body.read()
+    with pytest.raises(OSError):
+        body.seek(0)
+    with pytest.raises(OSError):
+        MultipartStream('file', 'a.bin', io.BytesIO(BODY)).seek(5)
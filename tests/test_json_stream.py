@@ -0,0 +1,42 @@
+import json
+import pytest
+from security_manager_apis.json_stream import iter_json_array
+
+
+def chunked(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+DOCUMENT = {'total': 3, 'results': [{'id': 1, 'name': 'régle ✓'}, {'id': 12345, 'tags': ['a', 'b'], 'score': 1.25e3},
+                                    {'id': 3, 'nested': {'x': [1, 2, {'y': None}]}}], 'count': 3}
+
+
+@pytest.mark.parametrize('size', range(1, 24))
+def test_items_survive_every_chunk_boundary(size):
+    data = json.dumps(DOCUMENT, ensure_ascii=False).encode('utf-8')
+    meta = {}
+    assert list(iter_json_array(chunked(data, size), 'results', meta)) == DOCUMENT['results']
+    assert meta == {'total': 3, 'count': 3}
+
+
+@pytest.mark.parametrize('size', [1, 2, 3])
+def test_numbers_split_across_chunks_are_not_cut_short(size):
+    data = b'{"results": [123456789, 0.000125, -42]}'
+    assert list(iter_json_array(chunked(data, size))) == [123456789, 0.000125, -42]
+
+
+def test_top_level_array_and_whitespace():
+    data = b' [ {"a": 1} ,\n {"a": 2} ] '
+    assert list(iter_json_array(chunked(data, 4), key=None)) == [{'a': 1}, {'a': 2}]
+
+
+def test_empty_array_and_missing_key():
+    assert list(iter_json_array([b'{"results": []}'])) == []
+    meta = {}
+    assert list(iter_json_array([b'{"total": 0}'], 'results', meta)) == []
+    assert meta == {'total': 0}
+
+
+def test_truncated_document_raises():
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'{"results": [{"id": 1}, {"id": ']))
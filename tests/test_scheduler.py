@@ -0,0 +1,103 @@
+import pytest
+import requests
+from authenticate_user import scheduler
+from authenticate_user.scheduler import AdaptiveScheduler, retry_after_seconds
+
+
+class FakeResponse:
+
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(scheduler.time, 'sleep', slept.append)
+    return slept
+
+
+def replies(*outcomes):
+    outcomes = list(outcomes)
+
+    def send():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return send
+
+
+def test_retry_after_header():
+    assert retry_after_seconds(FakeResponse(429, {'Retry-After': '3'})) == 3.0
+    assert retry_after_seconds(FakeResponse(429, {'Retry-After': 'soon'})) is None
+    assert retry_after_seconds(FakeResponse(429)) is None
+    assert retry_after_seconds(FakeResponse(429, {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})) == 0.0
+
+
+def test_throttled_get_backs_off_exponentially(sleeps):
+    s = AdaptiveScheduler(backoff_factor=0.5, max_retries=4)
+    first = FakeResponse(429)
+    resp = s.send('GET', replies(first, FakeResponse(503), FakeResponse(429), FakeResponse(200)))
+    assert resp.status_code == 200
+    assert first.closed
+    assert s.retries == 3 and s.throttled == 3
+    # Jittered between half and all of 0.5, 1 and 2 seconds
+    for attempt, delay in enumerate(sleeps):
+        assert 0.25 * 2 ** attempt <= delay <= 0.5 * 2 ** attempt
+
+
+def test_backoff_is_capped_and_honours_retry_after(sleeps):
+    s = AdaptiveScheduler(backoff_factor=10, max_backoff=8, max_retries=3)
+    s.send('GET', replies(FakeResponse(429), FakeResponse(429), FakeResponse(429, {'Retry-After': '0'}), FakeResponse(200)))
+    assert len(sleeps) == 3
+    assert all(4 <= delay <= 8 for delay in sleeps)
+    s = AdaptiveScheduler(backoff_factor=0.01, max_retries=1)
+    del sleeps[:]
+    s.send('GET', replies(FakeResponse(429, {'Retry-After': '0.3'}), FakeResponse(200)))
+    assert sleeps == [pytest.approx(0.3, abs=0.01)]
+
+
+def test_last_throttled_response_is_returned_after_max_retries(sleeps):
+    s = AdaptiveScheduler(max_retries=2)
+    resp = s.send('GET', replies(FakeResponse(429), FakeResponse(429), FakeResponse(429)))
+    assert resp.status_code == 429
+    assert len(sleeps) == 2
+
+
+def test_post_is_not_retried(sleeps):
+    s = AdaptiveScheduler()
+    assert s.send('POST', replies(FakeResponse(503))).status_code == 503
+    with pytest.raises(requests.exceptions.ConnectionError):
+        s.send('POST', replies(requests.exceptions.ConnectionError()))
+    assert sleeps == [] and s.retries == 0
+
+
+def test_connection_errors_of_idempotent_requests_are_retried(sleeps):
+    s = AdaptiveScheduler(max_retries=2)
+    assert s.send('GET', replies(requests.exceptions.ConnectionError(), FakeResponse(200))).status_code == 200
+    with pytest.raises(requests.exceptions.Timeout):
+        s.send('PUT', replies(*[requests.exceptions.Timeout()] * 3))
+    assert s.retries == 3
+
+
+def test_body_that_cannot_be_resent_is_not_retried(sleeps):
+    s = AdaptiveScheduler()
+    assert s.send('PUT', replies(FakeResponse(429)), can_retry=lambda: False).status_code == 429
+    assert sleeps == []
+
+
+def test_throttling_halves_the_limit_and_success_grows_it(sleeps):
+    s = AdaptiveScheduler(initial_limit=16, min_limit=2, max_limit=17, latency_target=10)
+    s.send('GET', replies(FakeResponse(429), FakeResponse(200)))
+    assert s.limit == 8
+    for _ in range(200):
+        s.send('GET', replies(FakeResponse(200)))
+    assert s.limit == 17
+    assert s.in_flight == 0 and s.queue_depth == 0
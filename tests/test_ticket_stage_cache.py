@@ -0,0 +1,118 @@
+import pytest
+import requests
+from security_manager_apis.ticket_stage_cache import StagedTicketMixin, TicketHandle, get_stage_ids
+
+
+def ticket_json(ticket_id, stage):
+    return {'id': ticket_id, 'status': f'Stage {stage}',
+            'workflowPacketTasks': [{'id': 100 + n, 'workflowTask': {'id': n, 'name': f'Stage {n}'}, **({'completed': True} if n < stage else {})}
+                                    for n in range(1, stage + 1)]}
+
+
+class Client(StagedTicketMixin):
+    """ Client whose tickets are in the stage given by stages, counting the reads """
+
+    def __init__(self):
+        self.init_ticket_stages()
+        self.stages = {}
+        self.pulls = 0
+
+    def _pull_ticket(self, ticket_id: str) -> dict:
+        self.pulls += 1
+        ticket = ticket_json(ticket_id, self.stages[ticket_id])
+        self._remember_stage(ticket_id, ticket)
+        return ticket
+
+    def send(self, ticket_id, ticket=None, status_code=409):
+        """ Request that the server rejects with status_code unless the IDs of the current stage are sent """
+        sent = []
+
+        def send(workflow_task_id, workflow_packet_task_id):
+            sent.append((workflow_task_id, workflow_packet_task_id))
+            if workflow_task_id != str(self.stages[ticket_id]):
+                resp = requests.Response()
+                resp.status_code = status_code
+                raise requests.exceptions.HTTPError(f'{status_code} Error', response=resp)
+            return 'ok'
+
+        return self._staged_request(ticket_id, ticket, send), sent
+
+
+def test_get_stage_ids_picks_the_open_task():
+    assert get_stage_ids(ticket_json('7', 3)) == ('3', '103')
+
+
+def test_stage_is_read_once_and_then_cached():
+    client = Client()
+    client.stages['7'] = 1
+    assert client.send('7')[0] == 'ok'
+    assert client.send('7')[0] == 'ok'
+    assert client.pulls == 1
+    assert (client.workflow_task_id, client.workflow_packet_task_id) == ('1', '101')
+
+
+@pytest.mark.parametrize('status_code', [400, 404, 409])
+def test_stale_stage_is_read_again_and_retried_once(status_code):
+    client = Client()
+    client.stages['7'] = 1
+    client.send('7')
+    client.stages['7'] = 2
+    result, sent = client.send('7', status_code=status_code)
+    assert result == 'ok'
+    assert sent == [('1', '101'), ('2', '102')]
+    assert client.pulls == 2
+    assert client.stage_cache.get('7') == ('2', '102')
+
+
+def test_other_errors_are_not_retried():
+    client = Client()
+    client.stages['7'] = 1
+    client.send('7')
+    client.stages['7'] = 2
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.send('7', status_code=500)
+    assert client.pulls == 1
+
+
+def test_ids_just_read_are_not_retried():
+    client = Client()
+    client.stages['7'] = 1
+    sent = []
+
+    def reject(*stage_ids):
+        sent.append(stage_ids)
+        resp = requests.Response()
+        resp.status_code = 409
+        raise requests.exceptions.HTTPError('409 Error', response=resp)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        client._staged_request('7', None, reject)
+    assert sent == [('1', '101')]
+    assert client.pulls == 1
+
+
+def test_stale_handle_is_retried_with_a_fresh_read():
+    client = Client()
+    client.stages['7'] = 2
+    handle = TicketHandle('7', '1', '101')
+    result, sent = client.send('7', ticket=handle)
+    assert result == 'ok'
+    assert sent == [('1', '101'), ('2', '102')]
+    assert client.pulls == 1
+
+
+def test_ticket_json_fills_the_cache():
+    client = Client()
+    client.stages['7'] = 3
+    client.send('7', ticket=ticket_json('7', 3))
+    assert client.pulls == 0
+    assert client.stage_cache.get('7') == ('3', '103')
+
+
+def test_mixin_requires_pull_ticket():
+
+    class Incomplete(StagedTicketMixin):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
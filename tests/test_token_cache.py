@@ -0,0 +1,73 @@
+import json
+import os
+import stat
+import sys
+import threading
+import pytest
+from authenticate_user.token_cache import FileTokenCache, MemoryTokenCache
+
+
+def test_memory_cache_expiry_and_token_matched_delete():
+    cache = MemoryTokenCache(max_age=0)
+    cache.set('https://fm', 'admin', 'a')
+    assert cache.get('https://fm', 'admin') is None
+    cache = MemoryTokenCache()
+    cache.set('https://fm', 'admin', 'a')
+    cache.delete('https://fm', 'admin', token='b')
+    assert cache.get('https://fm', 'admin') == 'a'
+    cache.delete('https://fm', 'admin', token='a')
+    assert cache.get('https://fm', 'admin') is None
+
+
+def test_file_cache_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / 'tokens.json')
+    FileTokenCache(path).set('https://fm', 'admin', 'a')
+    assert FileTokenCache(path).get('https://fm', 'admin') == 'a'
+    with open(path) as f:
+        assert json.load(f)['admin@https://fm']['token'] == 'a'
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='POSIX permissions')
+def test_file_cache_is_private(tmp_path):
+    path = str(tmp_path / 'tokens.json')
+    FileTokenCache(path).set('https://fm', 'admin', 'a')
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+def test_concurrent_writers_do_not_lose_updates(tmp_path):
+    # Each thread has its own cache object, as separate processes would, so only the file lock serializes them
+    path = str(tmp_path / 'tokens.json')
+    barrier = threading.Barrier(8)
+
+    def write(n):
+        cache = FileTokenCache(path)
+        barrier.wait()
+        for i in range(20):
+            cache.set('https://fm', f'user{n}-{i}', f'token{n}-{i}')
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    cache = FileTokenCache(path)
+    assert all(cache.get('https://fm', f'user{n}-{i}') == f'token{n}-{i}' for n in range(8) for i in range(20))
+
+
+def test_file_cache_delete_only_drops_the_given_token(tmp_path):
+    path = str(tmp_path / 'tokens.json')
+    cache = FileTokenCache(path)
+    cache.set('https://fm', 'admin', 'new')
+    FileTokenCache(path).delete('https://fm', 'admin', token='old')
+    assert cache.get('https://fm', 'admin') == 'new'
+    FileTokenCache(path).delete('https://fm', 'admin')
+    assert cache.get('https://fm', 'admin') is None
+
+
+def test_corrupt_file_is_treated_as_empty(tmp_path):
+    path = tmp_path / 'tokens.json'
+    path.write_text('{not json')
+    cache = FileTokenCache(str(path))
+    assert cache.get('https://fm', 'admin') is None
+    cache.set('https://fm', 'admin', 'a')
+    assert cache.get('https://fm', 'admin') == 'a'
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+import pytest
+from security_manager_apis import workflow_cache
+from security_manager_apis.workflow_cache import WorkflowCache
+
+HOST = 'https://fm'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(workflow_cache.time, 'time', lambda: now[0])
+    return now
+
+
+class Loader:
+
+    def __init__(self, workflows=None, delay=0.0):
+        self.workflows = workflows or {'Access Request': 2, 'Rule Review': 5}
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        return self.workflows
+
+    async def load_async(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.workflows
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = WorkflowCache(ttl=60)
+    cache.update(HOST, 'policyplanner', '1', {'Access Request': 2})
+    clock[0] += 59.9
+    assert cache.get(HOST, 'policyplanner', '1', 'Access Request') == 2
+    clock[0] += 0.1
+    assert cache.get(HOST, 'policyplanner', '1', 'Access Request') is None
+
+
+def test_resolve_loads_once_per_ttl(clock):
+    cache = WorkflowCache(ttl=60)
+    load = Loader()
+    assert cache.resolve(HOST, 'policyplanner', '1', 'Access Request', load) == 2
+    assert cache.resolve(HOST, 'policyplanner', '1', 'Rule Review', load) == 5
+    assert load.calls == 1
+    clock[0] += 60
+    assert cache.resolve(HOST, 'policyplanner', '1', 'Access Request', load) == 2
+    assert load.calls == 2
+
+
+def test_unknown_workflow_resolves_to_none():
+    cache = WorkflowCache()
+    assert cache.resolve(HOST, 'policyplanner', '1', 'Missing', Loader()) is None
+
+
+def test_entries_are_kept_per_product_and_domain():
+    cache = WorkflowCache()
+    cache.update(HOST, 'policyplanner', '1', {'A': 1})
+    cache.update(HOST, 'policyoptimizer', '1', {'A': 2})
+    cache.update(HOST, 'policyplanner', '2', {'A': 3})
+    assert [cache.get(HOST, p, d, 'A') for p, d in [('policyplanner', '1'), ('policyoptimizer', '1'), ('policyplanner', '2')]] == [1, 2, 3]
+    cache.invalidate(HOST, 'policyplanner', '1')
+    assert cache.get(HOST, 'policyplanner', '1', 'A') is None
+    assert cache.get(HOST, 'policyoptimizer', '1', 'A') == 2
+    cache.invalidate()
+    assert cache.get(HOST, 'policyoptimizer', '1', 'A') is None
+
+
+def test_cache_file_keeps_its_ttl(tmp_path, clock):
+    path = str(tmp_path / 'workflows.json')
+    WorkflowCache(ttl=60, path=path).update(HOST, 'policyplanner', '1', {'A': 1})
+    assert WorkflowCache(ttl=60, path=path).get(HOST, 'policyplanner', '1', 'A') == 1
+    clock[0] += 60
+    assert WorkflowCache(ttl=60, path=path).get(HOST, 'policyplanner', '1', 'A') is None
+
+
+def test_concurrent_first_resolves_load_once():
+    cache = WorkflowCache()
+    load = Loader(delay=0.1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.resolve(HOST, 'policyplanner', '1', 'Access Request', load)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [2] * 8
+    assert load.calls == 1
+
+
+def test_concurrent_async_resolves_load_once():
+    cache = WorkflowCache()
+    load = Loader(delay=0.05)
+
+    async def main():
+        return await asyncio.gather(*[cache.resolve_async(HOST, 'policyplanner', '1', 'Access Request', load.load_async) for _ in range(8)])
+
+    assert asyncio.run(main()) == [2] * 8
+    assert load.calls == 1
+    # A later event loop gets its own lock and still reads the cache
+    assert asyncio.run(cache.resolve_async(HOST, 'policyplanner', '1', 'Rule Review', load.load_async)) == 5
+    assert load.calls == 1